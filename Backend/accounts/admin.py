@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from .authentication import invalidate_user
 from .models import User, PatientProfile, ProviderProfile, AuditLog
+from .revocation import get_store
 
 
 @admin.register(User)
@@ -9,6 +11,7 @@ class UserAdmin(BaseUserAdmin):
     list_filter = ['role', 'is_active', 'is_staff']
     search_fields = ['email', 'first_name', 'last_name']
     ordering = ['-created_at']
+    actions = ['revoke_sessions']
     
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -24,6 +27,14 @@ class UserAdmin(BaseUserAdmin):
             'fields': ('email', 'password1', 'password2', 'first_name', 'last_name', 'role'),
         }),
     )
+    
+    def revoke_sessions(self, request, queryset):
+        user_ids = list(queryset.values_list('id', flat=True))
+        for user_id in user_ids:
+            get_store().revoke_user(user_id)
+            invalidate_user(user_id, changed=True)
+        self.message_user(request, f'Revoked all sessions for {len(user_ids)} users.')
+    revoke_sessions.short_description = 'Revoke all sessions (sign out everywhere)'
 
 
 @admin.register(PatientProfile)
@@ -44,4 +55,6 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_display = ['user', 'action', 'resource', 'timestamp', 'ip_address']
     list_filter = ['action', 'timestamp']
     search_fields = ['user__email', 'resource']
+    list_select_related = ['user']
+    show_full_result_count = False  # Avoid a COUNT(*) over the whole log per page
     readonly_fields = ['user', 'action', 'resource', 'resource_id', 'ip_address', 'user_agent', 'details', 'timestamp']
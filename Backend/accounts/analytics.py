@@ -0,0 +1,228 @@
+"""
+Cohort analytics for a provider's whole patient panel.
+
+panel_columns() pulls a columnar projection of the panel's WellnessGoal rows
+in a date range - user, date, goal_type, current_value, target_value and
+is_completed - with one query (straight from pymongo on MongoDB) and turns
+each column into a NumPy array.
+cohort_analytics() aggregates those arrays with bincount, percentile and
+histogram calls rather than loops over rows:
+
+- completion rates by goal type, overall and week by week (7-day buckets
+  ending on the end date) with the change from the week before
+- each patient's adherence (share of their goals completed), its
+  percentiles and its distribution over the panel
+- percentiles of progress (current_value / target_value) by goal type
+
+Fetching the rows costs far more than aggregating them - seconds for a panel
+with a million goals - so results are kept in the 'analytics' cache per
+provider and range (see provider_analytics). The precompute_provider_analytics
+command fills that cache ahead of requests for every provider's default range;
+it needs a cache shared with the web workers (ANALYTICS_CACHE_BACKEND).
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.core.cache import caches
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from core.mongo import get_collection, mongo_date
+from wellness.models import WellnessGoal
+from .models import PatientProfile
+
+GOAL_TYPES = [goal_type for goal_type, _ in WellnessGoal.GOAL_TYPE_CHOICES]
+COLUMNS = ['user_id', 'date', 'goal_type', 'current_value', 'target_value', 'is_completed']
+PERCENTILES = [10, 25, 50, 75, 90]
+DEFAULT_DAYS = 90
+HISTOGRAM_BINS = 10
+
+
+def get_cache():
+    return caches['analytics']
+
+
+def _goal_rows(user_ids, start, end):
+    """(user, date, goal_type, current_value, target_value, is_completed) tuples of the panel's goals"""
+    collection = get_collection(WellnessGoal)
+    if collection is not None:
+        # Straight from pymongo: hydrating a million rows through the ORM costs seconds
+        documents = collection.find(
+            {'user_id': {'$in': user_ids}, 'date': {'$gte': mongo_date(start), '$lte': mongo_date(end)}},
+            {'_id': 0, **{column: 1 for column in COLUMNS}},
+            batch_size=10000,
+        )
+        return [tuple(document.get(column) for column in COLUMNS) for document in documents]
+    # Dates as text skip the driver's and Django's per-row date parsing
+    return list(WellnessGoal.objects.filter(
+        user_id__in=user_ids, date__gte=start, date__lte=end
+    ).order_by().annotate(day=Cast('date', CharField())).values_list(
+        'user_id', 'day', 'goal_type', 'current_value', 'target_value', 'is_completed'
+    ))
+
+
+def _day(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+def panel_columns(user_ids, start, end):
+    """The panel's goals from start to end as arrays, one per column, with days counted back from `end`"""
+    rows = _goal_rows(list(user_ids), start, end)
+    count = len(rows)
+    users, dates, goal_types, current, target, completed = zip(*rows) if rows else ((),) * len(COLUMNS)
+    # A range holds few distinct dates and goal types, so map them through dicts
+    days = {value: (end - _day(value)).days for value in set(dates)}
+    codes = defaultdict(lambda: GOAL_TYPES.index('custom'), {goal_type: code for code, goal_type in enumerate(GOAL_TYPES)})
+    return {
+        'user': np.fromiter(users, dtype=np.int64, count=count),
+        'day': np.fromiter(map(days.__getitem__, dates), dtype=np.int64, count=count),
+        'goal_type': np.fromiter(map(codes.__getitem__, goal_types), dtype=np.int64, count=count),
+        'current': np.fromiter((value or 0 for value in current), dtype=np.float64, count=count),
+        'target': np.fromiter((value or 0 for value in target), dtype=np.float64, count=count),
+        'completed': np.fromiter(map(bool, completed), dtype=np.bool_, count=count),
+    }
+
+
+def _rate(completed, total):
+    return round(float(completed / total), 4) if total else None
+
+
+def _change(rate, previous):
+    return round(rate - previous, 4) if rate is not None and previous is not None else None
+
+
+def _percentiles(values):
+    if not len(values):
+        return None
+    return {f'p{p}': round(float(value), 4) for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def cohort_analytics(user_ids, start, end, columns=None):
+    """Analytics for the patients `user_ids` over start..end (inclusive)"""
+    panel = np.unique(np.fromiter(user_ids, dtype=np.int64))
+    columns = panel_columns(panel.tolist(), start, end) if columns is None else columns
+    types = len(GOAL_TYPES)
+    weeks = (end - start).days // 7 + 1
+
+    patient = np.searchsorted(panel, columns['user'])
+    goal_type = columns['goal_type']
+    completed = columns['completed'].astype(np.float64)
+
+    # Goals and completed goals by goal type, by (patient, type) and by (week, type)
+    by_type = np.bincount(goal_type, minlength=types)
+    done_by_type = np.bincount(goal_type, weights=completed, minlength=types)
+    pair = patient * types + goal_type
+    by_patient_type = np.bincount(pair, minlength=len(panel) * types).reshape(len(panel), types)
+    done_by_patient_type = np.bincount(pair, weights=completed, minlength=len(panel) * types).reshape(len(panel), types)
+    week = columns['day'] // 7 * types + goal_type
+    by_week = np.bincount(week, minlength=weeks * types).reshape(weeks, types)[::-1]
+    done_by_week = np.bincount(week, weights=completed, minlength=weeks * types).reshape(weeks, types)[::-1]
+
+    # Adherence: the share of a patient's goals they completed
+    goals_per_patient = by_patient_type.sum(axis=1)
+    active = goals_per_patient > 0
+    adherence = done_by_patient_type.sum(axis=1)[active] / goals_per_patient[active]
+    type_adherence = np.divide(
+        done_by_patient_type, by_patient_type,
+        out=np.full(by_patient_type.shape, np.nan), where=by_patient_type > 0
+    )
+    histogram, edges = np.histogram(adherence, bins=HISTOGRAM_BINS, range=(0, 1))
+
+    # Progress towards each goal's target
+    has_target = columns['target'] > 0
+    progress = columns['current'][has_target] / columns['target'][has_target]
+    progress_type = goal_type[has_target]
+
+    goal_types = []
+    for code in np.flatnonzero(by_type):
+        goal_types.append({
+            'goal_type': GOAL_TYPES[code],
+            'goals': int(by_type[code]),
+            'completed': int(done_by_type[code]),
+            'completion_rate': _rate(done_by_type[code], by_type[code]),
+            'patients': int((by_patient_type[:, code] > 0).sum()),
+            'adherence': _percentiles(type_adherence[:, code][by_patient_type[:, code] > 0]),
+            'progress': _percentiles(progress[progress_type == code]),
+        })
+
+    weekly = []
+    previous = None
+    for index in range(weeks):
+        week_end = end - timedelta(days=7 * (weeks - 1 - index))
+        rate = _rate(done_by_week[index].sum(), by_week[index].sum())
+        weekly.append({
+            'week_start': max(start, week_end - timedelta(days=6)),
+            'week_end': week_end,
+            'goals': int(by_week[index].sum()),
+            'completion_rate': rate,
+            'change': _change(rate, previous['completion_rate'] if previous else None),
+            'by_goal_type': {
+                GOAL_TYPES[code]: {
+                    'completion_rate': _rate(done_by_week[index, code], by_week[index, code]),
+                    'change': _change(
+                        _rate(done_by_week[index, code], by_week[index, code]),
+                        _rate(done_by_week[index - 1, code], by_week[index - 1, code]) if index else None,
+                    ),
+                }
+                for code in np.flatnonzero(by_type)
+            },
+        })
+        previous = weekly[-1]
+
+    return {
+        'start_date': start,
+        'end_date': end,
+        'patients': len(panel),
+        'active_patients': int(active.sum()),
+        'goals': int(by_type.sum()),
+        'completion_rate': _rate(done_by_type.sum(), by_type.sum()),
+        'by_goal_type': goal_types,
+        'adherence': {
+            'mean': round(float(adherence.mean()), 4) if len(adherence) else None,
+            'percentiles': _percentiles(adherence),
+            'histogram': [
+                {'from': round(float(low), 2), 'to': round(float(high), 2), 'patients': int(patients)}
+                for low, high, patients in zip(edges[:-1], edges[1:], histogram)
+            ],
+        },
+        'weekly': weekly,
+    }
+
+
+def default_range(end):
+    return end - timedelta(days=DEFAULT_DAYS - 1), end
+
+
+def _key(provider_id, start, end):
+    return f'analytics:{provider_id}:{start}:{end}'
+
+
+def _compute(provider_id, start, end):
+    user_ids = PatientProfile.objects.filter(assigned_provider_id=provider_id).values_list('user_id', flat=True)
+    return cohort_analytics(list(user_ids), start, end)
+
+
+def provider_analytics(provider, start, end):
+    """cohort_analytics() for the provider's assigned patients, through the cache"""
+    key = _key(provider.id, start, end)
+    result = get_cache().get(key)
+    if result is None:
+        result = _compute(provider.id, start, end)
+        get_cache().set(key, result)
+    return result
+
+
+def precompute(end):
+    """Cache every provider's analytics for the default range ending on `end`; returns how many"""
+    start, end = default_range(end)
+    providers = PatientProfile.objects.filter(assigned_provider__isnull=False).order_by().values_list(
+        'assigned_provider_id', flat=True
+    ).distinct()
+    count = 0
+    for provider_id in providers:
+        get_cache().set(_key(provider_id, start, end), _compute(provider_id, start, end))
+        count += 1
+    return count
@@ -0,0 +1,336 @@
+"""
+Asynchronous, batched writer for HIPAA audit events.
+
+log_action() hands events to the process-wide AuditWriter instead of
+inserting an AuditLog row inside the request. Each event is first appended to
+a local spool file (write-ahead), so it survives a crash. A background thread
+periodically, or once `batch_size` events are waiting, rotates the spool into
+a segment, bulk-inserts the segment's events and then deletes it. Segments
+left behind by a failed insert are retried on the next flush; those of a
+crashed process are taken over by the next writer to start or flush. Events
+the database rejects (or spool lines that cannot be read) are moved to the
+quarantine/ subdirectory so they do not hold up the events after them.
+
+Spooled events survive a crash of the process, but without AUDIT_SPOOL_FSYNC
+the last events written may still be in the OS page cache and are lost if the
+machine itself goes down.
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: liveness falls back to checking the pid
+    fcntl = None
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuditLog
+
+security_logger = logging.getLogger('security')
+logger = logging.getLogger(__name__)
+
+# Errors that mean an event will never be accepted, as opposed to the database
+# being unavailable
+REJECTED = (KeyError, TypeError, ValueError, IntegrityError, DataError)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    def __init__(self, spool_dir, batch_size=100, flush_interval=1.0, fsync=False):
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        # Files are named <prefix>.<kind>.jsonl with prefix <pid>-<token>. The
+        # writer holds a lock on <prefix>.lock while it runs, so others can tell
+        # its files from those of a dead writer even when the pid is reused
+        self.prefix = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._owner_lock = self._hold_lock()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self._spool = None
+        self._spooled = 0  # events in the current spool file
+        self.counters = {
+            'enqueued': 0, 'written': 0, 'dropped': 0, 'flushes': 0,
+            'flush_errors': 0, 'recovered': 0, 'quarantined': 0, 'last_flush_ms': 0.0,
+        }
+        self._claim_orphans()
+        self._open_spool()
+
+    # Spool files
+
+    def _path(self, kind):
+        return self.spool_dir / f'{self.prefix}.{kind}.jsonl'
+
+    def _open_spool(self):
+        self._spool = open(self._path('current'), 'a', encoding='utf-8')
+
+    def _segments(self):
+        return sorted(self.spool_dir.glob(f'{self.prefix}.segment-*.jsonl'))
+
+    def _hold_lock(self):
+        if fcntl is None:
+            return None
+        # Locked before it appears under its name, so no one sees it unlocked
+        pending = self.spool_dir / f'{self.prefix}.lock-pending'
+        handle = open(pending, 'w')
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        pending.rename(self.spool_dir / f'{self.prefix}.lock')
+        return handle
+
+    def _release_lock(self):
+        if self._owner_lock is not None:
+            (self.spool_dir / f'{self.prefix}.lock').unlink(missing_ok=True)
+            self._owner_lock.close()
+            self._owner_lock = None
+
+    def _lock_if_dead(self, prefix):
+        """
+        Lock the files of the writer `prefix` if it is no longer running;
+        returns the lock to release once they are claimed, or False
+        """
+        if fcntl is None:
+            pid = int(prefix.split('-', 1)[0])
+            return None if pid != os.getpid() and not _pid_alive(pid) else False
+        try:
+            handle = open(self.spool_dir / f'{prefix}.lock')
+        except FileNotFoundError:
+            return None  # Stopped, or claimed by another writer
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        return handle
+
+    def _claim_orphans(self):
+        """Take over spool files of writers that are no longer running"""
+        writers = {}
+        for path in self.spool_dir.iterdir():
+            prefix = path.name.split('.', 1)[0]
+            if prefix != self.prefix and prefix.split('-', 1)[0].isdigit():
+                writers.setdefault(prefix, []).append(path)
+        for prefix, paths in writers.items():
+            lock = self._lock_if_dead(prefix)
+            if lock is False:
+                continue
+            for path in sorted(paths):
+                if path.suffix != '.jsonl':
+                    continue
+                try:
+                    path.rename(self._path(f'segment-{next(self._sequence):08d}'))
+                    self.counters['recovered'] += 1
+                except FileNotFoundError:
+                    pass  # Claimed by another writer first
+            if lock is not None:
+                (self.spool_dir / f'{prefix}.lock').unlink(missing_ok=True)
+                lock.close()
+
+    def _rotate(self):
+        """Turn the current spool into a segment; caller holds self._lock"""
+        if not self._spooled:
+            return
+        self._spool.close()
+        self._path('current').rename(self._path(f'segment-{next(self._sequence):08d}'))
+        self._spooled = 0
+        self._open_spool()
+
+    # Producer side
+
+    def enqueue(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            try:
+                self._spool.write(line + '\n')
+                self._spool.flush()
+                if self.fsync:
+                    os.fsync(self._spool.fileno())
+            except OSError:
+                self.counters['dropped'] += 1
+                logger.exception('Could not spool audit event')
+                return
+            self._spooled += 1
+            self.counters['enqueued'] += 1
+            full = self._spooled >= self.batch_size
+        if full:
+            self._wake.set()
+
+    # Consumer side
+
+    def flush(self):
+        """Write every spooled event to the database"""
+        with self._flush_lock:
+            self._claim_orphans()
+            with self._lock:
+                self._rotate()
+            for segment in self._segments():
+                started = time.perf_counter()
+                lines = [line for line in segment.read_text(encoding='utf-8').splitlines() if line]
+                try:
+                    events, rejected = self._write(segment, lines)
+                except Exception:
+                    # The database is unavailable: keep the segment and retry on the next flush
+                    self.counters['flush_errors'] += 1
+                    logger.exception('Audit flush failed for %s', segment.name)
+                    break
+                self._quarantine(segment, rejected)
+                segment.unlink()
+                self._written(events)
+                self.counters['flushes'] += 1
+                self.counters['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _write(self, segment, lines):
+        """Insert the events of a segment; returns (events written, lines rejected)"""
+        try:
+            events = [json.loads(line) for line in lines]
+            self._insert([self._to_model(event) for event in events])
+            return events, []
+        except REJECTED:
+            pass  # Insert them one by one to find those at fault
+        events, rejected = [], []
+        for index, line in enumerate(lines):
+            try:
+                event = json.loads(line)
+                self._insert([self._to_model(event)])
+            except REJECTED:
+                rejected.append(line)
+                continue
+            except Exception:
+                # Leave only the events not written yet for the next flush
+                self._quarantine(segment, rejected)
+                self._written(events)
+                remaining = segment.with_suffix('.tmp')
+                remaining.write_text(''.join(f'{line}\n' for line in lines[index:]), encoding='utf-8')
+                remaining.replace(segment)
+                raise
+            events.append(event)
+        return events, rejected
+
+    def _insert(self, logs):
+        if connection.features.supports_transactions:
+            # All or nothing, so a rejected batch can be retried row by row
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(logs, batch_size=self.batch_size)
+        else:
+            AuditLog.objects.bulk_create(logs, batch_size=self.batch_size)
+
+    def _written(self, events):
+        for event in events:
+            security_logger.info(
+                f"User {event.get('user_email')} performed {event['action']} on "
+                f"{event.get('resource')}:{event.get('resource_id')}"
+            )
+        self.counters['written'] += len(events)
+
+    def _quarantine(self, segment, lines):
+        """Set aside events that will never be written, for someone to look at"""
+        if not lines:
+            return
+        quarantine = self.spool_dir / 'quarantine'
+        quarantine.mkdir(exist_ok=True)
+        with open(quarantine / segment.name, 'a', encoding='utf-8') as rejected:
+            rejected.writelines(f'{line}\n' for line in lines)
+        self.counters['quarantined'] += len(lines)
+        logger.error('Moved %d audit events of %s to quarantine', len(lines), segment.name)
+
+    @staticmethod
+    def _to_model(event):
+        timestamp = parse_datetime(event['timestamp']) if event.get('timestamp') else timezone.now()
+        return AuditLog(
+            user_id=event['user_id'],
+            action=event['action'],
+            resource=event.get('resource'),
+            resource_id=event.get('resource_id'),
+            ip_address=event.get('ip_address'),
+            user_agent=event.get('user_agent'),
+            details=event.get('details'),
+            timestamp=timestamp,
+        )
+
+    def stats(self):
+        with self._lock:
+            spooled = self._spooled
+        segments = self._segments()
+        return {
+            **self.counters,
+            'queue_depth': spooled + sum(
+                sum(1 for _ in open(path, encoding='utf-8')) for path in segments
+            ),
+            'pending_segments': len(segments),
+        }
+
+    # Lifecycle
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Audit writer flush failed')
+            finally:
+                close_old_connections()
+
+    def stop(self, timeout=10):
+        """Drain the spool and stop the background thread"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        # Anything left over is now free for another writer to take over
+        self._release_lock()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The process-wide writer, started on first use and drained at exit"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditWriter(
+                settings.AUDIT_SPOOL_DIR,
+                batch_size=settings.AUDIT_BATCH_SIZE,
+                flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+                fsync=settings.AUDIT_SPOOL_FSYNC,
+            ).start()
+            atexit.register(_writer.stop)
+        return _writer
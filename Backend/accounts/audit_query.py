@@ -0,0 +1,143 @@
+"""
+Audit log queries for compliance officers.
+
+Every query filters on indexed columns (see AuditLog.Meta.indexes) and walks
+the log newest first in (timestamp, id) order. Pages are addressed with an
+opaque keyset cursor - the position of the last row returned - so page 1000
+costs the same as page 1, and exports stream a range in fixed-size batches
+instead of loading it.
+"""
+import base64
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import AuditLog
+
+# Columns returned by the API and written to exports, in CSV column order
+FIELDS = [
+    'id', 'timestamp', 'user_id', 'user__email', 'action', 'resource',
+    'resource_id', 'ip_address', 'user_agent', 'details',
+]
+EXPORT_BATCH_SIZE = 1000
+
+
+def _parse_moment(value, end_of_day=False):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.utc)
+    return moment
+
+
+def filter_audit_logs(params):
+    """
+    AuditLog queryset for the user, action, resource, resource_id, since and
+    until query parameters. Raises ValueError with a message for bad input.
+    """
+    logs = AuditLog.objects.all()
+    if params.get('user'):
+        if not params['user'].isdigit():
+            raise ValueError('user must be a user id')
+        logs = logs.filter(user_id=int(params['user']))
+    if params.get('action'):
+        if params['action'] not in dict(AuditLog.ACTION_CHOICES):
+            raise ValueError(f"action must be one of {', '.join(dict(AuditLog.ACTION_CHOICES))}")
+        logs = logs.filter(action=params['action'])
+    if params.get('resource'):
+        logs = logs.filter(resource=params['resource'])
+    if params.get('resource_id'):
+        logs = logs.filter(resource_id=params['resource_id'])
+    try:
+        if params.get('since'):
+            logs = logs.filter(timestamp__gte=_parse_moment(params['since']))
+        if params.get('until'):
+            logs = logs.filter(timestamp__lte=_parse_moment(params['until'], end_of_day=True))
+    except ValueError:
+        raise ValueError('since and until must be ISO 8601 dates or datetimes')
+    return logs
+
+
+def encode_cursor(row):
+    position = json.dumps([row['timestamp'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp = parse_datetime(timestamp)
+        if timestamp is None:
+            raise ValueError
+        return timestamp, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def _after(logs, position):
+    """Rows that come after `position` in newest-first order"""
+    timestamp, row_id = position
+    return logs.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=row_id))
+
+
+def _row(values):
+    values['user_email'] = values.pop('user__email')
+    return values
+
+
+def audit_page(logs, cursor=None, page_size=100):
+    """One page of rows and the cursor of the next page (None on the last page)"""
+    logs = logs.order_by('-timestamp', '-id')
+    if cursor:
+        logs = _after(logs, decode_cursor(cursor))
+    rows = list(logs.values(*FIELDS)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(rows[-1]) if has_more else None
+    return [_row(row) for row in rows], next_cursor
+
+
+def iter_audit_rows(logs, batch_size=None):
+    """Every row of `logs`, newest first, fetched in keyset batches"""
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    logs = logs.order_by('-timestamp', '-id')
+    position = None
+    while True:
+        batch = list((logs if position is None else _after(logs, position)).values(*FIELDS)[:batch_size])
+        for row in batch:
+            yield _row(row)
+        if len(batch) < batch_size:
+            return
+        position = (batch[-1]['timestamp'], batch[-1]['id'])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    columns = ['user_email' if field == 'user__email' else field for field in FIELDS]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        if row['details'] is not None:
+            row['details'] = json.dumps(row['details'], cls=DjangoJSONEncoder)
+        yield writer.writerow([row[column] for column in columns])
@@ -0,0 +1,197 @@
+"""
+JWT authentication that avoids a User lookup on every request.
+
+simplejwt's JWTAuthentication loads the User for each request, and the
+dashboard fires several requests per page. CachedJWTAuthentication keeps
+resolved users in the 'auth' cache (see CACHES) for AUTH_USER_CACHE_TTL
+seconds. accounts.signals drops a user's entry whenever the User is saved or
+deleted - which covers password, role and activation changes - and LogoutView
+drops it on logout. That only reaches the cache of the process making the
+change: with the default in-process cache, other processes keep serving the
+old user (even a deactivated one) until their entry expires, at most
+AUTH_USER_CACHE_TTL seconds later.
+
+Tokens also carry the user's email, role and name (see token_for_user). When
+AUTH_TRUST_TOKEN_CLAIMS is on, views with `trust_token_claims = True` get a
+User built from those claims for safe requests, with no database or cache
+read - unless the user changed after the token was issued. Changes are marked
+in the 'auth' cache for the refresh token lifetime, so claims are only trusted
+when that cache is shared by every process (AUTH_CACHE_BACKEND set to Redis,
+the database or files); with an in-process cache the setting is ignored.
+
+Tokens revoked through accounts.revocation are rejected before either path.
+authenticate_async() is the same for async views. It checks revocations in
+memory, re-reading the revocation file on a thread at most every
+REVOCATION_SYNC_SECONDS, so only that and a user cache miss leave the event
+loop (the 'auth' cache itself is read on the loop).
+"""
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import get_store
+
+logger = logging.getLogger(__name__)
+
+CLAIM_FIELDS = ['email', 'role', 'first_name', 'last_name']
+# How stale the async path's view of the revocation file may get
+REVOCATION_SYNC_SECONDS = 1.0
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+_warned_local_cache = False
+
+
+def get_cache():
+    return caches['auth']
+
+
+def claims_trusted():
+    """AUTH_TRUST_TOKEN_CLAIMS, as long as every process sees the changes marked by invalidate_user()"""
+    global _warned_local_cache
+    if not settings.AUTH_TRUST_TOKEN_CLAIMS:
+        return False
+    if isinstance(get_cache(), PROCESS_LOCAL_CACHES):
+        if not _warned_local_cache:
+            _warned_local_cache = True
+            logger.warning('AUTH_TRUST_TOKEN_CLAIMS is ignored: the auth cache is not shared between processes')
+        return False
+    return True
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def _changed_key(user_id):
+    return f'auth:changed:{user_id}'
+
+
+def token_for_user(user):
+    """A refresh token (and, through it, access tokens) carrying CLAIM_FIELDS"""
+    token = RefreshToken.for_user(user)
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    return token
+
+
+def invalidate_user(user_id, changed=False):
+    """
+    Drop the cached user. With `changed`, claims in tokens issued before now
+    are no longer trusted; access tokens refreshed later copy the claims of
+    the original refresh token, so this lasts for the refresh token lifetime.
+    """
+    cache = get_cache()
+    cache.delete(_user_key(user_id))
+    if changed:
+        timeout = int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+        cache.set(_changed_key(user_id), int(time.time()), timeout=timeout)
+
+
+def _synced_store():
+    store = get_store()
+    store.sync()
+    return store
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if self.trusts_claims(request):
+            user = self.get_user_from_claims(validated_token)
+            if user is not None:
+                return user, validated_token
+        return self.get_user(validated_token), validated_token
+
+    async def authenticate_async(self, request, trust_claims=False):
+        """authenticate() for async views, which set trust_claims instead of trust_token_claims"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = super().get_validated_token(raw_token)
+        store = get_store(load=False)
+        if store is None or store.stale(REVOCATION_SYNC_SECONDS):
+            store = await sync_to_async(_synced_store, thread_sensitive=False)()
+        if store.revoked_in_memory(validated_token):
+            raise InvalidToken(_('Token has been revoked'))
+        if trust_claims and request.method in SAFE_METHODS and claims_trusted():
+            user = self.get_user_from_claims(validated_token)
+            if user is not None:
+                return user, validated_token
+        user = get_cache().get(_user_key(validated_token.get(api_settings.USER_ID_CLAIM)))
+        if user is None:
+            user = await sync_to_async(self._load_user, thread_sensitive=False)(validated_token)
+        return user, validated_token
+
+    def _load_user(self, validated_token):
+        try:
+            return self.get_user(validated_token)
+        finally:
+            close_old_connections()
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if get_store().is_revoked(validated_token):
+            raise InvalidToken(_('Token has been revoked'))
+        return validated_token
+
+    @staticmethod
+    def trusts_claims(request):
+        if request.method not in SAFE_METHODS or not claims_trusted():
+            return False
+        view = request.parser_context.get('view') if request.parser_context else None
+        return getattr(view, 'trust_token_claims', False)
+
+    def get_user_from_claims(self, validated_token):
+        """An unsaved User built from the token, or None if it cannot be trusted"""
+        claims = {field: validated_token.get(field) for field in CLAIM_FIELDS}
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or claims['email'] is None or claims['role'] is None:
+            return None
+        changed_at = get_cache().get(_changed_key(user_id))
+        if changed_at is not None and validated_token.get('iat', 0) <= changed_at:
+            return None
+
+        user = get_user_model()(**{api_settings.USER_ID_FIELD: user_id}, is_active=True, **claims)
+        user._state.adding = False
+        user.from_token_claims = True
+        return user
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        cache = get_cache()
+        user = cache.get(_user_key(user_id))
+        if user is None:
+            # Raises for unknown and inactive users, so only active users are cached
+            user = super().get_user(validated_token)
+            cache.set(_user_key(user_id), user)
+        return user
@@ -0,0 +1,297 @@
+"""
+Export of everything stored about a patient (HIPAA right of access).
+
+export_sections() describes the export as sections - the user, their
+PatientProfile, wellness goals, goal logs and preventive-care reminders -
+whose rows are read lazily in keyset batches of EXPORT_BATCH_SIZE, so a
+response streams at flat memory however many log rows a patient has. Goal
+logs are read goal by goal along goallog_goal_time_idx. The encoders turn
+the sections into NDJSON lines, a ZIP of one CSV per section written as it
+streams, or a FHIR-like Bundle of Patient, Observation, Goal and Appointment
+resources.
+"""
+import csv
+import io
+import json
+import zipfile
+from datetime import date, datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from core.pagination import keyset_after
+from wellness.models import WellnessGoal, DailyGoalLog, PreventiveCareReminder
+from .audit_query import EXPORT_BATCH_SIZE
+from .models import User, PatientProfile
+
+USER_FIELDS = [
+    'id', 'email', 'first_name', 'last_name', 'role', 'phone', 'date_of_birth', 'address',
+    'emergency_contact', 'emergency_phone', 'data_consent', 'consent_date', 'created_at', 'updated_at',
+]
+PROFILE_FIELDS = [
+    'id', 'blood_type', 'height', 'weight', 'allergies', 'current_medications', 'medical_conditions',
+    'assigned_provider_id', 'created_at', 'updated_at',
+]
+GOAL_FIELDS = [
+    'id', 'goal_type', 'title', 'target_value', 'current_value', 'unit', 'date', 'is_completed',
+    'is_recurring', 'extra_data', 'created_at', 'updated_at',
+]
+GOAL_LOG_FIELDS = ['id', 'goal_id', 'value', 'notes', 'logged_at']
+REMINDER_FIELDS = [
+    'id', 'reminder_type', 'title', 'description', 'scheduled_date', 'scheduled_time', 'status',
+    'location', 'notes', 'is_recurring', 'recurrence_interval', 'recurrence_of', 'notified_at',
+    'created_at', 'updated_at',
+]
+CHUNK_SIZE = 64 * 1024  # Bytes handed to the response at a time
+
+
+def iter_rows(queryset, ordering, fields, batch_size=None):
+    """Every row of `queryset` in `ordering`, fetched in keyset batches"""
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    queryset = queryset.order_by(*ordering)
+    columns = [name.lstrip('-') for name in ordering]
+    position = None
+    while True:
+        page = queryset if position is None else keyset_after(queryset, ordering, position)
+        batch = list(page.values(*fields)[:batch_size])
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        position = [batch[-1][column] for column in columns]
+
+
+def _goal_logs(goals):
+    for goal in iter_rows(goals, ['id'], ['id']):
+        yield from iter_rows(DailyGoalLog.objects.filter(goal_id=goal['id']), ['logged_at', 'id'], GOAL_LOG_FIELDS)
+
+
+def export_sections(user):
+    """(name, fields, rows) for each part of the export; rows are read as they are iterated"""
+    goals = WellnessGoal.objects.filter(user=user)
+    return [
+        ('user', USER_FIELDS, iter_rows(User.objects.filter(pk=user.pk), ['id'], USER_FIELDS)),
+        ('patient_profile', PROFILE_FIELDS,
+         iter_rows(PatientProfile.objects.filter(user=user), ['id'], PROFILE_FIELDS)),
+        ('wellness_goals', GOAL_FIELDS, iter_rows(goals, ['id'], GOAL_FIELDS)),
+        ('goal_logs', GOAL_LOG_FIELDS, _goal_logs(goals)),
+        ('reminders', REMINDER_FIELDS,
+         iter_rows(PreventiveCareReminder.objects.filter(user=user), ['id'], REMINDER_FIELDS)),
+    ]
+
+
+def _chunked(pieces):
+    """Join small strings into chunks of about CHUNK_SIZE"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# NDJSON
+
+def _ndjson_lines(sections):
+    for name, _, rows in sections:
+        for row in rows:
+            yield json.dumps({'record': name, **row}, cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export_ndjson(sections):
+    """One line per row, its section under "record" """
+    return _chunked(_ndjson_lines(sections))
+
+
+# CSV in a ZIP
+
+class _ZipStream(io.RawIOBase):
+    """Unseekable sink for zipfile that collects what it writes until taken"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def iter_export_zip(sections):
+    """A ZIP holding <section>.csv for each section, yielded in chunks as it is written"""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, fields, rows in sections:
+            with archive.open(f'{name}.csv', 'w', force_zip64=True) as entry, \
+                    io.TextIOWrapper(entry, encoding='utf-8', newline='') as text:
+                writer = csv.writer(text)
+                writer.writerow(fields)
+                for row in rows:
+                    writer.writerow([_csv_value(row[field]) for field in fields])
+                    if stream.size >= CHUNK_SIZE:
+                        yield stream.take()
+    yield stream.take()
+
+
+# FHIR-like bundle
+
+APPOINTMENT_STATUS = {'upcoming': 'booked', 'completed': 'fulfilled', 'missed': 'noshow', 'rescheduled': 'proposed'}
+
+
+def _compact(resource):
+    return {key: value for key, value in resource.items() if value not in (None, '', [])}
+
+
+def _patient(row):
+    telecom = [{'system': 'email', 'value': row['email']}]
+    if row['phone']:
+        telecom.append({'system': 'phone', 'value': row['phone']})
+    contact = []
+    if row['emergency_contact'] or row['emergency_phone']:
+        contact.append(_compact({
+            'name': {'text': row['emergency_contact']} if row['emergency_contact'] else None,
+            'telecom': [{'system': 'phone', 'value': row['emergency_phone']}] if row['emergency_phone'] else None,
+        }))
+    return _compact({
+        'resourceType': 'Patient',
+        'id': str(row['id']),
+        'name': [_compact({'family': row['last_name'], 'given': [row['first_name']] if row['first_name'] else None})],
+        'telecom': telecom,
+        'birthDate': row['date_of_birth'],
+        'address': [{'text': row['address']}] if row['address'] else None,
+        'contact': contact,
+    })
+
+
+def _profile_resources(row, subject):
+    measurements = [('height', 'Body height', 'cm'), ('weight', 'Body weight', 'kg')]
+    for field, text, unit in measurements:
+        if row[field] is not None:
+            yield {
+                'resourceType': 'Observation', 'id': f'profile-{field}', 'status': 'final',
+                'code': {'text': text}, 'subject': subject,
+                'valueQuantity': {'value': float(row[field]), 'unit': unit},
+            }
+    if row['blood_type']:
+        yield {
+            'resourceType': 'Observation', 'id': 'profile-blood-type', 'status': 'final',
+            'code': {'text': 'Blood type'}, 'subject': subject, 'valueString': row['blood_type'],
+        }
+    texts = [
+        ('allergies', 'AllergyIntolerance', 'patient'),
+        ('current_medications', 'MedicationStatement', 'subject'),
+        ('medical_conditions', 'Condition', 'subject'),
+    ]
+    for field, resource_type, reference in texts:
+        if row[field]:
+            yield {
+                'resourceType': resource_type, 'id': f"profile-{field.replace('_', '-')}",
+                'code': {'text': row[field]}, reference: subject,
+            }
+
+
+def _goal(row, subject):
+    return _compact({
+        'resourceType': 'Goal',
+        'id': f"goal-{row['id']}",
+        'lifecycleStatus': 'completed' if row['is_completed'] else 'active',
+        'description': {'text': row['title']},
+        'subject': subject,
+        'startDate': row['date'],
+        'target': [{
+            'measure': {'text': row['goal_type']},
+            'detailQuantity': _compact({'value': row['target_value'], 'unit': row['unit']}),
+        }],
+    })
+
+
+def _goal_log(row, subject):
+    return _compact({
+        'resourceType': 'Observation',
+        'id': f"log-{row['id']}",
+        'status': 'final',
+        'code': {'text': 'Goal progress'},
+        'subject': subject,
+        'focus': [{'reference': f"Goal/goal-{row['goal_id']}"}],
+        'effectiveDateTime': row['logged_at'],
+        'valueQuantity': {'value': row['value']},
+        'note': [{'text': row['notes']}] if row['notes'] else None,
+    })
+
+
+def _appointment(row, subject):
+    if row['scheduled_time'] is not None:
+        start = timezone.make_aware(datetime.combine(row['scheduled_date'], row['scheduled_time']))
+    else:
+        start = row['scheduled_date']
+    participants = [{'actor': subject, 'status': 'accepted'}]
+    if row['location']:
+        participants.append({'actor': {'display': row['location']}, 'status': 'accepted'})
+    return _compact({
+        'resourceType': 'Appointment',
+        'id': f"reminder-{row['id']}",
+        'status': APPOINTMENT_STATUS.get(row['status'], 'proposed'),
+        'serviceType': [{'text': row['reminder_type']}],
+        'description': row['title'],
+        'comment': row['description'] or row['notes'],
+        'start': start,
+        'participant': participants,
+    })
+
+
+def _resources(sections):
+    subject = None
+    for name, _, rows in sections:
+        for row in rows:
+            if name == 'user':
+                subject = {'reference': f"Patient/{row['id']}"}
+                yield _patient(row)
+            elif name == 'patient_profile':
+                yield from _profile_resources(row, subject)
+            elif name == 'wellness_goals':
+                yield _goal(row, subject)
+            elif name == 'goal_logs':
+                yield _goal_log(row, subject)
+            elif name == 'reminders':
+                yield _appointment(row, subject)
+
+
+def _bundle_pieces(sections):
+    opening = {'resourceType': 'Bundle', 'type': 'collection', 'timestamp': timezone.now()}
+    yield json.dumps(opening, cls=DjangoJSONEncoder)[:-1] + ', "entry": ['
+    separator = ''
+    for resource in _resources(sections):
+        entry = {'fullUrl': f"{resource['resourceType']}/{resource['id']}", 'resource': resource}
+        yield separator + json.dumps(entry, cls=DjangoJSONEncoder)
+        separator = ','
+    yield ']}'
+
+
+def iter_export_fhir(sections):
+    """A Bundle of type collection, one entry per resource, written as it streams"""
+    return _chunked(_bundle_pieces(sections))
@@ -0,0 +1,162 @@
+"""
+Password hashing policy and the bounded pool that runs it.
+
+PASSWORD_HASHER picks the hasher used for new passwords (see PASSWORD_HASHERS
+in settings); its cost comes from settings, so it can be tuned per deployment
+with calibrate_password_hasher. Hashes made with another hasher or an older
+cost still verify and are upgraded the next time the user logs in.
+
+Hashing runs on a fixed pool of threads (hashlib releases the GIL while it
+works), so at most LOGIN_HASH_WORKERS hashes run at once and no more than
+LOGIN_HASH_QUEUE logins wait for one. Further logins are turned away with a
+429 instead of piling up on the web workers.
+
+The pool bounds concurrency only: the request thread still waits for its
+hash, so a login occupies a web worker for as long as before. That is
+deliberate - the login views are synchronous - and an async caller would
+need to await the pool's future instead of calling run().
+"""
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    BasePasswordHasher, PBKDF2PasswordHasher, check_password, get_hasher, identify_hasher, make_password,
+)
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import Throttled
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """Django's PBKDF2-SHA256 with the iteration count from PASSWORD_PBKDF2_ITERATIONS"""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """
+    scrypt via hashlib, in the format Django 4.0 uses for its own scrypt
+    hasher, with the cost from PASSWORD_SCRYPT_N / _R / _P.
+    """
+    algorithm = 'scrypt'
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_N
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_R
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_P
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and '$' not in salt
+        n, r, p = n or self.work_factor, r or self.block_size, p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+            maxmem=256 * n * r * p, dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash_ = encoded.split('$', 6)
+        assert algorithm == self.algorithm
+        return {
+            'algorithm': algorithm,
+            'work_factor': int(work_factor),
+            'salt': salt,
+            'block_size': int(block_size),
+            'parallelism': int(parallelism),
+            'hash': hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password, decoded['salt'], decoded['work_factor'], decoded['block_size'], decoded['parallelism']
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            'algorithm': decoded['algorithm'],
+            'work factor': decoded['work_factor'],
+            'block size': decoded['block_size'],
+            'parallelism': decoded['parallelism'],
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (decoded['work_factor'], decoded['block_size'], decoded['parallelism']) != (
+            self.work_factor, self.block_size, self.parallelism
+        )
+
+    def harden_runtime(self, password, encoded):
+        # The work factor is part of the hash, so a mismatch cannot be padded out
+        pass
+
+
+class HashingPool:
+
+    def __init__(self, workers, queue):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, func, *args):
+        """Run func(*args) on the pool and block until it is done; Throttled if the pool is saturated"""
+        if not self.slots.acquire(blocking=False):
+            raise Throttled(wait=1, detail='Too many logins in progress, please retry.')
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(settings.LOGIN_HASH_WORKERS, settings.LOGIN_HASH_QUEUE)
+        return _pool
+
+
+def needs_rehash(encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = get_hasher()
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(user, password):
+    """
+    check_password() on the hashing pool. A correct password stored with an
+    outdated hasher or cost is rehashed (also on the pool) and saved.
+    """
+    pool = get_pool()
+    if not pool.run(check_password, password, user.password):
+        return False
+    if needs_rehash(user.password):
+        user.password = pool.run(make_password, password)
+        user.save(update_fields=['password'])
+    return True
+
+
+def hash_dummy_password(password):
+    """Spend the time of one hash so unknown emails cannot be told apart by timing"""
+    get_pool().run(make_password, password)
@@ -0,0 +1,89 @@
+"""
+Management command to move old audit events into compressed monthly archives
+Run: python manage.py archive_audit_logs --days 2190
+"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.audit_query import FIELDS
+from accounts.models import AuditLog
+
+
+class Command(BaseCommand):
+    help = 'Archive audit events older than --days into gzipped NDJSON files, one per month, and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.AUDIT_RETENTION_DAYS,
+                            help='Keep events newer than this many days in the database')
+        parser.add_argument('--archive-dir', default=settings.AUDIT_ARCHIVE_DIR,
+                            help='Directory for audit-YYYY-MM.jsonl.gz files')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Events per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Count the events without archiving them')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        archive_dir = Path(options['archive_dir'])
+        archive_dir.mkdir(parents=True, exist_ok=True)
+
+        started = time.monotonic()
+        months = set()
+        archived = 0
+        for batch in self.iter_batches(cutoff, options['batch_size']):
+            if not options['dry_run']:
+                for month, rows in self.by_month(batch).items():
+                    self.append(archive_dir / f'audit-{month}.jsonl.gz', rows)
+                # Delete only what has safely reached the archive
+                AuditLog.objects.filter(id__in=[row['id'] for row in batch]).delete()
+            months.update(row['timestamp'].strftime('%Y-%m') for row in batch)
+            archived += len(batch)
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {archived} audit events older than {cutoff:%Y-%m-%d} "
+            f"across {len(months)} months in {time.monotonic() - started:.2f}s"
+        ))
+
+    def iter_batches(self, cutoff, batch_size):
+        """Events before `cutoff`, oldest first, in keyset batches"""
+        logs = AuditLog.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id')
+        position = None
+        while True:
+            page = logs
+            if position is not None:
+                timestamp, row_id = position
+                page = logs.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=row_id))
+            batch = list(page.values(*FIELDS)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            position = (batch[-1]['timestamp'], batch[-1]['id'])
+
+    @staticmethod
+    def by_month(batch):
+        months = {}
+        for row in batch:
+            row['user_email'] = row.pop('user__email')
+            months.setdefault(row['timestamp'].strftime('%Y-%m'), []).append(row)
+        return months
+
+    @staticmethod
+    def append(path, rows):
+        # Each run appends a new gzip member; gzip readers treat the file as one stream
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                for row in rows:
+                    archive.write((json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode())
+            raw.flush()
+            os.fsync(raw.fileno())
@@ -0,0 +1,54 @@
+"""
+Management command to pick a password hashing cost for this hardware
+Run: python manage.py calibrate_password_hasher --target-ms 250
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Time the configured password hasher and suggest the cost that hits --target-ms per hash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250, help='Wanted time per hash on one core')
+        parser.add_argument('--samples', type=int, default=5)
+
+    def handle(self, *args, **options):
+        hasher = get_hasher()
+        timing = self.time_hash(hasher, options['samples'])
+        self.stdout.write(f"{hasher.algorithm}: {timing:.1f}ms per hash at the current cost, "
+                          f"about {1000 / timing:.1f} logins/sec per core")
+        scale = options['target_ms'] / timing
+
+        if settings.PASSWORD_HASHER == 'pbkdf2':
+            iterations = int(settings.PASSWORD_PBKDF2_ITERATIONS * scale) // 1000 * 1000
+            suggestion = f'PASSWORD_PBKDF2_ITERATIONS={max(iterations, 100000)}'
+        elif settings.PASSWORD_HASHER == 'scrypt':
+            # N must be a power of two; scale it and keep r and p
+            n = settings.PASSWORD_SCRYPT_N
+            while n * 2 * timing / settings.PASSWORD_SCRYPT_N <= options['target_ms']:
+                n *= 2
+            while n > 2 ** 14 and n * timing / settings.PASSWORD_SCRYPT_N > options['target_ms']:
+                n //= 2
+            suggestion = f'PASSWORD_SCRYPT_N={n}'
+        else:
+            raise CommandError(f'Calibration is not supported for {settings.PASSWORD_HASHER}; '
+                               'tune its time_cost/memory_cost directly')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"For ~{options['target_ms']:.0f}ms per hash set {suggestion}. "
+            f"Existing passwords are rehashed as users log in."
+        ))
+
+    @staticmethod
+    def time_hash(hasher, samples):
+        salt = hasher.salt()
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            hasher.encode('calibration-password', salt)
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)[len(timings) // 2]
@@ -0,0 +1,30 @@
+"""
+Management command to verify that the API's hot queries use indexes
+Run: python manage.py check_query_plans
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.query_plans import hot_queries, find_scans
+
+
+class Command(BaseCommand):
+    help = 'Explain every hot query (core.query_plans) and fail if any of them scans a whole table or collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to explain against')
+
+    def handle(self, *args, **options):
+        failures = []
+        for query in hot_queries():
+            plan, scans = find_scans(query, options['database'])
+            if scans:
+                failures.append(query.label)
+                self.stdout.write(self.style.ERROR(f"SCAN  {query.label}: {', '.join(scans)}"))
+            else:
+                self.stdout.write(f"OK    {query.label}")
+            if options['verbosity'] > 1:
+                self.stdout.write(f"      {plan}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries scan without an index: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('Every hot query uses an index'))
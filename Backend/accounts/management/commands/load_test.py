@@ -0,0 +1,124 @@
+"""
+Management command to measure how many concurrent connections a running server handles
+Serve the same code both ways on the same machine and run this against each:
+    gunicorn core.wsgi:application --workers 4 --threads 8
+    ASYNC_READ_ROUTES='*' uvicorn core.asgi:application --workers 4
+Run: python manage.py load_test http://127.0.0.1:8000/api/health/public/ --concurrency 10,100,1000
+"""
+import asyncio
+import ssl
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Hold --concurrency keep-alive connections to a URL and report throughput, latency and errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--concurrency', default='10,50,100,500',
+                            help='Comma-separated numbers of simultaneous connections, one run each')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds before a request counts as failed')
+        parser.add_argument('--token', help='JWT access token to send as a Bearer token')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError('url must be an http:// or https:// URL')
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be comma-separated integers')
+
+        headers = [f'Host: {url.netloc}', 'Accept: application/json']
+        if options['token']:
+            headers.append(f"Authorization: Bearer {options['token']}")
+        path = (url.path or '/') + (f'?{url.query}' if url.query else '')
+        request = ('\r\n'.join([f'GET {path} HTTP/1.1'] + headers) + '\r\n\r\n').encode()
+
+        for level in levels:
+            result = asyncio.run(self.run_level(url, request, level, options['duration'], options['timeout']))
+            self.report(level, result)
+
+    async def run_level(self, url, request, connections, duration, timeout):
+        deadline = time.monotonic() + duration
+        result = {'latencies': [], 'failures': 0, 'statuses': {}}
+        started = time.monotonic()
+        await asyncio.gather(*[
+            self.client(url, request, deadline, timeout, result) for _ in range(connections)
+        ])
+        result['elapsed'] = time.monotonic() - started
+        return result
+
+    async def client(self, url, request, deadline, timeout, result):
+        reader = writer = None
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(self.connect(url), timeout)
+                writer.write(request)
+                status, keep_alive = await asyncio.wait_for(self.read_response(reader), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                result['failures'] += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                await asyncio.sleep(0.1)
+                continue
+            result['latencies'].append((time.monotonic() - started) * 1000)
+            result['statuses'][status] = result['statuses'].get(status, 0) + 1
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    @staticmethod
+    async def connect(url):
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        context = ssl.create_default_context() if url.scheme == 'https' else None
+        return await asyncio.open_connection(url.hostname, port, ssl=context)
+
+    @staticmethod
+    async def read_response(reader):
+        """Read one response; (status, keep_alive)"""
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip().lower()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif status not in (204, 304):
+            await reader.read()
+            return status, False
+        return status, headers.get('connection') != 'close'
+
+    def report(self, connections, result):
+        latencies = sorted(result['latencies'])
+        requests = len(latencies)
+        line = f"{connections:>5} connections: {requests / result['elapsed']:8.1f} req/s"
+        if latencies:
+            p99 = latencies[min(requests - 1, int(requests * 0.99))]
+            line += f", p50 {statistics.median(latencies):.1f}ms, p99 {p99:.1f}ms"
+        # Connection failures and timeouts, plus 5xx responses
+        errors = result['failures'] + sum(count for status, count in result['statuses'].items() if status >= 500)
+        attempts = requests + result['failures']
+        line += f", errors {errors} ({errors / attempts * 100 if attempts else 0:.1f}%)"
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(result['statuses'].items()))
+        self.stdout.write(f'{line}  [{statuses}]')
@@ -0,0 +1,28 @@
+"""
+Management command to compute every provider's panel analytics ahead of
+requests, into the shared 'analytics' cache (see accounts.analytics)
+Run more often than ANALYTICS_CACHE_TTL, e.g. from cron: python manage.py precompute_provider_analytics
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.analytics import get_cache, precompute
+from accounts.authentication import PROCESS_LOCAL_CACHES
+
+
+class Command(BaseCommand):
+    help = "Compute every provider's panel analytics for the default range into the analytics cache"
+
+    def handle(self, *args, **options):
+        if isinstance(get_cache(), PROCESS_LOCAL_CACHES):
+            raise CommandError(
+                'The analytics cache is local to each process; set ANALYTICS_CACHE_BACKEND '
+                'to a shared cache so the web workers see the results'
+            )
+        started = time.monotonic()
+        count = precompute(timezone.now().date())
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed analytics for {count} providers in {time.monotonic() - started:.2f}s'
+        ))
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -120,10 +121,17 @@ class AuditLog(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
     details = models.JSONField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Set when the event happens, not when it is flushed
     
     class Meta:
         ordering = ['-timestamp']
+        # Time-ordered compound indexes backing the audit query API (accounts.audit_query)
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='audit_time_idx'),
+            models.Index(fields=['user', '-timestamp'], name='audit_user_time_idx'),
+            models.Index(fields=['action', '-timestamp'], name='audit_action_time_idx'),
+            models.Index(fields=['resource', 'resource_id', '-timestamp'], name='audit_resource_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.action} - {self.timestamp}"
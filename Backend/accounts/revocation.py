@@ -0,0 +1,321 @@
+"""
+Local revocation store for JWTs.
+
+Replaces simplejwt's database blacklist (token_blacklist is not installed).
+Revoked token ids are kept in memory in expiry buckets that together span
+REFRESH_TOKEN_LIFETIME. A token is looked up only in the bucket its own `exp`
+falls into, and whole buckets are dropped once every token in them has
+expired. Each bucket has a Bloom filter that answers "not revoked" - the
+common case - without touching anything else, backed by a sorted array of
+64-bit fingerprints for an exact answer.
+
+"Revoke all sessions" is stored per user as a cut-off time: tokens issued at
+or before it are rejected.
+
+Every revocation is appended to TOKEN_REVOCATION_FILE. Each process replays
+the file on start and picks up lines appended by other processes (one stat()
+per check), so revocations survive restarts and are shared between workers
+on the same host. Expired lines are dropped when a process starts.
+
+is_revoked() reads new lines first. revoke_if_not_revoked() checks and
+revokes as one step under an exclusive lock on the file, for refresh tokens
+that must be rotated at most once. Async callers, which must not wait on
+the lock or the file, check with revoked_in_memory() instead and sync() on a
+thread when the last read is older than they accept (see stale()). Readers
+never see a half-built state: a full re-read is swapped in when complete.
+"""
+import hashlib
+import itertools
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, fine for the dev server
+    fcntl = None
+
+BUCKETS_PER_LIFETIME = 8
+
+
+def _digest(jti):
+    """Two 64-bit hashes of a token id: the fingerprint and the Bloom filter step"""
+    digest = hashlib.blake2b(jti.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+
+
+class BloomFilter:
+
+    def __init__(self, bits, hashes=7):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray(bits // 8 + 1)
+
+    def _positions(self, h1, h2):
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, h1, h2):
+        for position in self._positions(h1, h2):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, h1, h2):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(h1, h2))
+
+
+class FingerprintSet:
+    """Sorted array of 64-bit fingerprints; new ones wait in a small set and are merged in geometrically"""
+
+    def __init__(self):
+        self.sorted = array('Q')
+        self.pending = set()
+
+    def __contains__(self, fingerprint):
+        if fingerprint in self.pending:
+            return True
+        index = bisect_left(self.sorted, fingerprint)
+        return index < len(self.sorted) and self.sorted[index] == fingerprint
+
+    def __len__(self):
+        return len(self.sorted) + len(self.pending)
+
+    def add(self, fingerprint):
+        if fingerprint in self:
+            return
+        self.pending.add(fingerprint)
+        if len(self.pending) > max(4096, len(self.sorted) // 8):
+            self._merge()
+
+    def update(self, fingerprints):
+        self.pending.update(fingerprints)
+        self._merge()
+
+    def _merge(self):
+        self.sorted = array('Q', sorted(set(itertools.chain(self.sorted, self.pending))))
+        self.pending = set()
+
+
+class Bucket:
+
+    def __init__(self, bloom_bits):
+        self.bloom = BloomFilter(bloom_bits)
+        self.fingerprints = FingerprintSet()
+
+    def add(self, h1, h2):
+        self.bloom.add(h1, h2)
+        self.fingerprints.add(h1)
+
+    def update(self, pairs):
+        for h1, h2 in pairs:
+            self.bloom.add(h1, h2)
+        self.fingerprints.update(h1 for h1, _ in pairs)
+
+    def __contains__(self, hashes):
+        h1, h2 = hashes
+        return self.bloom.might_contain(h1, h2) and h1 in self.fingerprints
+
+
+class RevocationStore:
+
+    def __init__(self, path, lifetime=None, bloom_bits=2 ** 21):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lifetime = int((lifetime or api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+        self.bucket_seconds = max(1, self.lifetime // BUCKETS_PER_LIFETIME)
+        self.bloom_bits = bloom_bits
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._buckets = {}
+        self._users = {}  # user_id -> (revoked_at, expires)
+        self._offset = 0
+        self._inode = None
+        self._synced_at = 0.0  # time.monotonic() of the last read
+
+    # File
+
+    def _locked(self, operation):
+        lock = open(f'{self.path}.lock', 'a')
+        if fcntl is not None:
+            fcntl.flock(lock, operation)
+        return lock
+
+    def _write(self, line):
+        with open(self.path, 'a', encoding='ascii') as log:
+            log.write(line + '\n')
+
+    def _append(self, line):
+        lock = self._locked(fcntl.LOCK_SH if fcntl else None)
+        try:
+            self._write(line)
+        finally:
+            lock.close()
+
+    def _sync(self):
+        """Apply lines appended since the last call; caller holds self._lock"""
+        synced_at = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._synced_at = synced_at
+            return
+        buckets, users, offset = self._buckets, self._users, self._offset
+        if stat.st_ino != self._inode or stat.st_size < offset:
+            # First read, or the file was compacted: build the state afresh
+            buckets, users, offset = {}, {}, 0
+        elif stat.st_size == offset:
+            self._synced_at = synced_at
+            return
+        with open(self.path, 'rb') as log:
+            log.seek(offset)
+            data = log.read(stat.st_size - offset)
+        complete = data.rfind(b'\n') + 1  # Ignore a line still being written
+        now = time.time()
+        # Group token ids by bucket so a large replay merges each bucket once
+        tokens = {}
+        for line in data[:complete].decode('ascii').splitlines():
+            fields = line.split()
+            if fields[0] == 'j':
+                exp, digest = int(fields[1]), fields[2]
+                if exp > now:
+                    tokens.setdefault(exp // self.bucket_seconds, []).append(
+                        (int(digest[:16], 16), int(digest[16:], 16))
+                    )
+            elif fields[0] == 'u':
+                user_id, revoked_at, expires = fields[1], float(fields[2]), float(fields[3])
+                if expires > now and revoked_at > users.get(user_id, (0, 0))[0]:
+                    users[user_id] = (revoked_at, expires)
+        for bucket_id, pairs in tokens.items():
+            if bucket_id not in buckets:
+                buckets[bucket_id] = Bucket(self.bloom_bits)
+            if len(pairs) == 1:
+                buckets[bucket_id].add(*pairs[0])
+            else:
+                buckets[bucket_id].update(pairs)
+        self._buckets, self._users = buckets, users
+        self._offset, self._inode, self._synced_at = offset + complete, stat.st_ino, synced_at
+        self._expire(now)
+
+    def _expire(self, now):
+        for bucket_id in [b for b in self._buckets if (b + 1) * self.bucket_seconds <= now]:
+            del self._buckets[bucket_id]
+        for user_id in [u for u, (_, expires) in self._users.items() if expires <= now]:
+            del self._users[user_id]
+
+    def compact(self):
+        """Rewrite the file without expired lines, unless another process is using it"""
+        if fcntl is None or not self.path.exists():
+            return
+        lock = open(f'{self.path}.lock', 'a')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            now = time.time()
+            temp = self.path.with_suffix('.compact')
+            with open(self.path, encoding='ascii') as source, open(temp, 'w', encoding='ascii') as target:
+                for line in source:
+                    fields = line.split()
+                    if not line.endswith('\n') or not fields:
+                        continue
+                    expires = int(fields[1]) if fields[0] == 'j' else float(fields[3])
+                    if expires > now:
+                        target.write(line)
+            os.replace(temp, self.path)
+        finally:
+            lock.close()
+
+    # API
+
+    @staticmethod
+    def _token_line(jti, exp):
+        h1, h2 = _digest(jti)
+        return f'j {int(exp)} {h1:016x}{h2:016x}'
+
+    def revoke(self, jti, exp):
+        self._append(self._token_line(jti, exp))
+        with self._lock:
+            self._sync()
+
+    def revoke_token(self, token):
+        self.revoke(token[api_settings.JTI_CLAIM], token['exp'])
+
+    def revoke_if_not_revoked(self, token):
+        """
+        Revoke the token unless it already is; returns False if it was. The
+        check and the append hold the file lock exclusively, so of concurrent
+        callers in any process only one gets True
+        """
+        lock = self._locked(fcntl.LOCK_EX if fcntl else None)
+        try:
+            with self._lock:
+                self._sync()
+                if self.revoked_in_memory(token):
+                    return False
+                self._write(self._token_line(token[api_settings.JTI_CLAIM], token['exp']))
+                self._sync()
+                return True
+        finally:
+            lock.close()
+
+    def revoke_user(self, user_id):
+        """Reject every token issued to the user until now"""
+        now = time.time()
+        self._append(f'u {user_id} {now:.6f} {now + self.lifetime:.0f}')
+        with self._lock:
+            self._sync()
+
+    def is_revoked(self, token):
+        with self._lock:
+            self._sync()
+        return self.revoked_in_memory(token)
+
+    def revoked_in_memory(self, token):
+        """is_revoked() as of the last read of the file, without locking or I/O"""
+        user = self._users.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        if user is not None and token.get('iat', 0) <= user[0]:
+            return True
+        bucket = self._buckets.get(int(token['exp']) // self.bucket_seconds)
+        return bucket is not None and _digest(token[api_settings.JTI_CLAIM]) in bucket
+
+    def stale(self, max_age):
+        """Whether the file was last read more than `max_age` seconds ago"""
+        return time.monotonic() - self._synced_at > max_age
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def stats(self):
+        with self._lock:
+            self._sync()
+            return {
+                'revoked_tokens': sum(len(bucket.fingerprints) for bucket in self._buckets.values()),
+                'revoked_users': len(self._users),
+                'buckets': len(self._buckets),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(load=True):
+    """The process-wide store, compacted and loaded on first use; with load=False, None until then"""
+    global _store
+    if _store is None and not load:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = RevocationStore(
+                settings.TOKEN_REVOCATION_FILE, bloom_bits=settings.TOKEN_REVOCATION_BLOOM_BITS
+            )
+            _store.compact()
+        return _store
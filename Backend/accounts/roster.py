@@ -0,0 +1,65 @@
+"""
+Provider roster - compliance figures for a whole patient panel.
+
+PatientListSerializer used to run several WellnessGoal queries per patient.
+Here the figures for every patient on the page are computed with two grouped
+aggregate queries and handed to the serializer through its context.
+"""
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+
+from wellness.models import WellnessGoal
+
+
+class RosterPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+def compliance_label(total, completed):
+    """Map today's goal counts to the status shown on the provider dashboard"""
+    if not total:
+        return 'No Goals Set'
+    if completed == total:
+        return 'Goal Met'
+    elif completed > 0:
+        return 'In Progress'
+    return 'Missed'
+
+
+def build_roster_context(profiles, date=None):
+    """Precompute compliance status and goals met for a list of PatientProfiles"""
+    date = date or timezone.now().date()
+    user_ids = [profile.user_id for profile in profiles]
+
+    # Today's goals grouped by (user, is_completed)
+    today_counts = {}
+    rows = WellnessGoal.objects.filter(
+        user_id__in=user_ids,
+        date=date
+    ).values('user_id', 'is_completed').annotate(count=Count('id')).order_by()
+    for row in rows:
+        total, completed = today_counts.get(row['user_id'], (0, 0))
+        total += row['count']
+        if row['is_completed']:
+            completed += row['count']
+        today_counts[row['user_id']] = (total, completed)
+
+    # All-time completed goals grouped by user
+    goals_met = {
+        row['user_id']: row['count']
+        for row in WellnessGoal.objects.filter(
+            user_id__in=user_ids,
+            is_completed=True
+        ).values('user_id').annotate(count=Count('id')).order_by()
+    }
+
+    return {
+        'compliance': {
+            user_id: compliance_label(*today_counts.get(user_id, (0, 0)))
+            for user_id in user_ids
+        },
+        'goals_met': {user_id: goals_met.get(user_id, 0) for user_id in user_ids},
+    }
@@ -2,6 +2,11 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.utils import timezone
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import token_for_user
+from .revocation import get_store
 from .models import PatientProfile, ProviderProfile
 
 User = get_user_model()
@@ -98,7 +103,11 @@ class PatientListSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'compliance_status', 'goals_met']
     
     def get_compliance_status(self, obj):
-        # This would be calculated based on goals and reminders
+        # Precomputed for the whole panel by accounts.roster when available
+        compliance = self.context.get('compliance')
+        if compliance is not None and obj.user_id in compliance:
+            return compliance[obj.user_id]
+        
         from wellness.models import WellnessGoal
         today_goals = WellnessGoal.objects.filter(
             user=obj.user,
@@ -117,6 +126,10 @@ class PatientListSerializer(serializers.ModelSerializer):
         return 'Missed'
     
     def get_goals_met(self, obj):
+        goals_met = self.context.get('goals_met')
+        if goals_met is not None and obj.user_id in goals_met:
+            return goals_met[obj.user_id]
+        
         from wellness.models import WellnessGoal
         return WellnessGoal.objects.filter(user=obj.user, is_completed=True).count()
 
@@ -131,3 +144,26 @@ class ChangePasswordSerializer(serializers.Serializer):
             raise serializers.ValidationError("Old password is incorrect.")
         return value
 
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Login tokens that carry the user's email, role and name"""
+
+    @classmethod
+    def get_token(cls, user):
+        return token_for_user(user)
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses revoked refresh tokens and revokes the old token when rotating it"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            # Check and revoke in one step, so concurrent refreshes cannot both rotate it
+            revoked = not get_store().revoke_if_not_revoked(refresh)
+        else:
+            revoked = get_store().is_revoked(refresh)
+        if revoked:
+            raise InvalidToken('Token has been revoked')
+        return super().validate(attrs)
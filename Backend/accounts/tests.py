@@ -1,3 +1,906 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from pymongo import MongoClient, monitoring
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from core.benchmarks import benchmark, measure, report
+from wellness.models import WellnessGoal, DailyGoalLog, PreventiveCareReminder
+from core.middleware import MongoPoolMiddleware
+from core.mongo_backend import base as mongo_backend
+from core.mongo_pool import POOL_LISTENER, PoolMetrics
+from core.query_plans import HotQuery, find_scans
+from core.routers import SecondaryReadRouter
+from health_info.models import HealthArticle
+from wellness.views import DashboardSummaryView
+from .analytics import cohort_analytics, get_cache as get_analytics_cache, panel_columns
+from .audit import AuditWriter
+from .authentication import get_cache as get_auth_cache, token_for_user
+from .hashers import HashingPool
+from .revocation import RevocationStore, _digest
+from .models import User, PatientProfile, AuditLog
+
+
+@override_settings(AUDIT_ASYNC=False)
+class ProviderPatientsRosterTest(TestCase):
+    """The provider roster must not issue queries per patient"""
+
+    def setUp(self):
+        self.provider = User.objects.create_user(
+            email='provider@test.com', password='pass1234',
+            first_name='Pat', last_name='Provider', role='provider'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider)
+        self.patient_count = 0
+
+    def add_patients(self, count):
+        today = timezone.now().date()
+        for _ in range(count):
+            self.patient_count += 1
+            user = User.objects.create_user(
+                email=f'patient{self.patient_count}@test.com', password='pass1234',
+                first_name='Test', last_name='Patient'
+            )
+            PatientProfile.objects.create(user=user, assigned_provider=self.provider)
+            WellnessGoal.objects.create(
+                user=user, goal_type='steps', title='Steps', date=today,
+                target_value=100, current_value=100
+            )
+            WellnessGoal.objects.create(
+                user=user, goal_type='sleep', title='Sleep', date=today,
+                target_value=8, current_value=0
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_is_constant(self):
+        self.add_patients(2)
+        small, response = self.count_queries('/api/auth/provider/patients/')
+        self.assertEqual(len(response.data), 2)
+
+        self.add_patients(20)
+        large, response = self.count_queries('/api/auth/provider/patients/')
+        self.assertEqual(len(response.data), 22)
+        self.assertEqual(small, large)
+
+    def test_precomputed_values_match(self):
+        self.add_patients(1)
+        _, response = self.count_queries('/api/auth/provider/patients/')
+        self.assertEqual(response.data[0]['compliance_status'], 'In Progress')
+        self.assertEqual(response.data[0]['goals_met'], 1)
+        self.assertEqual(response.data[0]['user']['email'], 'patient1@test.com')
+
+    def test_pagination(self):
+        self.add_patients(5)
+        small, response = self.count_queries('/api/auth/provider/patients/?page=1&page_size=2')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.add_patients(15)
+        large, response = self.count_queries('/api/auth/provider/patients/?page=2&page_size=10')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(small, large)
+
+    def test_cursor_pagination(self):
+        self.add_patients(5)
+        _, first = self.count_queries('/api/auth/provider/patients/?cursor=&page_size=3')
+        self.assertNotIn('count', first.data)
+        _, second = self.count_queries(f"/api/auth/provider/patients/?cursor={first.data['next_cursor']}&page_size=3")
+        self.assertIsNone(second.data['next_cursor'])
+        emails = [row['user']['email'] for row in first.data['results'] + second.data['results']]
+        self.assertEqual(emails, [f'patient{i}@test.com' for i in range(1, 6)])
+
+        # page_size alone asks for the first keyset page, as on the other lists
+        _, sized = self.count_queries('/api/auth/provider/patients/?page_size=3')
+        self.assertEqual(sized.data['results'], first.data['results'])
+        self.assertEqual(sized.data['next_cursor'], first.data['next_cursor'])
+
+
+class AuditWriterTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='audited@test.com', password='pass1234')
+        self.spool = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool.cleanup)
+
+    def event(self, action='login', **extra):
+        return {
+            'user_id': self.user.id, 'user_email': self.user.email, 'action': action,
+            'timestamp': '2026-01-02T03:04:05+00:00', **extra,
+        }
+
+    def test_flush_writes_spooled_events(self):
+        writer = AuditWriter(self.spool.name, batch_size=2)
+        for _ in range(3):
+            writer.enqueue(self.event(resource='User', resource_id='1'))
+        self.assertEqual(writer.stats()['queue_depth'], 3)
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        writer.flush()
+        self.assertEqual(AuditLog.objects.count(), 3)
+        log = AuditLog.objects.first()
+        self.assertEqual(log.timestamp.year, 2026)  # time of the event, not of the flush
+        self.assertEqual(log.resource, 'User')
+        stats = writer.stats()
+        self.assertEqual((stats['written'], stats['queue_depth'], stats['pending_segments']), (3, 0, 0))
+
+    def test_failed_flush_keeps_segment(self):
+        writer = AuditWriter(self.spool.name)
+        writer.enqueue(self.event())
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=OperationalError('database is down')), \
+                self.assertLogs('accounts.audit', 'ERROR'):
+            writer.flush()
+        stats = writer.stats()
+        self.assertEqual((stats['flush_errors'], stats['pending_segments']), (1, 1))
+        writer.flush()
+        self.assertEqual((AuditLog.objects.count(), writer.stats()['pending_segments']), (1, 0))
+
+    def test_rejected_events_are_quarantined(self):
+        writer = AuditWriter(self.spool.name)
+        bad = self.event()
+        del bad['action']  # cannot be turned into an AuditLog
+        for event in (self.event('login'), bad, self.event('logout')):
+            writer.enqueue(event)
+        with self.assertLogs('accounts.audit', 'ERROR'):
+            writer.flush()
+        writer.enqueue(self.event('view_patient'))
+        writer.flush()
+
+        self.assertEqual(sorted(AuditLog.objects.values_list('action', flat=True)), ['login', 'logout', 'view_patient'])
+        stats = writer.stats()
+        self.assertEqual((stats['quarantined'], stats['flush_errors'], stats['pending_segments']), (1, 0, 0))
+        quarantined = os.listdir(os.path.join(self.spool.name, 'quarantine'))
+        with open(os.path.join(self.spool.name, 'quarantine', quarantined[0])) as rejected:
+            self.assertNotIn('action', json.loads(rejected.read()))
+
+    def test_recovers_spool_of_dead_process(self):
+        # A predecessor with the same pid, as for pid 1 in a restarted container
+        for prefix in ('999999-deadbeef', f'{os.getpid()}-deadbeef'):
+            with open(os.path.join(self.spool.name, f'{prefix}.current.jsonl'), 'w') as spool:
+                spool.write(json.dumps(self.event('logout')) + '\n')
+        running = AuditWriter(self.spool.name)
+        running.enqueue(self.event('login'))
+        with open(os.path.join(self.spool.name, f'{running.prefix}.current.jsonl')) as spool:
+            self.assertEqual(len(spool.readlines()), 1)
+
+        self.assertEqual(running.stats()['recovered'], 2)
+        # A writer started next to a running one leaves its spool alone
+        self.assertEqual(AuditWriter(self.spool.name).stats()['recovered'], 0)
+        running.flush()
+        self.assertEqual(sorted(AuditLog.objects.values_list('action', flat=True)), ['login', 'logout', 'logout'])
+
+    @benchmark
+    def test_benchmark_login_latency(self):
+        client = APIClient()
+        credentials = {'email': self.user.email, 'password': 'pass1234'}
+
+        def login():
+            client.post('/api/auth/login/', credentials)
+
+        with override_settings(AUDIT_ASYNC=False):
+            report('login (inline audit insert)', measure(login, repeat=50))
+        writer = AuditWriter(self.spool.name)
+        with mock.patch('accounts.views.get_writer', return_value=writer):
+            report('login (spooled audit writer)', measure(login, repeat=50))
+
+
+@override_settings(AUDIT_ASYNC=False)
+class AuditLogQueryTest(TestCase):
+
+    def setUp(self):
+        self.officer = User.objects.create_user(email='officer@test.com', password='pass1234', is_staff=True)
+        self.patient = User.objects.create_user(email='patient@test.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.officer)
+
+    def add_logs(self, count, user, action='view_profile', days_ago=0, **extra):
+        # Rows share timestamps so the cursor has to break ties on id
+        moment = timezone.now() - timedelta(days=days_ago)
+        AuditLog.objects.bulk_create([
+            AuditLog(user=user, action=action, timestamp=moment - timedelta(minutes=i // 3), **extra)
+            for i in range(count)
+        ])
+
+    def test_cursor_pages_cover_every_row_once(self):
+        self.add_logs(25, self.patient)
+        self.add_logs(5, self.officer, action='login')
+        seen = []
+        url = f'/api/auth/audit/logs/?user={self.patient.id}&page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            cursor = response.data['next_cursor']
+            url = f'/api/auth/audit/logs/?user={self.patient.id}&page_size=10&cursor={cursor}' if cursor else None
+        expected = AuditLog.objects.filter(user=self.patient).order_by('-timestamp', '-id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+
+    def test_filters_and_validation(self):
+        self.add_logs(3, self.patient, resource='PatientProfile', resource_id='7')
+        self.add_logs(2, self.patient, days_ago=10)
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get(f'/api/auth/audit/logs/?resource=PatientProfile&resource_id=7&since={since}')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(response.data['results'][0]['user_email'], 'patient@test.com')
+
+        for query in ('action=nope', 'since=yesterday', 'cursor=garbage', 'page_size=0'):
+            self.assertEqual(self.client.get(f'/api/auth/audit/logs/?{query}').status_code, 400)
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/api/auth/audit/logs/').status_code, 403)
+
+    def test_export_streams_all_rows(self):
+        self.add_logs(12, self.patient, details={'field': 'phone'})
+        with mock.patch('accounts.audit_query.EXPORT_BATCH_SIZE', 5):
+            response = self.client.get(f'/api/auth/audit/logs/export/?user={self.patient.id}')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(json.loads(lines[0])['details'], {'field': 'phone'})
+
+        response = self.client.get(f'/api/auth/audit/logs/export/?user={self.patient.id}&output=csv')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0].split(',')[:3], ['id', 'timestamp', 'user_id'])
+        self.assertEqual(len(rows), 13)
+        self.assertTrue(AuditLog.objects.filter(user=self.officer, action='export_data').exists())
+
+    def test_archive_moves_old_events_to_monthly_files(self):
+        self.add_logs(4, self.patient, days_ago=400)
+        self.add_logs(3, self.patient, days_ago=100)
+        self.add_logs(2, self.patient)
+        with tempfile.TemporaryDirectory() as archive_dir:
+            call_command('archive_audit_logs', days=30, archive_dir=archive_dir, batch_size=2, stdout=StringIO())
+            archived = []
+            for name in os.listdir(archive_dir):
+                with gzip.open(os.path.join(archive_dir, name), 'rt') as archive:
+                    archived.extend(json.loads(line) for line in archive)
+        self.assertEqual(len(archived), 7)
+        self.assertEqual(AuditLog.objects.count(), 2)
+        self.assertEqual(archived[0]['user_email'], 'patient@test.com')
+
+
+@override_settings(AUDIT_ASYNC=False)
+class PatientDataExportTest(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient', phone='555-0100'
+        )
+        self.provider = User.objects.create_user(email='provider@test.com', password='pass1234', role='provider')
+        self.profile = PatientProfile.objects.create(
+            user=self.patient, assigned_provider=self.provider, blood_type='O+', height=170, allergies='Peanuts'
+        )
+        for days in range(3):
+            goal = WellnessGoal.objects.create(
+                user=self.patient, goal_type='steps', title='Steps', date=self.today - timedelta(days=days),
+                target_value=6000, unit='steps', extra_data={'source': 'watch'},
+            )
+            DailyGoalLog.objects.bulk_create([DailyGoalLog(goal=goal, value=1000 * i) for i in range(4)])
+        PreventiveCareReminder.objects.create(
+            user=self.patient, reminder_type='dental', title='Dental', scheduled_date=self.today,
+        )
+        other = User.objects.create_user(email='other@test.com', password='pass1234')
+        WellnessGoal.objects.create(user=other, goal_type='sleep', title='Sleep', date=self.today)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/auth/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_streams_every_record(self):
+        with mock.patch('accounts.data_export.EXPORT_BATCH_SIZE', 2):
+            lines = [json.loads(line) for line in self.export().decode().splitlines()]
+        records = [line['record'] for line in lines]
+        self.assertEqual(records, ['user', 'patient_profile'] + ['wellness_goals'] * 3 + ['goal_logs'] * 12 + ['reminders'])
+        self.assertEqual(lines[0]['email'], 'patient@test.com')
+        self.assertNotIn('password', lines[0])
+        self.assertEqual(len({line['id'] for line in lines if line['record'] == 'goal_logs'}), 12)
+        audit = AuditLog.objects.get(action='export_data')
+        self.assertEqual((audit.user, audit.resource_id, audit.details), (self.patient, str(self.patient.id), {'output': 'ndjson'}))
+
+    def test_csv_files_in_zip(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.export('?output=csv')))
+        self.assertEqual(archive.namelist(), [
+            'user.csv', 'patient_profile.csv', 'wellness_goals.csv', 'goal_logs.csv', 'reminders.csv'
+        ])
+        goals = list(csv.DictReader(io.StringIO(archive.read('wellness_goals.csv').decode())))
+        self.assertEqual(len(goals), 3)
+        self.assertEqual(json.loads(goals[0]['extra_data']), {'source': 'watch'})
+        self.assertEqual(len(archive.read('goal_logs.csv').decode().splitlines()), 13)
+
+    def test_fhir_bundle(self):
+        bundle = json.loads(self.export('?output=fhir'))
+        self.assertEqual((bundle['resourceType'], bundle['type']), ('Bundle', 'collection'))
+        resources = [entry['resource'] for entry in bundle['entry']]
+        counts = {}
+        for resource in resources:
+            counts[resource['resourceType']] = counts.get(resource['resourceType'], 0) + 1
+        self.assertEqual(counts, {'Patient': 1, 'Observation': 14, 'AllergyIntolerance': 1, 'Goal': 3, 'Appointment': 1})
+        self.assertEqual(resources[0]['telecom'][1], {'system': 'phone', 'value': '555-0100'})
+        self.assertEqual(resources[-1]['status'], 'booked')
+
+    def test_provider_exports_assigned_patients_only(self):
+        self.client.force_authenticate(self.provider)
+        lines = self.export(f'?patient={self.profile.id}').decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['email'], 'patient@test.com')
+        self.assertEqual(AuditLog.objects.get(action='export_data').user, self.provider)
+
+        unassigned = PatientProfile.objects.create(user=User.objects.get(email='other@test.com'))
+        self.assertEqual(self.client.get(f'/api/auth/export/?patient={unassigned.id}').status_code, 404)
+        self.assertEqual(self.client.get('/api/auth/export/?patient=me').status_code, 400)
+        self.assertEqual(self.client.get('/api/auth/export/?output=xml').status_code, 400)
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(f'/api/auth/export/?patient={unassigned.id}').status_code, 403)
+
+    @benchmark
+    def test_benchmark_export_one_million_logs(self):
+        WellnessGoal.objects.bulk_create([
+            WellnessGoal(user=self.patient, goal_type=goal_type, title=goal_type, date=self.today - timedelta(days=day))
+            for day in range(200) for goal_type in ('sleep', 'water', 'calories', 'active_time', 'custom')
+        ])
+        goals = list(WellnessGoal.objects.filter(user=self.patient).values_list('id', flat=True))
+        started = timezone.now()
+        logs = []
+        for goal_id in goals:
+            logs.extend(DailyGoalLog(goal_id=goal_id, value=i, logged_at=started - timedelta(minutes=i))
+                        for i in range(1000))
+            if len(logs) >= 100000:
+                DailyGoalLog.objects.bulk_create(logs, batch_size=5000)
+                logs = []
+        DailyGoalLog.objects.bulk_create(logs, batch_size=5000)
+
+        for output in ('ndjson', 'csv', 'fhir'):
+            response = self.client.get(f'/api/auth/export/?output={output}')
+            started = time.perf_counter()
+            size = sum(len(chunk) for chunk in response.streaming_content)
+            print(f'\nexport of 1M goal logs as {output}: {size / 2 ** 20:.0f} MiB in {time.perf_counter() - started:.1f}s')
+
+        # Memory stays flat: the peak over the first 200k rows is the peak for any number
+        response = self.client.get('/api/auth/export/')
+        tracemalloc.start()
+        for chunk in itertools.islice(response.streaming_content, 0, 200000 * 120 // (64 * 1024)):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'peak memory while streaming: {peak / 2 ** 20:.1f} MiB')
+
+
+@override_settings(AUDIT_ASYNC=False)
+class ProviderAnalyticsTest(TestCase):
+
+    def setUp(self):
+        get_analytics_cache().clear()
+        self.today = timezone.now().date()
+        self.provider = User.objects.create_user(email='provider@test.com', password='pass1234', role='provider')
+        self.first = User.objects.create_user(email='first@test.com', password='pass1234')
+        self.second = User.objects.create_user(email='second@test.com', password='pass1234')
+        other = User.objects.create_user(email='other@test.com', password='pass1234')
+        for user in (self.first, self.second):
+            PatientProfile.objects.create(user=user, assigned_provider=self.provider)
+        PatientProfile.objects.create(user=other)
+        goals = [
+            (self.first, 'steps', 0, 6000, True),
+            (self.first, 'steps', 7, 2000, False),
+            (self.first, 'sleep', 0, 8, True),
+            (self.first, 'steps', 20, 6000, True),  # Outside the range
+            (self.second, 'steps', 0, 3000, False),
+            (self.second, 'steps', 8, 6000, True),
+            (other, 'steps', 0, 6000, True),  # Not on the panel
+        ]
+        WellnessGoal.objects.bulk_create([
+            WellnessGoal(
+                user=user, goal_type=goal_type, title=goal_type, date=self.today - timedelta(days=days),
+                current_value=value, target_value=8 if goal_type == 'sleep' else 6000, is_completed=completed,
+            )
+            for user, goal_type, days, value, completed in goals
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider)
+
+    def analytics(self, query=''):
+        response = self.client.get(f'/api/auth/provider/analytics/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_panel_aggregates(self):
+        data = self.analytics(f'?start={self.today - timedelta(days=13)}&end={self.today}')
+        self.assertEqual((data['patients'], data['active_patients'], data['goals']), (2, 2, 5))
+        self.assertEqual(data['completion_rate'], 0.6)
+        steps, sleep = data['by_goal_type']
+        self.assertEqual(
+            (steps['goal_type'], steps['goals'], steps['completed'], steps['completion_rate'], steps['patients']),
+            ('steps', 4, 2, 0.5, 2)
+        )
+        self.assertEqual(steps['progress']['p50'], 0.75)
+        self.assertEqual((sleep['goal_type'], sleep['completion_rate'], sleep['progress']['p50']), ('sleep', 1.0, 1.0))
+
+        adherence = data['adherence']
+        self.assertEqual(adherence['mean'], 0.5833)
+        self.assertEqual([bucket['patients'] for bucket in adherence['histogram']], [0] * 5 + [1, 1] + [0] * 3)
+
+        older, latest = data['weekly']
+        self.assertEqual((older['week_start'], older['week_end']), (self.today - timedelta(days=13), self.today - timedelta(days=7)))
+        self.assertEqual((older['goals'], older['completion_rate'], older['change']), (2, 0.5, None))
+        self.assertEqual((latest['goals'], latest['completion_rate'], latest['change']), (3, 0.6667, 0.1667))
+        self.assertEqual(latest['by_goal_type']['steps'], {'completion_rate': 0.5, 'change': 0.0})
+        self.assertEqual(latest['by_goal_type']['sleep'], {'completion_rate': 1.0, 'change': None})
+        self.assertEqual(AuditLog.objects.get(action='view_patient').resource, 'PatientAnalytics')
+
+    def test_results_are_cached_per_range(self):
+        self.assertEqual(self.analytics()['goals'], 6)
+        WellnessGoal.objects.create(user=self.first, goal_type='water', title='Water', date=self.today)
+        self.assertEqual(self.analytics()['goals'], 6)
+        self.assertEqual(self.analytics(f'?start={self.today - timedelta(days=6)}')['goals'], 4)
+
+    def test_precompute_command(self):
+        # Results in the command's own LocMemCache would never reach a request
+        with self.assertRaisesMessage(CommandError, 'ANALYTICS_CACHE_BACKEND'):
+            call_command('precompute_provider_analytics', stdout=StringIO())
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}
+        with override_settings(CACHES={**settings.CACHES, 'analytics': shared}):
+            out = StringIO()
+            call_command('precompute_provider_analytics', stdout=out)
+            self.assertIn('Computed analytics for 1 providers', out.getvalue())
+            # Served from the cache: the new goal is not counted
+            WellnessGoal.objects.create(user=self.first, goal_type='water', title='Water', date=self.today)
+            self.assertEqual(self.analytics()['goals'], 6)
+
+    def test_providers_only_and_dates_validated(self):
+        self.assertEqual(self.client.get('/api/auth/provider/analytics/?start=yesterday').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/auth/provider/analytics/?start={self.today + timedelta(days=1)}').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/auth/provider/analytics/?start={self.today - timedelta(days=400)}').status_code, 400)
+        self.client.force_authenticate(self.first)
+        self.assertEqual(self.client.get('/api/auth/provider/analytics/').status_code, 403)
+
+    @benchmark
+    def test_benchmark_five_thousand_patient_panel(self):
+        User.objects.bulk_create([User(email=f'panel{i}@test.com', password='!') for i in range(5000)])
+        patients = list(User.objects.filter(email__startswith='panel').values_list('id', flat=True))
+        PatientProfile.objects.bulk_create([
+            PatientProfile(user_id=user_id, assigned_provider=self.provider) for user_id in patients
+        ])
+        goals = []
+        for user_id in patients:
+            for day in range(90):
+                for goal_type in ('steps', 'sleep', 'water') if day % 3 == 0 else ('steps', 'sleep'):
+                    goals.append(WellnessGoal(
+                        user_id=user_id, goal_type=goal_type, title=goal_type, date=self.today - timedelta(days=day),
+                        current_value=(user_id + day) % 10, target_value=8, is_completed=(user_id + day) % 10 >= 8,
+                    ))
+            if len(goals) >= 100000:
+                WellnessGoal.objects.bulk_create(goals, batch_size=5000)
+                goals = []
+        WellnessGoal.objects.bulk_create(goals, batch_size=5000)
+
+        start = self.today - timedelta(days=89)
+        started = time.perf_counter()
+        data = self.analytics()
+        cold = (time.perf_counter() - started) * 1000
+        print(f"\npanel analytics over {data['goals']} goals of {data['patients']} patients: cold {cold:.0f}ms")
+        report('panel analytics, cached', measure(self.analytics))
+
+        user_ids = [self.first.id, self.second.id] + patients
+        started = time.perf_counter()
+        columns = panel_columns(sorted(user_ids), start, self.today)
+        print(f'columnar fetch: {(time.perf_counter() - started) * 1000:.0f}ms')
+        report('NumPy aggregation', measure(lambda: cohort_analytics(user_ids, start, self.today, columns=columns)))
+
+
+class QueryPlanTest(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        call_command('check_query_plans', stdout=StringIO())
+
+    def test_unindexed_filter_is_reported(self):
+        query = HotQuery('by summary', HealthArticle.objects.filter(summary='x'), {'summary': 'x'}, None)
+        _, scans = find_scans(query)
+        self.assertEqual(scans, ['health_info_healtharticle'])
+
+
+class MongoPoolTest(TestCase):
+    ADDRESS = ('localhost', 27017)
+
+    def setUp(self):
+        self.metrics = PoolMetrics()
+
+    def checkout(self, metrics, wait=0.0, fail=False):
+        metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(self.ADDRESS))
+        time.sleep(wait)
+        if fail:
+            metrics.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(
+                self.ADDRESS, monitoring.ConnectionCheckOutFailedReason.TIMEOUT
+            ))
+            return
+        metrics.connection_checked_out(monitoring.ConnectionCheckedOutEvent(self.ADDRESS, 1))
+        metrics.connection_checked_in(monitoring.ConnectionCheckedInEvent(self.ADDRESS, 1))
+
+    def test_counts_checkouts_per_process_and_request(self):
+        self.metrics.connection_created(monitoring.ConnectionCreatedEvent(self.ADDRESS, 1))
+        self.checkout(self.metrics)
+        token = self.metrics.start_request()
+        self.checkout(self.metrics, wait=0.01)
+        self.checkout(self.metrics, fail=True)
+        usage = self.metrics.end_request(token)
+
+        self.assertEqual((usage['checkouts'], usage['failures']), (1, 1))
+        self.assertGreaterEqual(usage['wait_ms'], 10)
+        stats = self.metrics.stats()
+        self.assertEqual((stats['checkouts'], stats['checkout_failures'], stats['checked_out']), (2, 1, 0))
+        self.assertEqual(stats['connections_open'], 1)
+        self.assertGreaterEqual(stats['wait_ms_max'], 10)
+
+    @override_settings(MONGODB_POOL_WAIT_WARN_MS=5)
+    def test_middleware_reports_waits(self):
+        def view(request):
+            self.checkout(POOL_LISTENER, wait=0.01)
+            response = HttpResponse()
+            response['Server-Timing'] = 'total;dur=12.0'
+            return response
+
+        with self.assertLogs('core.middleware', 'WARNING'):
+            response = MongoPoolMiddleware(view)(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=12.0, db-pool;dur=\d+\.\d;desc="1 checkouts"$')
+        # No Mongo work, no header
+        response = MongoPoolMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_secondary_read_routing(self):
+        router = SecondaryReadRouter()
+        self.assertEqual(router.db_for_read(HealthArticle), 'default')
+        with mock.patch.dict(settings.DATABASES, {'secondary': settings.DATABASES['default']}):
+            self.assertEqual(router.db_for_read(HealthArticle), 'secondary')
+            self.assertIsNone(router.db_for_read(WellnessGoal))
+            self.assertEqual(router.db_for_write(HealthArticle), 'default')
+            self.assertFalse(router.allow_migrate('secondary', 'health_info'))
+        self.assertIn(POOL_LISTENER, settings.MONGODB_CLIENT_OPTIONS['event_listeners'])
+
+    def connection(self, alias, **options):
+        wrapper = mongo_backend.DatabaseWrapper({'NAME': 'pool_test', 'ENFORCE_SCHEMA': False, 'CLIENT': options}, alias)
+        self.addCleanup(mongo_backend._clients.pop, alias, None)
+        return wrapper, wrapper.get_new_connection(wrapper.get_connection_params())
+
+    def test_backend_shares_one_client_per_alias(self):
+        first, database = self.connection('pool_a', host='localhost')
+        second, other = self.connection('pool_a', host='localhost')
+        _, secondary = self.connection('pool_b', host='localhost', readPreference='secondaryPreferred')
+        self.assertIs(database.client, other.client)
+        self.assertIsNot(database.client, secondary.client)
+        self.assertEqual(secondary.client.read_preference.mongos_mode, 'secondaryPreferred')
+        with mock.patch.object(MongoClient, 'close') as close:
+            first.close()
+        close.assert_not_called()
+
+    @skipUnless(os.getenv('MONGODB_TEST_URI'), 'set MONGODB_TEST_URI to test against a mongod')
+    def test_backend_keeps_the_pool_across_requests(self):
+        options = {**settings.MONGODB_CLIENT_OPTIONS, 'host': os.getenv('MONGODB_TEST_URI'), 'event_listeners': [self.metrics]}
+        for _ in range(5):
+            # What every request does: connect, query, then close_old_connections()
+            wrapper, database = self.connection('pool_test', **options)
+            database.items.find_one()
+            wrapper.connection = database
+            wrapper.close()
+        stats = self.metrics.stats()
+        self.assertEqual((stats['pools'], stats['connections_created']), (1, 1))
+        self.assertEqual(stats['checkouts'], 5)
+
+    @skipUnless(os.getenv('MONGODB_TEST_URI'), 'set MONGODB_TEST_URI to test against a mongod')
+    def test_client_options_against_mongod(self):
+        options = {**settings.MONGODB_CLIENT_OPTIONS, 'event_listeners': [self.metrics], 'maxPoolSize': 2}
+        client = MongoClient(os.getenv('MONGODB_TEST_URI'), **options)
+        try:
+            token = self.metrics.start_request()
+            client.admin.command('ping')
+            client.get_database('pool_test').items.find_one()
+            usage = self.metrics.end_request(token)
+        finally:
+            client.close()
+        self.assertGreaterEqual(usage['checkouts'], 2)
+        self.assertGreaterEqual(self.metrics.stats()['connections_created'], 1)
+
+
+@override_settings(AUDIT_ASYNC=False)
+class CachedJWTAuthenticationTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='cached@test.com', password='pass1234', first_name='Casey', role='patient'
+        )
+        get_auth_cache().clear()  # Forget that the user was just saved
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token_for_user(self.user).access_token}')
+
+    def test_login_token_carries_claims(self):
+        response = APIClient().post('/api/auth/login/', {'email': 'cached@test.com', 'password': 'pass1234'})
+        token = JWTAuthentication().get_validated_token(response.data['access'])
+        self.assertEqual((token['role'], token['first_name']), ('patient', 'Casey'))
+
+    def test_user_is_cached_until_it_changes(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/auth/me/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/auth/me/').data['first_name'], 'Casey')
+
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/me/').data['first_name'], 'Changed')
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/me/').status_code, 401)
+
+    def trusting_claims(self):
+        """AUTH_TRUST_TOKEN_CLAIMS with an auth cache shared between processes"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return override_settings(AUTH_TRUST_TOKEN_CLAIMS=True, CACHES={
+            **settings.CACHES,
+            'auth': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name},
+        })
+
+    def test_trusted_claims_skip_the_user_lookup(self):
+        with self.trusting_claims():
+            # Only the reminders query; no user lookup even on a cold cache
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/api/wellness/reminders/upcoming/').status_code, 200)
+            # Views that are not marked still resolve the user
+            with self.assertNumQueries(1):
+                self.client.get('/api/auth/me/')
+
+            # Tokens issued before a change are no longer trusted
+            self.user.role = 'provider'
+            self.user.save()
+            self.assertEqual(self.client.get('/api/wellness/dashboard/').status_code, 403)
+
+    @override_settings(AUTH_TRUST_TOKEN_CLAIMS=True)
+    def test_claims_are_not_trusted_with_an_in_process_cache(self):
+        # Other processes would never see the change marker of a deactivated user
+        with mock.patch('accounts.authentication._warned_local_cache', False), \
+                self.assertLogs('accounts.authentication', 'WARNING'), self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/wellness/reminders/upcoming/').status_code, 200)
+
+    @benchmark
+    def test_benchmark_dashboard_latency(self):
+        WellnessGoal.objects.create(user=self.user, goal_type='steps', title='Steps', date=timezone.now().date())
+
+        def dashboard():
+            self.client.get('/api/wellness/dashboard/')
+
+        with mock.patch.object(DashboardSummaryView, 'authentication_classes', [JWTAuthentication]):
+            report('dashboard (JWTAuthentication)', measure(dashboard, repeat=200))
+        report('dashboard (cached user)', measure(dashboard, repeat=200))
+        with self.trusting_claims():
+            report('dashboard (token claims)', measure(dashboard, repeat=200))
+
+
+class RevocationStoreTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'revoked.log')
+        self.store = RevocationStore(self.path)
+        self.user = User.objects.create_user(email='revoked@test.com', password='pass1234')
+        patcher = mock.patch('accounts.revocation._store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_revoked_tokens_persist_and_are_shared(self):
+        revoked, kept = token_for_user(self.user), token_for_user(self.user)
+        self.store.revoke_token(revoked)
+        self.assertTrue(self.store.is_revoked(revoked))
+        self.assertFalse(self.store.is_revoked(kept))
+
+        # A restarted (or another) process replays the file
+        other = RevocationStore(self.path)
+        self.assertTrue(other.is_revoked(revoked))
+        other.revoke_token(kept)
+        self.assertTrue(self.store.is_revoked(kept))
+
+    def test_expired_entries_are_dropped(self):
+        self.store.revoke('old-token', time.time() - 60)
+        self.store.revoke('live-token', time.time() + 60)
+        self.assertEqual(self.store.stats()['revoked_tokens'], 1)
+        self.store.compact()
+        with open(self.path) as log:
+            self.assertEqual(len(log.readlines()), 1)
+
+    def test_revoke_user_rejects_earlier_tokens(self):
+        earlier = token_for_user(self.user)
+        earlier['iat'] = int(time.time()) - 10
+        self.store.revoke_user(self.user.id)
+        later = token_for_user(self.user)
+        later['iat'] = int(time.time()) + 10
+        self.assertTrue(self.store.is_revoked(earlier))
+        self.assertFalse(self.store.is_revoked(later))
+
+    def test_concurrent_rotations_revoke_once(self):
+        refresh = token_for_user(self.user)
+        # One store per thread stands in for separate worker processes
+        stores = [RevocationStore(self.path) for _ in range(8)]
+        barrier = threading.Barrier(len(stores))
+        results = []
+
+        def rotate(store):
+            barrier.wait()
+            results.append(store.revoke_if_not_revoked(refresh))
+
+        threads = [threading.Thread(target=rotate, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+        self.assertTrue(self.store.is_revoked(refresh))
+        with open(self.path) as log:
+            self.assertEqual(len(log.readlines()), 1)
+
+    @override_settings(AUDIT_ASYNC=False)
+    def test_logout_and_rotation_revoke_tokens(self):
+        refresh = token_for_user(self.user)
+        client = APIClient()
+        response = client.post('/api/auth/token/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        # The rotated-out refresh token cannot be used again
+        self.assertEqual(client.post('/api/auth/token/refresh/', {'refresh': str(refresh)}).status_code, 401)
+
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(client.post('/api/auth/logout/', {'refresh': response.data['refresh']}).status_code, 200)
+        self.assertEqual(client.get('/api/auth/me/').status_code, 401)
+        self.assertEqual(client.post('/api/auth/token/refresh/', {'refresh': response.data['refresh']}).status_code, 401)
+
+    @benchmark
+    def test_benchmark_million_revoked_tokens(self):
+        count = 1000000
+        exp = int(time.time()) + 3600
+        with open(self.path, 'w') as log:
+            for i in range(count):
+                h1, h2 = _digest(f'jti-{i}')
+                log.write(f'j {exp + i % 86400 * 7} {h1:016x}{h2:016x}\n')
+
+        started = time.perf_counter()
+        store = RevocationStore(self.path)
+        store.stats()
+        load_seconds = time.perf_counter() - started
+        tracemalloc.start()
+        measured = RevocationStore(self.path)
+        measured.stats()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del measured
+        print(f'\n{count} revoked tokens: loaded in {load_seconds:.1f}s, {memory / 2 ** 20:.1f} MiB')
+
+        refresh = str(token_for_user(self.user))
+        serializer_data = {'refresh': refresh}
+
+        def refresh_once():
+            from .serializers import RevocableTokenRefreshSerializer
+            RevocableTokenRefreshSerializer(data=serializer_data).is_valid(raise_exception=True)
+
+        with mock.patch.object(api_settings, 'ROTATE_REFRESH_TOKENS', False):
+            for label, current in (('empty store', RevocationStore(self.path + '.empty')), ('1M revoked', store)):
+                with mock.patch('accounts.revocation._store', current):
+                    samples = measure(refresh_once, repeat=2000)
+                    report(f'refresh ({label})', samples)
+                    print(f'refresh ({label}): {1000 / (sum(samples) / len(samples)):.0f} refreshes/sec')
+
+
+@override_settings(AUDIT_ASYNC=False, PASSWORD_PBKDF2_ITERATIONS=1000, PASSWORD_SCRYPT_N=2 ** 10)
+class LoginTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='login@test.com', password='pass1234')
+        self.client = APIClient()
+
+    def login(self, password='pass1234'):
+        return self.client.post('/api/auth/login/', {'email': 'login@test.com', 'password': password})
+
+    def test_login_reuses_authenticated_user(self):
+        # User lookup and the audit row; no second fetch of the user
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['email'], 'login@test.com')
+        self.assertIn('access', response.data)
+        self.assertEqual(self.login('wrong').status_code, 401)
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password('pass1234', hasher='pbkdf2_sha1'))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with override_settings(PASSWORD_HASHERS=[
+            'accounts.hashers.ScryptPasswordHasher', 'accounts.hashers.TunedPBKDF2PasswordHasher',
+        ]):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(self.login('wrong').status_code, 401)
+
+    def test_saturated_pool_turns_logins_away(self):
+        pool = HashingPool(workers=1, queue=0)
+        pool.slots.acquire()  # another login is hashing
+        with mock.patch('accounts.hashers._pool', pool):
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    @benchmark
+    def test_benchmark_login_throughput(self):
+        policies = [
+            ('PBKDF2, 216000 iterations', {'PASSWORD_PBKDF2_ITERATIONS': 216000}),
+            ('scrypt, N=2**14', {'PASSWORD_SCRYPT_N': 2 ** 14, 'PASSWORD_HASHERS': [
+                'accounts.hashers.ScryptPasswordHasher', 'accounts.hashers.TunedPBKDF2PasswordHasher',
+            ]}),
+        ]
+        for label, policy in policies:
+            with override_settings(**policy):
+                self.user.set_password('pass1234')
+                self.user.save()
+                samples = measure(self.login, repeat=20)
+            report(f'login ({label})', samples)
+            print(f'login ({label}): {1000 / (sum(samples) / len(samples)):.1f} logins/sec per core '
+                  f'({os.cpu_count()} cores available)')
+
+
+class LoadTestCommandTest(LiveServerTestCase):
+
+    def load_test(self, path, *args):
+        out = StringIO()
+        call_command('load_test', self.live_server_url + path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_each_concurrency_level(self):
+        output = self.load_test('/api/health/faqs/', '--concurrency', '1,4', '--duration', '0.5')
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].lstrip().startswith('4 connections'))
+        self.assertIn('errors 0 (0.0%)', lines[1])
+        self.assertIn('[200: ', lines[1])
+
+        user = User.objects.create_user(email='load@test.com', password='pass1234', first_name='Load')
+        token = str(token_for_user(user).access_token)
+        output = self.load_test('/api/wellness/reminders/upcoming/', '--concurrency', '1', '--duration', '0.2',
+                                '--token', token)
+        self.assertIn('[200: ', output)
+
+    @benchmark
+    def test_benchmark_threaded_wsgi_server(self):
+        # Django's threaded test server (WSGI); run the command against
+        # gunicorn and uvicorn for the WSGI/ASGI comparison
+        print('\n' + self.load_test('/api/health/public/', '--concurrency', '1,10,50,200', '--duration', '3'))
@@ -1,8 +1,8 @@
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
-    RegisterView, CustomTokenObtainPairView, LogoutView, CurrentUserView,
-    ProfileView, ChangePasswordView, ProviderPatientsView, ProviderPatientDetailView
+    RegisterView, CustomTokenObtainPairView, RevocableTokenRefreshView, LogoutView, CurrentUserView,
+    ProfileView, ChangePasswordView, ProviderPatientsView, ProviderPatientDetailView, ProviderAnalyticsView,
+    AuditWriterStatsView, AuditLogListView, AuditLogExportView, DataExportView
 )
 
 urlpatterns = [
@@ -10,15 +10,22 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', CustomTokenObtainPairView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', RevocableTokenRefreshView.as_view(), name='token_refresh'),
     
     # User Profile
     path('me/', CurrentUserView.as_view(), name='current_user'),
     path('profile/', ProfileView.as_view(), name='profile'),
     path('change-password/', ChangePasswordView.as_view(), name='change_password'),
+    path('export/', DataExportView.as_view(), name='data_export'),
     
     # Provider endpoints
     path('provider/patients/', ProviderPatientsView.as_view(), name='provider_patients'),
     path('provider/patients/<int:patient_id>/', ProviderPatientDetailView.as_view(), name='provider_patient_detail'),
+    path('provider/analytics/', ProviderAnalyticsView.as_view(), name='provider_analytics'),
+    
+    # Compliance monitoring
+    path('audit/stats/', AuditWriterStatsView.as_view(), name='audit_writer_stats'),
+    path('audit/logs/', AuditLogListView.as_view(), name='audit_logs'),
+    path('audit/logs/export/', AuditLogExportView.as_view(), name='audit_logs_export'),
 ]
 
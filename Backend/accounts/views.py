@@ -2,14 +2,28 @@ import logging
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
+from core.pagination import KeysetPagination
+from .analytics import default_range, provider_analytics
+from .audit import get_writer
+from .authentication import token_for_user, invalidate_user
+from .revocation import get_store
+from .audit_query import filter_audit_logs, audit_page, iter_audit_rows, iter_ndjson, iter_csv
+from .data_export import export_sections, iter_export_ndjson, iter_export_zip, iter_export_fhir
 from .models import PatientProfile, ProviderProfile, AuditLog
+from .roster import RosterPagination, build_roster_context
 from .serializers import (
     UserRegistrationSerializer, UserSerializer, PatientProfileSerializer,
-    ProviderProfileSerializer, PatientListSerializer, ChangePasswordSerializer
+    ProviderProfileSerializer, PatientListSerializer, ChangePasswordSerializer,
+    ClaimsTokenObtainPairSerializer, RevocableTokenRefreshSerializer
 )
 
 User = get_user_model()
@@ -24,6 +38,21 @@ def log_action(user, action, resource=None, resource_id=None, request=None, deta
         ip_address = request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR'))
         user_agent = request.META.get('HTTP_USER_AGENT')
     
+    if settings.AUDIT_ASYNC:
+        # Spooled to disk and written in batches by the background audit writer
+        get_writer().enqueue({
+            'user_id': user.id,
+            'user_email': user.email,
+            'action': action,
+            'resource': resource,
+            'resource_id': str(resource_id) if resource_id else None,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'details': details,
+            'timestamp': timezone.now().isoformat(),
+        })
+        return
+    
     AuditLog.objects.create(
         user=user,
         action=action,
@@ -47,7 +76,7 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
         
         # Generate tokens for the new user
-        refresh = RefreshToken.for_user(user)
+        refresh = token_for_user(user)
         
         return Response({
             'message': 'Registration successful',
@@ -60,22 +89,27 @@ class RegisterView(generics.CreateAPIView):
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+    serializer_class = ClaimsTokenObtainPairSerializer
+    
     def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
         
-        if response.status_code == 200:
-            # Log successful login
-            email = request.data.get('email')
-            try:
-                user = User.objects.get(email=email)
-                log_action(user, 'login', request=request)
-                
-                # Add user data to response
-                response.data['user'] = UserSerializer(user).data
-            except User.DoesNotExist:
-                pass
+        # The serializer already authenticated the user; no need to fetch it again
+        user = serializer.user
+        log_action(user, 'login', request=request)
         
-        return response
+        return Response({
+            **serializer.validated_data,
+            'user': UserSerializer(user).data,
+        }, status=status.HTTP_200_OK)
+
+
+class RevocableTokenRefreshView(TokenRefreshView):
+    serializer_class = RevocableTokenRefreshSerializer
 
 
 class LogoutView(APIView):
@@ -85,9 +119,11 @@ class LogoutView(APIView):
         try:
             refresh_token = request.data.get('refresh')
             if refresh_token:
-                token = RefreshToken(refresh_token)
-                token.blacklist()
+                get_store().revoke_token(RefreshToken(refresh_token))
+            if request.auth is not None:
+                get_store().revoke_token(request.auth)
             
+            invalidate_user(request.user.id)
             log_action(request.user, 'logout', request=request)
             return Response({'message': 'Logged out successfully'}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -176,11 +212,25 @@ class ProviderPatientsView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        patients = PatientProfile.objects.filter(assigned_provider=request.user)
-        serializer = PatientListSerializer(patients, many=True)
+        patients = PatientProfile.objects.filter(
+            assigned_provider=request.user
+        ).select_related('user').order_by('id')
+        
+        # ?page= selects numbered pages (with a count); otherwise cursor and
+        # page_size work as on the other lists, and without either
+        # KeysetPagination returns a capped plain list
+        if 'page' in request.query_params and 'cursor' not in request.query_params:
+            paginator = RosterPagination()
+        else:
+            paginator = KeysetPagination()
+        patients = paginator.paginate_queryset(patients, request, view=self)
+        
+        serializer = PatientListSerializer(
+            patients, many=True, context=build_roster_context(patients)
+        )
         
         log_action(request.user, 'view_patient', 'PatientList', None, request)
-        return Response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class ProviderPatientDetailView(APIView):
@@ -219,3 +269,146 @@ class ProviderPatientDetailView(APIView):
             'goals': WellnessGoalSerializer(goals, many=True).data,
             'reminders': PreventiveCareReminderSerializer(reminders, many=True).data,
         })
+
+
+class ProviderAnalyticsView(APIView):
+    """
+    Completion rates, adherence distribution and week-over-week changes across
+    every patient assigned to the provider, between ?start= and ?end= (the
+    last 90 days by default)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    MAX_DAYS = 366
+    
+    def get(self, request):
+        if request.user.role != 'provider':
+            return Response(
+                {'error': 'Only healthcare providers can access this endpoint'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            end = timezone.now().date()
+            if request.query_params.get('end'):
+                end = parse_date(request.query_params['end'])
+            start = default_range(end)[0] if end else None
+            if request.query_params.get('start'):
+                start = parse_date(request.query_params['start'])
+        except ValueError:
+            start = end = None
+        if not start or not end:
+            return Response({'error': 'start and end must be YYYY-MM-DD dates'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end or (end - start).days > self.MAX_DAYS:
+            return Response(
+                {'error': f'start must be before end and at most {self.MAX_DAYS} days apart'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        log_action(request.user, 'view_patient', 'PatientAnalytics', None, request)
+        return Response(provider_analytics(request.user, start, end))
+
+
+class AuditWriterStatsView(APIView):
+    """Queue depth, flush latency and error counters of the audit writer (this process)"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        if not settings.AUDIT_ASYNC:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **get_writer().stats()})
+
+
+class AuditLogListView(APIView):
+    """Filtered, cursor-paginated audit log for compliance officers"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    
+    def get(self, request):
+        try:
+            logs = filter_audit_logs(request.query_params)
+            page_size = int(request.query_params.get('page_size', self.DEFAULT_PAGE_SIZE))
+            if not 1 <= page_size <= self.MAX_PAGE_SIZE:
+                raise ValueError(f'page_size must be between 1 and {self.MAX_PAGE_SIZE}')
+            results, next_cursor = audit_page(logs, request.query_params.get('cursor'), page_size)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'results': results, 'next_cursor': next_cursor})
+
+
+class AuditLogExportView(APIView):
+    """Stream every matching audit event as NDJSON (default) or CSV"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    FORMATS = {
+        'ndjson': (iter_ndjson, 'application/x-ndjson'),
+        'csv': (iter_csv, 'text/csv'),
+    }
+    
+    def get(self, request):
+        # Not ?format=, which DRF reserves for picking a renderer
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.FORMATS:
+            return Response({'error': 'output must be "ndjson" or "csv"'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            logs = filter_audit_logs(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        log_action(request.user, 'export_data', 'AuditLog', None, request,
+                   details={key: value for key, value in request.query_params.items()})
+        
+        encode, content_type = self.FORMATS[output]
+        response = StreamingHttpResponse(encode(iter_audit_rows(logs)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="audit-log.{output}"'
+        return response
+
+
+class DataExportView(APIView):
+    """
+    Stream everything stored about a patient as NDJSON (default), a ZIP of CSV
+    files or a FHIR-like bundle. Patients export their own data; providers
+    pass ?patient=<patient profile id> for a patient assigned to them.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    FORMATS = {
+        'ndjson': (iter_export_ndjson, 'application/x-ndjson', 'ndjson'),
+        'csv': (iter_export_zip, 'application/zip', 'zip'),
+        'fhir': (iter_export_fhir, 'application/fhir+json', 'json'),
+    }
+    
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.FORMATS:
+            return Response({'error': 'output must be "ndjson", "csv" or "fhir"'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        patient = request.user
+        patient_id = request.query_params.get('patient')
+        if patient_id is not None:
+            if request.user.role != 'provider':
+                return Response(
+                    {'error': "Only healthcare providers can export another patient's data"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            if not patient_id.isdigit():
+                return Response({'error': 'patient must be a patient profile id'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                patient = PatientProfile.objects.select_related('user').get(
+                    id=int(patient_id), assigned_provider=request.user
+                ).user
+            except PatientProfile.DoesNotExist:
+                return Response(
+                    {'error': 'Patient not found or not assigned to you'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        log_action(request.user, 'export_data', 'User', patient.id, request, details={'output': output})
+        
+        encode, content_type, extension = self.FORMATS[output]
+        response = StreamingHttpResponse(encode(export_sections(patient)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="patient-{patient.id}-export.{extension}"'
+        return response
@@ -0,0 +1,85 @@
+"""
+Async (ASGI) variants of the read-heavy endpoints.
+
+Under ASGI a sync DRF view holds a worker thread for the whole request,
+including the time spent waiting on MongoDB. Views built with read_view run
+on the event loop instead: the user comes from the auth cache (or the token's
+claims), queries go through Motor (core.mongo.get_async_collection), and only
+fallbacks - auth cache misses, non-Mongo databases, Motor not installed - are
+handed to a thread with run_sync.
+
+ASYNC_READ_ROUTES selects which routes are served by their async variant (see
+read_route in the urls); the others keep the sync view. Enable them when
+serving core.asgi: under WSGI every async view gets an event loop of its own.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.http.response import HttpResponseBase
+from django.urls import path
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from accounts.authentication import CachedJWTAuthentication
+
+
+def run_sync(func, *args, **kwargs):
+    """Await func(*args, **kwargs) on a worker thread, closing its connection like a sync request would"""
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def _error_response(exc):
+    detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+    response = JsonResponse(detail, status=exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response['WWW-Authenticate'] = CachedJWTAuthentication().authenticate_header(None)
+    return response
+
+
+def read_view(public=False, trust_token_claims=False):
+    """
+    Decorator for an `async def view(request, ...)` returning JSON-serializable
+    data or an HttpResponse. Only GET and HEAD are allowed. request.user is
+    set from the request's JWT (see CachedJWTAuthentication), which only
+    `public` views may omit. Errors are rendered the way DRF renders them.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return JsonResponse(
+                    {'detail': f'Method "{request.method}" not allowed.'},
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED
+                )
+            try:
+                result = await CachedJWTAuthentication().authenticate_async(
+                    request, trust_claims=trust_token_claims
+                )
+                if result is None and not public:
+                    raise NotAuthenticated()
+                # Replaces the session user, which could only be loaded synchronously
+                request.user, request.auth = result or (AnonymousUser(), None)
+                data = await view(request, *args, **kwargs)
+            except APIException as e:
+                return _error_response(e)
+            if isinstance(data, HttpResponseBase):
+                return data
+            return JsonResponse(data, safe=False, encoder=DjangoJSONEncoder)
+        return wrapper
+    return decorator
+
+
+def read_route(route, sync_view, async_view, name):
+    """path() to async_view if `name` is in ASYNC_READ_ROUTES ('*' for all), else to sync_view"""
+    routes = settings.ASYNC_READ_ROUTES
+    return path(route, async_view if '*' in routes or name in routes else sync_view, name=name)
@@ -0,0 +1,31 @@
+"""
+Helpers for the benchmark tests in each app's tests.py.
+
+Benchmarks are skipped by default because they seed large data sets. Run them with
+    RUN_BENCHMARKS=1 python manage.py test
+"""
+import os
+import statistics
+import time
+from unittest import skipUnless
+
+benchmark = skipUnless(os.getenv('RUN_BENCHMARKS'), 'set RUN_BENCHMARKS=1 to run benchmarks')
+
+
+def measure(func, repeat=20):
+    """Call func `repeat` times and return the latencies in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    """Print p50/p99 for a list of millisecond latencies and return the p50"""
+    ordered = sorted(samples)
+    p50 = statistics.median(ordered)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f'\n{label}: p50 {p50:.2f}ms, p99 {p99:.2f}ms over {len(samples)} runs')
+    return p50
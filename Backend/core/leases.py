@@ -0,0 +1,56 @@
+"""
+Leases that let one node at a time run a periodic job.
+
+A lease is a JobLease row naming the job, its owner and when it expires. A
+node takes it if it is free or expired, renews it while working and releases
+it when done; if the node dies, the lease expires and another may take over.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from wellness.models import JobLease
+
+DEFAULT_TTL_SECONDS = 300
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Lease:
+    """A named lease in JobLease, held for `ttl` seconds and renewed while working"""
+
+    def __init__(self, name, ttl=None, owner=None):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl or DEFAULT_TTL_SECONDS)
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    def acquire(self):
+        """Take the lease if it is free or expired; returns whether it is held"""
+        now = timezone.now()
+        try:
+            JobLease.objects.get_or_create(name=self.name, defaults={'expires_at': now})
+        except IntegrityError:
+            pass  # Created by another node just now
+        return bool(JobLease.objects.filter(
+            Q(expires_at__lte=now) | Q(owner=self.owner), name=self.name
+        ).update(owner=self.owner, expires_at=now + self.ttl))
+
+    def renew(self):
+        if not JobLease.objects.filter(name=self.name, owner=self.owner).update(expires_at=timezone.now() + self.ttl):
+            raise LeaseLost(f'Lease {self.name} was taken over')
+
+    def release(self):
+        JobLease.objects.filter(name=self.name, owner=self.owner).update(expires_at=timezone.now())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
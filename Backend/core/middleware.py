@@ -0,0 +1,36 @@
+import logging
+
+from django.conf import settings
+
+from .mongo_pool import POOL_LISTENER
+
+logger = logging.getLogger(__name__)
+
+
+class MongoPoolMiddleware:
+    """
+    Attribute MongoDB pool checkouts to the request: adds a db-pool entry to
+    Server-Timing and logs requests that waited longer than
+    MONGODB_POOL_WAIT_WARN_MS for connections.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = POOL_LISTENER.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            usage = POOL_LISTENER.end_request(token)
+
+        if usage['checkouts'] or usage['failures']:
+            timing = f'db-pool;dur={usage["wait_ms"]:.1f};desc="{usage["checkouts"]} checkouts"'
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        if usage['failures'] or usage['wait_ms'] > settings.MONGODB_POOL_WAIT_WARN_MS:
+            logger.warning(
+                'MongoDB pool: %s %s waited %.1fms for %d connections (%d checkouts timed out)',
+                request.method, request.path, usage['wait_ms'], usage['checkouts'], usage['failures']
+            )
+        return response
@@ -0,0 +1,95 @@
+"""
+Access to the raw pymongo collections behind Djongo models.
+
+Djongo translates the ORM's SQL into MongoDB commands but cannot express
+server-side updates such as ``$inc``. Code that needs them uses these helpers
+and keeps an ORM fallback for non-Mongo databases.
+
+get_async_collection gives async views the same collections through Motor,
+when it is installed; from_document turns the raw documents back into model
+instances for the existing serializers.
+"""
+import asyncio
+import datetime
+import threading
+import weakref
+
+from bson import Decimal128
+from django.conf import settings
+from django.db import connections, models
+from django.utils import timezone
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # Optional: async views then run their ORM queries on threads
+    AsyncIOMotorClient = None
+
+
+def is_mongo(using='default'):
+    return connections[using].vendor == 'djongo'
+
+
+def get_collection(model, using='default'):
+    """Return the pymongo Collection for `model`, or None when not running on Djongo"""
+    connection = connections[using]
+    if connection.vendor != 'djongo':
+        return None
+    connection.ensure_connection()
+    # For Djongo the underlying connection is a pymongo Database
+    return connection.connection[model._meta.db_table]
+
+
+def mongo_date(value):
+    """Djongo stores DateFields as naive datetimes at midnight"""
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+def mongo_datetime(value):
+    """Djongo stores DateTimeFields as naive UTC datetimes"""
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, datetime.timezone.utc)
+    return value
+
+
+# Motor clients are bound to the event loop they were created on, so keep one
+# (with its connection pool) per loop; an ASGI server runs a single loop
+_async_databases = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+
+
+def get_async_collection(model, using='default'):
+    """Return the Motor collection for `model`, or None without Motor or Djongo"""
+    if AsyncIOMotorClient is None or not is_mongo(using):
+        return None
+    loop = asyncio.get_running_loop()
+    with _async_lock:
+        databases = _async_databases.setdefault(loop, {})
+        if using not in databases:
+            config = settings.DATABASES[using]
+            client = AsyncIOMotorClient(**config.get('CLIENT', {}), io_loop=loop)
+            databases[using] = client[config['NAME']]
+        return databases[using][model._meta.db_table]
+
+
+def from_document(model, document, using='default'):
+    """Build a `model` instance from a raw document of its collection"""
+    connection = connections[using]
+    fields = model._meta.concrete_fields
+    values = []
+    for field in fields:
+        value = document.get(field.column)
+        if isinstance(value, Decimal128):
+            value = value.to_decimal()
+        elif isinstance(field, models.DateTimeField):
+            if value is not None and settings.USE_TZ:
+                value = timezone.make_aware(value, datetime.timezone.utc)
+        elif isinstance(field, models.DateField):
+            if isinstance(value, datetime.datetime):
+                value = value.date()
+        elif isinstance(field, models.TimeField):
+            if isinstance(value, datetime.datetime):
+                value = value.time()
+        elif isinstance(value, str) and hasattr(field, 'from_db_value'):
+            value = field.from_db_value(value, None, connection)
+        values.append(value)
+    return model.from_db(using, [field.attname for field in fields], values)
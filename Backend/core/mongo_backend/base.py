@@ -0,0 +1,45 @@
+"""
+Djongo backend that keeps one MongoClient - and so one connection pool - per
+database alias for the life of the process.
+
+Djongo caches its clients by database name, so the 'secondary' alias would get
+the primary's client and read preference, and closes the client whenever Django
+closes a connection: at the end of every request, and after each section of a
+parallel dashboard (wellness.dashboard). Every request then built and tore down
+its own pool, and MONGODB_CLIENT_OPTIONS (maxPoolSize, minPoolSize,
+maxIdleTimeMS, waitQueueTimeoutMS) never applied across requests. Here every
+thread's connection for an alias shares that alias's client, and closing a
+connection leaves the pool open.
+"""
+import threading
+from collections import OrderedDict
+
+from djongo import base
+from pymongo import MongoClient
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(alias, options):
+    """The process-wide MongoClient for `alias`, created with `options` on first use"""
+    with _lock:
+        if alias not in _clients:
+            _clients[alias] = MongoClient(**options, connect=False)
+        return _clients[alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, connection_params):
+        name = connection_params.pop('name')
+        enforce_schema = connection_params.pop('enforce_schema')
+        connection_params['document_class'] = OrderedDict
+        self.client_connection = get_client(self.alias, connection_params)
+        database = self.client_connection[name]
+        self.djongo_connection = base.DjongoClient(database, enforce_schema)
+        return database
+
+    def _close(self):
+        # The client and its pool are shared by every thread using this alias
+        pass
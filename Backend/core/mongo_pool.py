@@ -0,0 +1,112 @@
+"""
+Instrumentation of the MongoDB connection pools.
+
+POOL_LISTENER is passed to every MongoClient through MONGODB_CLIENT_OPTIONS
+(see settings). It counts connections and checkouts, and measures how long
+operations wait for a pooled connection - overall for this process, and for
+the request being served when core.middleware.MongoPoolMiddleware has opened
+a request scope. Waits show up in the Server-Timing header of the response
+and in the admin pool-stats endpoint.
+
+This module only depends on pymongo so settings can import it.
+"""
+import contextvars
+import threading
+import time
+
+from pymongo import monitoring
+
+_request = contextvars.ContextVar('mongo_pool_request', default=None)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = threading.local()  # Checkout start, per thread doing the operation
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {
+                'pools': 0, 'connections_open': 0, 'connections_created': 0, 'checked_out': 0,
+                'checkouts': 0, 'checkout_failures': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+            }
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['wait_ms_avg'] = round(stats['wait_ms_total'] / stats['checkouts'], 3) if stats['checkouts'] else 0
+        return stats
+
+    def _add(self, **changes):
+        with self._lock:
+            for name, change in changes.items():
+                self._stats[name] += change
+
+    # Request scope
+
+    @staticmethod
+    def start_request():
+        """Begin counting for the current request; returns the token for end_request()"""
+        return _request.set({'checkouts': 0, 'failures': 0, 'wait_ms': 0.0})
+
+    @staticmethod
+    def end_request(token):
+        """The current request's {'checkouts', 'failures', 'wait_ms'}"""
+        usage = _request.get()
+        _request.reset(token)
+        return usage
+
+    # ConnectionPoolListener
+
+    def pool_created(self, event):
+        self._add(pools=1)
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self._add(pools=-1)
+
+    def connection_created(self, event):
+        self._add(connections_open=1, connections_created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(connections_open=-1)
+
+    def connection_check_out_started(self, event):
+        self._started.value = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        # Usually waitQueueTimeoutMS running out on an exhausted pool
+        self._started.value = None
+        usage = _request.get()
+        with self._lock:
+            self._stats['checkout_failures'] += 1
+            if usage is not None:
+                usage['failures'] += 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._started, 'value', None)
+        wait = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+        self._started.value = None
+        usage = _request.get()
+        with self._lock:
+            self._stats['checked_out'] += 1
+            self._stats['checkouts'] += 1
+            self._stats['wait_ms_total'] += wait
+            self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait)
+            if usage is not None:
+                # Shared with threads the request fans out to (wellness.dashboard)
+                usage['checkouts'] += 1
+                usage['wait_ms'] += wait
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
+
+POOL_LISTENER = PoolMetrics()
@@ -0,0 +1,156 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Pages are addressed with an opaque cursor - the ordering values of the last
+row returned - and the next page is the rows after that position, so a deep
+page costs an index seek instead of skipping every row before it, and rows
+added or removed between requests do not shift pages. The ordering is the
+queryset's (explicit order_by or the model's Meta.ordering) with the primary
+key appended as a tie-breaker.
+
+Pages are returned when the request has a `cursor` (empty for the first page)
+or a `page_size` parameter. `count=true` adds the total number of rows, which
+costs a COUNT query and is only run when asked for. Other requests still
+receive a plain list for existing clients, but at most
+PAGINATION_UNPAGINATED_LIMIT rows of it; a cut-off list carries a
+`Link: <...>; rel="next"` header to the page after it.
+
+NULLs are taken to sort before every value, as they do on SQLite and MongoDB.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    # isoformat() keeps microseconds, which DjangoJSONEncoder would truncate
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def encode_cursor(values):
+    position = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    """The ordering values in `cursor`, converted by the model `fields`; ValueError if invalid"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def keyset_after(queryset, ordering, values):
+    """Rows of `queryset` that come after the row with ordering `values`"""
+    conditions = []
+    equal = Q()
+    for name, value in zip(ordering, values):
+        descending = name.startswith('-')
+        field = name.lstrip('-')
+        if value is None:
+            # After a NULL come the other values ascending, nothing descending
+            beyond = None if descending else Q(**{f'{field}__isnull': False})
+            same = Q(**{f'{field}__isnull': True})
+        else:
+            beyond = Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+            if descending:
+                beyond |= Q(**{f'{field}__isnull': True})
+            same = Q(**{field: value})
+        if beyond is not None:
+            conditions.append(equal & beyond)
+        equal &= same
+    if not conditions:
+        return queryset.none()
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition |= other
+    return queryset.filter(condition)
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+
+    def __init__(self):
+        self.page_size = settings.PAGINATION_PAGE_SIZE
+        self.max_page_size = settings.PAGINATION_MAX_PAGE_SIZE
+        self.unpaginated_limit = settings.PAGINATION_UNPAGINATED_LIMIT
+
+    def requested(self, request):
+        return self.cursor_query_param in request.query_params or self.page_size_query_param in request.query_params
+
+    def get_ordering(self, queryset):
+        """Ordering of `queryset` with the primary key as tie-breaker"""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering or not all(isinstance(name, str) and '__' not in name for name in ordering):
+            raise ImproperlyConfigured(f'{queryset.model.__name__} lists need an ordering of plain field names')
+        ordering = [name[:-2] + 'pk' if name.lstrip('-') == 'id' else name for name in ordering]
+        if not any(name.lstrip('-') == 'pk' for name in ordering):
+            ordering.append('-pk' if ordering[0].startswith('-') else 'pk')
+        return ordering
+
+    def get_page_size(self, request):
+        if not self.requested(request):
+            return self.unpaginated_limit
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.paginated = self.requested(request)
+        ordering = self.get_ordering(queryset)
+        names = [name.lstrip('-') for name in ordering]
+        fields = [queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name) for name in names]
+        queryset = queryset.order_by(*ordering)
+
+        self.count = None
+        if self.paginated and request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                queryset = keyset_after(queryset, ordering, decode_cursor(cursor, fields))
+            except ValueError as e:
+                raise ParseError(str(e))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = encode_cursor([getattr(rows[-1], name) for name in names])
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.paginated:
+            next_link = self.get_next_link()
+            return Response(data, headers={'Link': f'<{next_link}>; rel="next"'} if next_link else None)
+        page = OrderedDict()
+        if self.count is not None:
+            page['count'] = self.count
+        page['next'] = self.get_next_link()
+        page['next_cursor'] = self.next_cursor
+        page['results'] = data
+        return Response(page)
@@ -0,0 +1,147 @@
+"""
+Query plans of the API's hot queries.
+
+hot_queries() lists the filters and orderings the views run on every request,
+each as an ORM queryset and as the equivalent MongoDB find. find_scans()
+explains a query on the configured database and reports the tables or
+collections it reads without any index. check_query_plans runs every entry and
+fails on any scan, so a missing Meta.indexes entry is caught before it reaches
+a large collection.
+"""
+import re
+from collections import namedtuple
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core.mongo import get_collection, mongo_date, mongo_datetime
+
+HotQuery = namedtuple('HotQuery', ['label', 'queryset', 'filter', 'sort'])
+
+# Sample values; plans depend on the shape of a query, not on its values
+USER_ID = 1
+GOAL_ID = 1
+REMINDER_ID = 1
+
+
+def hot_queries():
+    from accounts.models import AuditLog, PatientProfile
+    from health_info.models import HealthArticle, FAQ, PrivacyPolicy
+    from wellness.models import (
+        WellnessGoal, DailyGoalLog, PreventiveCareReminder, WellnessDailyRollup
+    )
+
+    today = timezone.now().date()
+    start = today - timedelta(days=30)
+    since = timezone.now() - timedelta(days=30)
+    return [
+        # wellness
+        HotQuery('goals for a day', WellnessGoal.objects.filter(user_id=USER_ID, date=today),
+                 {'user_id': USER_ID, 'date': mongo_date(today)}, None),
+        HotQuery('goals by type', WellnessGoal.objects.filter(user_id=USER_ID, goal_type='steps'),
+                 {'user_id': USER_ID, 'goal_type': 'steps'}, None),
+        HotQuery('goal history', WellnessGoal.objects.filter(user_id=USER_ID).order_by('-date')[:10],
+                 {'user_id': USER_ID}, [('date', -1)]),
+        HotQuery('recurring goals to roll over',
+                 WellnessGoal.objects.filter(is_recurring=True, date__gte=start, date__lt=today),
+                 {'is_recurring': True, 'date': {'$gte': mongo_date(start), '$lt': mongo_date(today)}}, None),
+        HotQuery('goal logs', DailyGoalLog.objects.filter(goal_id=GOAL_ID).order_by('-logged_at'),
+                 {'goal_id': GOAL_ID}, [('logged_at', -1)]),
+        HotQuery('upcoming reminders',
+                 PreventiveCareReminder.objects.filter(
+                     user_id=USER_ID, status='upcoming', scheduled_date__gte=today
+                 ).order_by('scheduled_date')[:5],
+                 {'user_id': USER_ID, 'status': 'upcoming', 'scheduled_date': {'$gte': mongo_date(today)}},
+                 [('scheduled_date', 1)]),
+        HotQuery('reminder calendar',
+                 PreventiveCareReminder.objects.filter(
+                     user_id=USER_ID, scheduled_date__gte=today, scheduled_date__lte=today + timedelta(days=30)
+                 ),
+                 {'user_id': USER_ID,
+                  'scheduled_date': {'$gte': mongo_date(today), '$lte': mongo_date(today + timedelta(days=30))}},
+                 [('scheduled_date', 1), ('scheduled_time', 1)]),
+        HotQuery('reminder series', PreventiveCareReminder.objects.filter(recurrence_of=REMINDER_ID),
+                 {'recurrence_of': REMINDER_ID}, None),
+        HotQuery('reminders due',
+                 PreventiveCareReminder.objects.filter(
+                     status='upcoming', scheduled_date__gte=start, scheduled_date__lte=today
+                 ),
+                 {'status': 'upcoming', 'scheduled_date': {'$gte': mongo_date(start), '$lte': mongo_date(today)}},
+                 [('scheduled_date', 1), ('scheduled_time', 1)]),
+        HotQuery('overdue reminders',
+                 PreventiveCareReminder.objects.filter(
+                     status='upcoming', scheduled_date__lt=today
+                 ).order_by('scheduled_date')[:1000],
+                 {'status': 'upcoming', 'scheduled_date': {'$lt': mongo_date(today)}},
+                 [('scheduled_date', 1)]),
+        HotQuery('reminders changed', PreventiveCareReminder.objects.filter(updated_at__gte=since),
+                 {'updated_at': {'$gte': mongo_datetime(since)}}, [('scheduled_date', 1), ('scheduled_time', 1)]),
+        HotQuery('reminders by status', PreventiveCareReminder.objects.filter(user_id=USER_ID, status='missed'),
+                 {'user_id': USER_ID, 'status': 'missed'}, None),
+        HotQuery('rollup trends',
+                 WellnessDailyRollup.objects.filter(user_id=USER_ID, date__gte=start, date__lte=today),
+                 {'user_id': USER_ID, 'date': {'$gte': mongo_date(start), '$lte': mongo_date(today)}}, None),
+        # health_info
+        HotQuery('published articles', HealthArticle.objects.filter(is_published=True)[:20],
+                 {'is_published': True}, [('created_at', -1)]),
+        HotQuery('articles by category', HealthArticle.objects.filter(is_published=True, category='covid')[:20],
+                 {'is_published': True, 'category': 'covid'}, [('created_at', -1)]),
+        HotQuery('featured articles', HealthArticle.objects.filter(is_published=True, is_featured=True)[:6],
+                 {'is_published': True, 'is_featured': True}, [('created_at', -1)]),
+        HotQuery('active FAQs', FAQ.objects.filter(is_active=True)[:5],
+                 {'is_active': True}, [('order', 1), ('created_at', -1)]),
+        HotQuery('FAQs by category', FAQ.objects.filter(is_active=True, category='general'),
+                 {'is_active': True, 'category': 'general'}, [('order', 1)]),
+        HotQuery('active privacy policy', PrivacyPolicy.objects.filter(is_active=True)[:1],
+                 {'is_active': True}, [('effective_date', -1)]),
+        # accounts
+        HotQuery('provider roster', PatientProfile.objects.filter(assigned_provider_id=USER_ID).order_by('id'),
+                 {'assigned_provider_id': USER_ID}, [('id', 1)]),
+        HotQuery('audit log by user', AuditLog.objects.filter(user_id=USER_ID, timestamp__gte=since)[:100],
+                 {'user_id': USER_ID, 'timestamp': {'$gte': since}}, [('timestamp', -1)]),
+        HotQuery('audit log by action', AuditLog.objects.filter(action='login')[:100],
+                 {'action': 'login'}, [('timestamp', -1)]),
+        HotQuery('audit log by resource',
+                 AuditLog.objects.filter(resource='PatientProfile', resource_id='1')[:100],
+                 {'resource': 'PatientProfile', 'resource_id': '1'}, [('timestamp', -1)]),
+    ]
+
+
+# SQLite: "SCAN table [USING INDEX name]"; PostgreSQL: "Seq Scan on table"
+SQL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)( USING (?:COVERING )?INDEX)?|Seq Scan on (\w+)')
+
+
+def _mongo_stages(plan):
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _mongo_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _mongo_stages(child)
+
+
+def explain(query, using='default'):
+    """The database's plan for `query` as text"""
+    collection = get_collection(query.queryset.model, using)
+    if collection is None:
+        return query.queryset.using(using).explain()
+    command = {'find': collection.name, 'filter': query.filter}
+    if query.sort:
+        command['sort'] = dict(query.sort)
+    result = collection.database.command('explain', command, verbosity='queryPlanner')
+    return result['queryPlanner']['winningPlan']
+
+
+def find_scans(query, using='default'):
+    """(plan, scanned tables or collections) for `query`"""
+    plan = explain(query, using)
+    if isinstance(plan, dict):
+        scans = [query.queryset.model._meta.db_table] if 'COLLSCAN' in _mongo_stages(plan) else []
+        return plan, scans
+    # Walking a whole index in order is fine when the query stops at a LIMIT
+    limited = query.queryset.query.high_mark is not None
+    return plan, [
+        table or seq_table
+        for table, via_index, seq_table in SQL_SCAN.findall(plan)
+        if not (via_index and limited)
+    ]
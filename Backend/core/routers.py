@@ -0,0 +1,32 @@
+from django.conf import settings
+
+SECONDARY = 'secondary'
+
+
+def read_alias():
+    """'secondary' when secondary reads are configured (MONGODB_SECONDARY_READS), else 'default'"""
+    return SECONDARY if SECONDARY in settings.DATABASES else 'default'
+
+
+class SecondaryReadRouter:
+    """
+    Reads of models in SECONDARY_READ_APPS go to the 'secondary' alias (read
+    preference secondaryPreferred) when it is configured. Everything else,
+    and every write, uses 'default'.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in settings.SECONDARY_READ_APPS:
+            return read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Not the instance's alias: objects read from a secondary are saved to the primary
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != SECONDARY
@@ -7,6 +7,8 @@ from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
 
+from core.mongo_pool import POOL_LISTENER
+
 load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MongoPoolMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -69,36 +72,176 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# Routes (by URL name) served by their async variant, for ASGI deployments such
+# as `uvicorn core.asgi:application`; '*' selects all. See core.async_views.
+# Their MongoDB queries use Motor (pip install "motor<3") when it is installed.
+ASYNC_READ_ROUTES = [name for name in os.getenv('ASYNC_READ_ROUTES', '').split(',') if name]
+
 # Database - MongoDB with Djongo
 # For MongoDB Atlas, set MONGODB_URI in .env
 # For local MongoDB, set MONGODB_HOST and MONGODB_PORT
 MONGODB_URI = os.getenv('MONGODB_URI', '')
 
+# pymongo client options shared by every connection. The core.mongo_backend
+# engine keeps one client per database alias for the life of each worker
+# process, so the server sees up to workers x aliases x maxPoolSize
+# connections; size them for the cluster's limit.
+MONGODB_CLIENT_OPTIONS = {
+    'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', 20)),
+    'minPoolSize': int(os.getenv('MONGODB_MIN_POOL_SIZE', 0)),
+    'maxIdleTimeMS': int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 60000)),
+    # Fail fast with an error instead of queueing forever when the pool is exhausted
+    'waitQueueTimeoutMS': int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+    'connectTimeoutMS': int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000)),
+    'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'retryWrites': os.getenv('MONGODB_RETRY_WRITES', 'True') == 'True',
+    'compressors': os.getenv('MONGODB_COMPRESSORS', 'zlib'),  # 'zstd,zlib' needs the zstandard package
+    'event_listeners': [POOL_LISTENER],  # Checkout counts and waits, see core.mongo_pool
+}
 if MONGODB_URI:
     # MongoDB Atlas (Cloud)
-    DATABASES = {
-        'default': {
-            'ENGINE': 'djongo',
-            'NAME': os.getenv('MONGODB_NAME', 'healthcare_portal'),
-            'ENFORCE_SCHEMA': False,
-            'CLIENT': {
-                'host': MONGODB_URI,
-            }
-        }
-    }
+    MONGODB_CLIENT = {'host': MONGODB_URI, **MONGODB_CLIENT_OPTIONS}
 else:
     # Local MongoDB
-    DATABASES = {
-        'default': {
-            'ENGINE': 'djongo',
-            'NAME': os.getenv('MONGODB_NAME', 'healthcare_portal'),
-            'ENFORCE_SCHEMA': False,
-            'CLIENT': {
-                'host': os.getenv('MONGODB_HOST', 'localhost'),
-                'port': int(os.getenv('MONGODB_PORT', 27017)),
-            }
-        }
+    MONGODB_CLIENT = {
+        'host': os.getenv('MONGODB_HOST', 'localhost'),
+        'port': int(os.getenv('MONGODB_PORT', 27017)),
+        **MONGODB_CLIENT_OPTIONS,
+    }
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'core.mongo_backend',  # djongo with a shared client per alias
+        'NAME': os.getenv('MONGODB_NAME', 'healthcare_portal'),
+        'ENFORCE_SCHEMA': False,
+        'CLIENT': MONGODB_CLIENT,
+    }
+}
+
+# With MONGODB_SECONDARY_READS, public health_info content and trends are read
+# from secondaries through the 'secondary' alias (see core.routers); they can
+# lag the primary by up to MONGODB_MAX_STALENESS_SECONDS
+if os.getenv('MONGODB_SECONDARY_READS', 'False') == 'True':
+    DATABASES['secondary'] = {
+        **DATABASES['default'],
+        'CLIENT': {
+            **MONGODB_CLIENT,
+            'readPreference': 'secondaryPreferred',
+            'maxStalenessSeconds': int(os.getenv('MONGODB_MAX_STALENESS_SECONDS', 90)),
+        },
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['core.routers.SecondaryReadRouter']
+SECONDARY_READ_APPS = ['health_info']
+
+# Requests that wait longer than this for pooled connections are logged
+MONGODB_POOL_WAIT_WARN_MS = float(os.getenv('MONGODB_POOL_WAIT_WARN_MS', 100))
+
+# Caches
+# Public health_info responses use their own cache: an in-process LRU by default,
+# where content changes reach other worker processes only as their entries expire
+# (HEALTH_INFO_CACHE_TIMEOUT). Point HEALTH_INFO_CACHE_BACKEND at FileBasedCache
+# (with HEALTH_INFO_CACHE_LOCATION set to a directory) or a Redis backend to share
+# it, and its invalidation, between worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'health_info': {
+        'BACKEND': os.getenv('HEALTH_INFO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('HEALTH_INFO_CACHE_LOCATION', 'health-info'),
+        'TIMEOUT': int(os.getenv('HEALTH_INFO_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    # Users resolved from JWTs (accounts.authentication). Kept per process by
+    # default and short-lived, so other processes see changes within the TTL;
+    # AUTH_TRUST_TOKEN_CLAIMS needs it shared (e.g. django_redis or
+    # DatabaseCache) and is ignored otherwise
+    'auth': {
+        'BACKEND': os.getenv('AUTH_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('AUTH_CACHE_LOCATION', 'auth-users'),
+        'TIMEOUT': int(os.getenv('AUTH_USER_CACHE_TTL', 60)),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Provider panel analytics (accounts.analytics), recomputed after the TTL.
+    # precompute_provider_analytics fills it ahead of requests, which needs a
+    # backend shared by the web workers (e.g. FileBasedCache or Redis); with
+    # the default LocMemCache the command refuses to run
+    'analytics': {
+        'BACKEND': os.getenv('ANALYTICS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('ANALYTICS_CACHE_LOCATION', 'provider-analytics'),
+        'TIMEOUT': int(os.getenv('ANALYTICS_CACHE_TTL', 300)),
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+HEALTH_INFO_CACHE_ENABLED = os.getenv('HEALTH_INFO_CACHE_ENABLED', 'True') == 'True'
+
+# Categories shown by the "latest articles" homepage section
+HEALTH_INFO_LATEST_CATEGORIES = ['covid', 'flu', 'mental_health']
+
+# Article/FAQ search index (health_info.search), loaded from this file; only
+# rebuild_search_index writes it (at deploy, then periodically with --if-stale)
+HEALTH_SEARCH_INDEX_FILE = os.getenv('HEALTH_SEARCH_INDEX_FILE', str(BASE_DIR / 'logs' / 'health_search.idx'))
+
+# Tip of the day (wellness.tips): active tip ids are cached per process and
+# reloaded after this long; with HEALTH_TIP_PER_USER users get different tips
+HEALTH_TIP_CACHE_SECONDS = int(os.getenv('HEALTH_TIP_CACHE_SECONDS', 300))
+HEALTH_TIP_PER_USER = os.getenv('HEALTH_TIP_PER_USER', 'False') == 'True'
+
+# Recurring reminders (wellness.recurrence): occurrences are created this many
+# days ahead, at most this many upcoming per series
+REMINDER_HORIZON_DAYS = int(os.getenv('REMINDER_HORIZON_DAYS', 365))
+REMINDER_HORIZON_OCCURRENCES = int(os.getenv('REMINDER_HORIZON_OCCURRENCES', 12))
+
+# Overdue reminders (wellness.sweeper, run by sweep_overdue_reminders): still
+# upcoming this many days after their date they become missed. A sweep holds a
+# lease for this long, renewed every batch, so one node sweeps at a time.
+REMINDER_MISSED_AFTER_DAYS = int(os.getenv('REMINDER_MISSED_AFTER_DAYS', 1))
+REMINDER_SWEEP_LEASE_SECONDS = int(os.getenv('REMINDER_SWEEP_LEASE_SECONDS', 300))
+
+# Due-reminder notifications (wellness.notifications, sent by the
+# dispatch_reminder_notifications command). Every notification goes to each
+# channel: BACKEND is a wellness.notifications.Channel taking OPTIONS, with up
+# to CONCURRENCY batches in flight and MAX_ATTEMPTS tries per batch. The
+# reminders of a batch that still failed are sent again after
+# REMINDER_DISPATCH_RETRY_SECONDS, for as long as the dispatcher runs.
+# Reminders without a scheduled_time are due at REMINDER_DEFAULT_TIME.
+REMINDER_DEFAULT_TIME = os.getenv('REMINDER_DEFAULT_TIME', '09:00')
+REMINDER_DISPATCH_LOOKAHEAD_HOURS = int(os.getenv('REMINDER_DISPATCH_LOOKAHEAD_HOURS', 24))
+REMINDER_DISPATCH_CATCHUP_HOURS = int(os.getenv('REMINDER_DISPATCH_CATCHUP_HOURS', 24))
+REMINDER_DISPATCH_RETRY_SECONDS = int(os.getenv('REMINDER_DISPATCH_RETRY_SECONDS', 300))
+REMINDER_NOTIFICATION_BATCH_SIZE = int(os.getenv('REMINDER_NOTIFICATION_BATCH_SIZE', 500))
+REMINDER_NOTIFICATION_CHANNELS = {
+    'file': {
+        'BACKEND': 'wellness.notifications.FileChannel',
+        'OPTIONS': {'path': os.getenv(
+            'REMINDER_NOTIFICATION_FILE', str(BASE_DIR / 'logs' / 'reminder_notifications.jsonl')
+        )},
+    },
+}
+if os.getenv('REMINDER_WEBHOOK_URL'):
+    REMINDER_NOTIFICATION_CHANNELS['webhook'] = {
+        'BACKEND': 'wellness.notifications.WebhookChannel',
+        'OPTIONS': {'url': os.getenv('REMINDER_WEBHOOK_URL')},
+        'CONCURRENCY': int(os.getenv('REMINDER_WEBHOOK_CONCURRENCY', 4)),
+    }
+if os.getenv('REMINDER_EMAIL_NOTIFICATIONS', 'False') == 'True':
+    REMINDER_NOTIFICATION_CHANNELS['email'] = {
+        'BACKEND': 'wellness.notifications.EmailChannel',
+        'CONCURRENCY': int(os.getenv('REMINDER_EMAIL_CONCURRENCY', 2)),
+    }
+
+# Outgoing email; defaults to a local SMTP server, e.g. python -m smtpd -n -c DebuggingServer localhost:1025
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 1025))
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'reminders@localhost')
+
+# With DASHBOARD_PARALLEL, dashboard/v2/ fetches its sections concurrently on a
+# shared thread pool (wellness.dashboard), each pool thread keeping a database
+# connection. Off by default: the gain over running them in turn has not been
+# measured against mongod.
+DASHBOARD_PARALLEL = os.getenv('DASHBOARD_PARALLEL', 'False') == 'True'
+DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', 16))
 
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
@@ -119,6 +262,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (accounts.hashers). PASSWORD_HASHER is used for new passwords;
+# the others stay listed so existing hashes verify and are upgraded on login.
+# Tune the cost with `python manage.py calibrate_password_hasher`.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2')  # pbkdf2, scrypt or argon2 (needs argon2-cffi)
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 216000))
+PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', 8))
+PASSWORD_SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', 1))
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'accounts.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'accounts.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+AUTHENTICATION_BACKENDS = ['accounts.backends.PooledModelBackend']
+
+# Logins hash on a bounded thread pool; beyond workers + queue they get a 429
+LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', os.cpu_count() or 2))
+LOGIN_HASH_QUEUE = int(os.getenv('LOGIN_HASH_QUEUE', LOGIN_HASH_WORKERS * 4))
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -139,13 +305,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
 
+# Cursor pagination of the list endpoints (core.pagination): default and
+# largest page sizes a client can ask for with ?page_size=, and the most rows
+# a request without pagination parameters gets as a plain list
+PAGINATION_PAGE_SIZE = int(os.getenv('PAGINATION_PAGE_SIZE', 50))
+PAGINATION_MAX_PAGE_SIZE = int(os.getenv('PAGINATION_MAX_PAGE_SIZE', 500))
+PAGINATION_UNPAGINATED_LIMIT = int(os.getenv('PAGINATION_UNPAGINATED_LIMIT', 500))
+
 # JWT Configuration
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
@@ -155,6 +328,14 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
+# Let views marked trust_token_claims build request.user from the token's
+# email/role/name claims on GET requests instead of loading it. Only applies
+# when the 'auth' cache is shared between processes (AUTH_CACHE_BACKEND)
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv('AUTH_TRUST_TOKEN_CLAIMS', 'False') == 'True'
+
+# Append-only log of revoked JWTs, replayed into memory by accounts.revocation
+TOKEN_REVOCATION_FILE = Path(os.getenv('TOKEN_REVOCATION_FILE', BASE_DIR / 'logs' / 'revoked_tokens.log'))
+TOKEN_REVOCATION_BLOOM_BITS = int(os.getenv('TOKEN_REVOCATION_BLOOM_BITS', 2 ** 21))  # per expiry bucket
 
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
@@ -166,6 +347,20 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Audit events are spooled to disk and written to AuditLog in batches by a
+# background thread (accounts.audit); set AUDIT_ASYNC=False to write inline
+AUDIT_ASYNC = os.getenv('AUDIT_ASYNC', 'True') == 'True'
+AUDIT_SPOOL_DIR = Path(os.getenv('AUDIT_SPOOL_DIR', BASE_DIR / 'logs' / 'audit_spool'))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))  # seconds
+# Spooled events survive a crash of the process; set AUDIT_SPOOL_FSYNC=True to
+# fsync each one so they also survive the machine going down, at a cost per event
+AUDIT_SPOOL_FSYNC = os.getenv('AUDIT_SPOOL_FSYNC', 'False') == 'True'
+
+# Events older than this are moved to gzipped monthly files by archive_audit_logs
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 6 * 365))  # HIPAA: six years
+AUDIT_ARCHIVE_DIR = Path(os.getenv('AUDIT_ARCHIVE_DIR', BASE_DIR / 'logs' / 'audit_archive'))
+
 # Logging Configuration for HIPAA Compliance
 LOGGING = {
     'version': 1,
@@ -0,0 +1,19 @@
+"""
+Settings for running the test suite without a MongoDB server:
+    python manage.py test --settings=core.test_settings
+
+The test database is a SQLite file rather than SQLite's in-memory database,
+which locks whole tables and ignores the busy timeout, so the tests with
+concurrent writers (e.g. LogGoalProgressTest) fail there.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {'timeout': 30},
+        'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')},
+    }
+}
@@ -3,11 +3,14 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import MongoPoolStatsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
     path('api/wellness/', include('wellness.urls')),
     path('api/health/', include('health_info.urls')),
+    path('api/db/pool-stats/', MongoPoolStatsView.as_view(), name='mongo_pool_stats'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .mongo_pool import POOL_LISTENER
+
+
+class MongoPoolStatsView(APIView):
+    """Connection and checkout counters of the MongoDB pools (this process)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'max_pool_size': settings.MONGODB_CLIENT_OPTIONS['maxPoolSize'],
+            'secondary_reads': 'secondary' in settings.DATABASES,
+            **POOL_LISTENER.stats(),
+        })
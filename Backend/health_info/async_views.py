@@ -0,0 +1,35 @@
+"""
+Async variants of the cached public endpoints, selected per route by
+ASYNC_READ_ROUTES (see core.async_views).
+
+Nearly every request to these endpoints is a cache hit, which is served on
+the event loop from the same entries the sync views store. A miss runs the
+sync view on a thread; it queries, fills the cache and returns the response.
+Cache lookups do not leave the event loop, which suits the default in-process
+and file caches.
+"""
+from core.async_views import read_view, run_sync
+from .cache import cached_entry, respond
+from .views import (
+    HealthArticleListView, FeaturedArticlesView, LatestArticlesView,
+    PrivacyPolicyView, FAQListView, PublicHealthInfoView
+)
+
+
+def cached_read_view(sync_view):
+    """Async view for `sync_view`, the as_view() of a view whose get() uses cached_response"""
+    @read_view(public=True)
+    async def view(request, *args, **kwargs):
+        entry = cached_entry(request)
+        if entry is not None:
+            return respond(request, entry, 'HIT', plain=True)
+        return await run_sync(sync_view, request, *args, **kwargs)
+    return view
+
+
+articles_list_view = cached_read_view(HealthArticleListView.as_view())
+featured_articles_view = cached_read_view(FeaturedArticlesView.as_view())
+latest_articles_view = cached_read_view(LatestArticlesView.as_view())
+privacy_policy_view = cached_read_view(PrivacyPolicyView.as_view())
+faq_list_view = cached_read_view(FAQListView.as_view())
+public_health_info_view = cached_read_view(PublicHealthInfoView.as_view())
@@ -0,0 +1,155 @@
+"""
+Response cache for the public health_info endpoints.
+
+Responses are cached per path and query string in the 'health_info' cache
+(see CACHES in settings) together with an ETag and Last-Modified time, so
+repeat visitors can revalidate with a 304. Cache keys include a generation
+number; saving or deleting a HealthArticle, FAQ or PrivacyPolicy bumps it
+(see health_info.signals), which invalidates every cached response at once
+for every process sharing the cache.
+
+The default cache is in-process, so the bump only reaches the process that
+saved the change. Other workers keep serving their entries until they expire,
+up to HEALTH_INFO_CACHE_TIMEOUT seconds (300 by default) later, plus the
+max-age browsers may reuse a response for. Use a shared backend
+(HEALTH_INFO_CACHE_BACKEND) where content must be fresh sooner.
+
+cached_entry() and respond() serve the same entries to the async variants of
+these views (health_info.async_views).
+"""
+import hashlib
+import json
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+GENERATION_KEY = 'health_info:generation'
+# Headers of the view's response kept with the entry, e.g. the Link to the
+# rest of a capped list (core.pagination)
+CACHED_HEADERS = ('Link',)
+LAST_MODIFIED_KEY = 'health_info:last_modified'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0}
+
+
+def get_cache():
+    return caches['health_info']
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """Hit/miss counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0
+    return stats
+
+
+def _new_generation():
+    # Time based rather than a counter, so a generation key evicted from an
+    # LRU cache can never be recreated with a number already used
+    return time.time_ns()
+
+
+def invalidate():
+    """Drop every cached response by moving to a new generation (in this process only with LocMemCache)"""
+    cache = get_cache()
+    cache.set(GENERATION_KEY, _new_generation(), timeout=None)
+    cache.set(LAST_MODIFIED_KEY, int(timezone.now().timestamp()), timeout=None)
+    _count('invalidations')
+
+
+def _cache_key(request, generation):
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'health_info:{generation}:{digest}'
+
+
+def _not_modified(request, entry):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        return entry['etag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and entry['last_modified'] <= if_modified_since
+
+
+def respond(request, entry, cache_status, plain=False):
+    """Response for a cache entry: a DRF Response, or with `plain` a Django one"""
+    if _not_modified(request, entry):
+        _count('not_modified')
+        response = (HttpResponse if plain else Response)(status=status.HTTP_304_NOT_MODIFIED)
+    elif plain:
+        response = JsonResponse(entry['data'], safe=False)
+    else:
+        response = Response(entry['data'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    response['Cache-Control'] = 'public, max-age=60'
+    response['X-Cache'] = cache_status
+    for name, value in entry.get('headers', {}).items():
+        response[name] = value
+    return response
+
+
+def cached_entry(request):
+    """
+    The cached entry for this request, or None. Only hits are counted: on a
+    miss the caller runs the view, whose cached_response counts it.
+    """
+    if not getattr(settings, 'HEALTH_INFO_CACHE_ENABLED', True):
+        return None
+    cache = get_cache()
+    generation = cache.get_or_set(GENERATION_KEY, _new_generation, timeout=None)
+    entry = cache.get(_cache_key(request, generation))
+    if entry is not None:
+        _count('hits')
+    return entry
+
+
+def cached_response(get):
+    """Decorator for the GET handler of a public APIView"""
+    @wraps(get)
+    def wrapper(self, request, *args, **kwargs):
+        if not getattr(settings, 'HEALTH_INFO_CACHE_ENABLED', True):
+            return get(self, request, *args, **kwargs)
+
+        cache = get_cache()
+        generation = cache.get_or_set(GENERATION_KEY, _new_generation, timeout=None)
+        key = _cache_key(request, generation)
+        entry = cache.get(key)
+        if entry is not None:
+            _count('hits')
+            return respond(request, entry, 'HIT')
+
+        _count('misses')
+        response = get(self, request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+
+        # Store plain JSON types so any cache backend can pickle the entry
+        body = json.dumps(response.data, cls=DjangoJSONEncoder)
+        last_modified = cache.get_or_set(LAST_MODIFIED_KEY, int(timezone.now().timestamp()), timeout=None)
+        entry = {
+            'data': json.loads(body),
+            'etag': '"%s"' % hashlib.md5(body.encode()).hexdigest(),
+            'last_modified': last_modified,
+            'headers': {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+        }
+        cache.set(key, entry)
+        return respond(request, entry, 'MISS')
+    return wrapper
@@ -0,0 +1,55 @@
+"""
+Management command to rebuild the health article/FAQ search index file
+The only writer of the file: run it on each host at deploy, and periodically
+(e.g. every minute from cron) with --if-stale to pick up changes. Running
+processes reload the file when it changes.
+Run: python manage.py rebuild_search_index [--if-stale]
+"""
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, fine for the dev server
+    fcntl = None
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from health_info.search import SearchIndex, read_generation, saved_header, source_signature
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index from the published articles and active FAQs and save it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-stale', action='store_true',
+                            help='Only rebuild if articles or FAQs changed since the file was saved')
+
+    def handle(self, *args, **options):
+        path = settings.HEALTH_SEARCH_INDEX_FILE
+        if not path:
+            raise CommandError('HEALTH_SEARCH_INDEX_FILE is not set')
+        lock = open(f'{path}.lock', 'a')
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self.stdout.write('Another process is rebuilding the search index; skipped')
+                    return
+            # Read before the rows, so changes made during the build count as missing
+            generation = read_generation(path)
+            if options['if_stale']:
+                header = saved_header(path)
+                if header is not None and header[1] >= generation and header[0] == source_signature():
+                    self.stdout.write('Search index is up to date')
+                    return
+            started = time.perf_counter()
+            index = SearchIndex(path)
+            index.build()
+            index.save(generation)
+        finally:
+            lock.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index)} documents in {time.perf_counter() - started:.1f}s into {path}'
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.12 on 2026-10-18 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_info', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='faq',
+            index=models.Index(fields=['order', '-created_at', 'is_active'], name='faq_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faq',
+            index=models.Index(fields=['category', 'order', 'is_active'], name='faq_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healtharticle',
+            index=models.Index(fields=['-created_at', 'is_published', 'is_featured'], name='article_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healtharticle',
+            index=models.Index(fields=['category', '-created_at', 'is_published'], name='article_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privacypolicy',
+            index=models.Index(fields=['-effective_date', 'is_active'], name='policy_effective_idx'),
+        ),
+    ]
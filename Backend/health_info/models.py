@@ -26,6 +26,12 @@ class HealthArticle(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Boolean flags go last: the lists walk created_at order and stop at
+        # their LIMIT, and SQLite cannot seek on a bare boolean condition
+        indexes = [
+            models.Index(fields=['-created_at', 'is_published', 'is_featured'], name='article_created_idx'),
+            models.Index(fields=['category', '-created_at', 'is_published'], name='article_category_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -43,6 +49,7 @@ class PrivacyPolicy(models.Model):
     
     class Meta:
         ordering = ['-effective_date']
+        indexes = [models.Index(fields=['-effective_date', 'is_active'], name='policy_effective_idx')]
         verbose_name_plural = 'Privacy Policies'
     
     def __str__(self):
@@ -60,6 +67,10 @@ class FAQ(models.Model):
     
     class Meta:
         ordering = ['order', '-created_at']
+        indexes = [
+            models.Index(fields=['order', '-created_at', 'is_active'], name='faq_order_idx'),
+            models.Index(fields=['category', 'order', 'is_active'], name='faq_category_idx'),
+        ]
         verbose_name = 'FAQ'
         verbose_name_plural = 'FAQs'
     
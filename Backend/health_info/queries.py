@@ -0,0 +1,94 @@
+"""
+Shared article queries for the public health_info views.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.mongo import get_collection
+from core.routers import read_alias
+from .models import HealthArticle
+
+# Fields needed by HealthArticleListSerializer; content is never loaded
+LIST_FIELDS = ['id', 'title', 'slug', 'summary', 'category', 'image_url', 'is_featured', 'created_at']
+
+
+def default_latest_categories():
+    return getattr(settings, 'HEALTH_INFO_LATEST_CATEGORIES', ['covid', 'flu', 'mental_health'])
+
+
+def _article_from_document(document):
+    values = {field: document.get(field) for field in LIST_FIELDS}
+    if values['created_at'] is not None and timezone.is_naive(values['created_at']):
+        values['created_at'] = timezone.make_aware(values['created_at'], timezone.utc)
+    return HealthArticle(**values)
+
+
+def _mongo_latest(collection, categories, per_category, limit):
+    # A LIMITed sub-pipeline per category over the sorted input, so no stage
+    # holds more than the articles it returns
+    facets = {
+        f'category_{index}': [{'$match': {'category': category}}, {'$limit': per_category}]
+        for index, category in enumerate(categories)
+    }
+    pipeline = [
+        {'$match': {'is_published': True}},
+        {'$sort': {'created_at': -1}},
+        {'$project': {field: 1 for field in LIST_FIELDS}},
+        {'$facet': {**facets, 'latest': [{'$limit': limit}]}},
+    ]
+    result = next(collection.aggregate(pipeline, allowDiskUse=True))
+    by_category = {
+        category: [_article_from_document(doc) for doc in result[f'category_{index}']]
+        for index, category in enumerate(categories)
+    }
+    return by_category, [_article_from_document(doc) for doc in result['latest']]
+
+
+def _orm_latest(categories, per_category, limit):
+    # One query: the union of a LIMITed subquery per category and one for the
+    # newest articles overall, each of which can use the created_at ordering
+    published = HealthArticle.objects.filter(is_published=True).order_by('-created_at')
+    condition = Q(pk__in=published.values('pk')[:limit])
+    for category in categories:
+        condition |= Q(pk__in=published.filter(category=category).values('pk')[:per_category])
+
+    by_category = {category: [] for category in categories}
+    latest = []
+    for article in published.filter(condition).only(*LIST_FIELDS):
+        bucket = by_category.get(article.category)
+        if bucket is not None and len(bucket) < per_category:
+            bucket.append(article)
+        if len(latest) < limit:
+            latest.append(article)
+    return by_category, latest
+
+
+def latest_per_category(categories=None, per_category=1, limit=None):
+    """
+    The newest `per_category` published articles of each category, in the
+    order of `categories`, topped up with the newest other articles until
+    there are `limit` (default: one full set per category).
+    """
+    categories = list(categories or default_latest_categories())
+    limit = limit or len(categories) * per_category
+
+    # Enough newest articles to top up even if all per-category picks are among them
+    fill = limit + len(categories) * per_category
+    collection = get_collection(HealthArticle, using=read_alias())
+    if collection is not None:
+        by_category, latest = _mongo_latest(collection, categories, per_category, fill)
+    else:
+        by_category, latest = _orm_latest(categories, per_category, fill)
+
+    articles = []
+    for category in categories:
+        articles.extend(by_category.get(category, []))
+    chosen = {article.id for article in articles}
+    for article in latest:
+        if len(articles) >= limit:
+            break
+        if article.id not in chosen:
+            articles.append(article)
+            chosen.add(article.id)
+    return articles[:limit]
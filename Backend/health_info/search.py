@@ -0,0 +1,524 @@
+"""
+Full-text search over the published articles and active FAQs.
+
+SearchIndex is an inverted index kept in this process: for every term, the
+documents containing it and the term's frequency there, weighted by field
+(a title match counts more than one in the body). Queries are ranked with
+BM25; the last query word also matches as a prefix (search as you type),
+words that are not in the index match indexed words one or two edits away,
+and the matches are counted per category for facets.
+
+Processes load the index from HEALTH_SEARCH_INDEX_FILE and never build it
+inside a request. The file has a single writer per host: the
+rebuild_search_index command, which holds a lock on it while it runs (until
+the file exists searches find nothing). Saves and deletes update the index
+of the process that made them at once, through health_info.signals, and bump
+a generation number kept next to the file once committed. The file records
+the generation it was built at, so `rebuild_search_index --if-stale`, run
+periodically, rebuilds only after changes, and processes reload the file
+when it is rewritten unless it is older than their own changes. --if-stale
+also rebuilds when a cheap signature of the source rows (counts, newest
+article update, newest FAQ) no longer matches, which catches changes that
+bypass signals (queryset.update(), bulk_create()) - except FAQ edits: run
+rebuild_search_index after those.
+
+Without HEALTH_SEARCH_INDEX_FILE (development) each process builds its own
+index on first use.
+"""
+import heapq
+import html
+import logging
+import math
+import os
+import pickle
+import re
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from operator import itemgetter
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, fine for the dev server
+    fcntl = None
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import HealthArticle, FAQ
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+
+# Weight of a term occurrence per field
+FIELD_WEIGHTS = {'title': 3, 'summary': 2, 'content': 1, 'question': 3, 'answer': 1}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Prefix and typo matches score less than the word itself
+MIN_PREFIX = 2
+PREFIX_EXPANSIONS = 20
+PREFIX_WEIGHT = 0.7
+TYPO_WEIGHT = 0.5
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i if in is it its my of on or our should
+so than that the their them then there these they this to was we what when where which who why will
+with you your
+""".split())
+
+_word = re.compile(r'\w+')
+_hidden = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_tag = re.compile(r'<[^>]*>')
+
+
+def _stem(word):
+    """Fold simple plurals so "vaccines" finds "vaccine" """
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _term(word):
+    """The index term for a lowercase word, or None for words not indexed"""
+    if len(word) < 2 or word in STOPWORDS:
+        return None
+    return sys.intern(_stem(word))
+
+
+def tokenize(text):
+    """Index terms of `text`, in order"""
+    return [term for term in map(_term, _word.findall(text.lower())) if term]
+
+
+def term_counts(text, markup=False):
+    """{index term: occurrences} of `text`; with `markup` HTML tags and entities are stripped first"""
+    if markup:
+        text = html.unescape(_tag.sub(' ', _hidden.sub(' ', text)))
+    counts = {}
+    # Words repeat, so look up each one once
+    for word, count in Counter(_word.findall(text.lower())).items():
+        term = _term(word)
+        if term:
+            counts[term] = counts.get(term, 0) + count
+    return counts
+
+
+def _within_distance(a, b, limit):
+    """Whether a and b are at most `limit` edits apart (transpositions count as one)"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= limit
+
+
+def _typo_limit(term):
+    return 2 if len(term) >= 8 else 1 if len(term) >= 4 else 0
+
+
+def source_signature():
+    """Summary of the indexed rows; a saved index is only used while it matches"""
+    articles = HealthArticle.objects.filter(is_published=True)
+    faqs = FAQ.objects.filter(is_active=True)
+    updated = articles.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    return (
+        articles.count(), updated.isoformat() if updated else None,
+        faqs.count(), faqs.order_by('-id').values_list('id', flat=True).first(),
+    )
+
+
+def _generation_file(path, operation):
+    handle = open(f'{path}.generation', 'a+', encoding='ascii')
+    if fcntl is not None:
+        fcntl.flock(handle, operation)
+    handle.seek(0)
+    return handle
+
+
+def read_generation(path):
+    """How many committed changes the index at `path` has seen"""
+    if not os.path.exists(f'{path}.generation'):
+        return 0
+    with _generation_file(path, fcntl.LOCK_SH if fcntl else None) as handle:
+        return int(handle.read() or 0)
+
+
+def bump_generation(path):
+    """Record a change the saved index at `path` is missing; returns the new generation"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _generation_file(path, fcntl.LOCK_EX if fcntl else None) as handle:
+        generation = int(handle.read() or 0) + 1
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(generation))
+    return generation
+
+
+def saved_header(path):
+    """(source signature, generation) of the index saved at `path`, or None if there is no usable one"""
+    try:
+        with open(path, 'rb') as file:
+            version, signature, generation = pickle.load(file)
+    except (OSError, TypeError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
+    return (signature, generation) if version == FORMAT_VERSION else None
+
+
+class SearchIndex:
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._file_mtime = None
+        self._changed_at = 0  # generation of this process's latest change
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._numbers = {}        # (kind, id) -> document number
+            self._keys = []           # document number -> (kind, id), None once removed
+            self._categories = []     # document number -> category
+            self._lengths = []        # document number -> weighted term count
+            self._doc_terms = []      # document number -> terms, to remove it again
+            self._postings = {}       # term -> (array of document numbers, array of frequencies)
+            self._total_length = 0
+            self._vocabulary = None   # sorted terms and typo buckets, built on demand
+
+    def __len__(self):
+        return len(self._numbers)
+
+    # Updates
+
+    def add(self, kind, doc_id, category, fields):
+        """Index (or re-index) a document; `fields` maps FIELD_WEIGHTS names to text"""
+        frequencies = {}
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for term, count in term_counts(text or '', markup=field == 'content').items():
+                frequencies[term] = frequencies.get(term, 0) + weight * count
+
+        with self._lock:
+            self._remove((kind, doc_id))
+            if not frequencies:
+                return
+            number = len(self._keys)
+            self._numbers[(kind, doc_id)] = number
+            self._keys.append((kind, doc_id))
+            self._categories.append(category)
+            length = sum(frequencies.values())
+            self._lengths.append(length)
+            self._doc_terms.append(tuple(frequencies))
+            self._total_length += length
+            for term, frequency in frequencies.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array('I'), array('H'))
+                    self._vocabulary = None
+                postings[0].append(number)
+                postings[1].append(min(frequency, 0xFFFF))
+
+    def remove(self, kind, doc_id):
+        with self._lock:
+            self._remove((kind, doc_id))
+
+    def _remove(self, key):
+        number = self._numbers.pop(key, None)
+        if number is None:
+            return
+        for term in self._doc_terms[number]:
+            numbers, frequencies = self._postings[term]
+            position = numbers.index(number)
+            del numbers[position]
+            del frequencies[position]
+            if not numbers:
+                del self._postings[term]
+                self._vocabulary = None
+        self._total_length -= self._lengths[number]
+        self._keys[number] = None
+        self._doc_terms[number] = ()
+
+    def add_article(self, article):
+        if not article.is_published:
+            self.remove('article', article.pk)
+        else:
+            self.add('article', article.pk, article.category, {
+                'title': article.title, 'summary': article.summary, 'content': article.content,
+            })
+
+    def add_faq(self, faq):
+        if not faq.is_active:
+            self.remove('faq', faq.pk)
+        else:
+            self.add('faq', faq.pk, faq.category, {'question': faq.question, 'answer': faq.answer})
+
+    def build(self):
+        """Index every published article and active FAQ"""
+        with self._lock:
+            self.clear()
+            articles = HealthArticle.objects.filter(is_published=True).values_list(
+                'id', 'category', 'title', 'summary', 'content'
+            )
+            for article_id, category, title, summary, content in articles.iterator():
+                self.add('article', article_id, category, {'title': title, 'summary': summary, 'content': content})
+            faqs = FAQ.objects.filter(is_active=True).values_list('id', 'category', 'question', 'answer')
+            for faq_id, category, question, answer in faqs.iterator():
+                self.add('faq', faq_id, category, {'question': question, 'answer': answer})
+
+    # Queries
+
+    def _vocabulary_index(self):
+        """(sorted terms, {(first letter, length): [terms]}), rebuilt after terms come or go"""
+        if self._vocabulary is None:
+            terms = sorted(self._postings)
+            buckets = {}
+            for term in terms:
+                buckets.setdefault((term[0], len(term)), []).append(term)
+            self._vocabulary = (terms, buckets)
+        return self._vocabulary
+
+    def _prefixed(self, prefix):
+        """The most frequent indexed terms starting with `prefix`"""
+        terms, _ = self._vocabulary_index()
+        candidates = []
+        for term in terms[bisect_left(terms, prefix):]:
+            if not term.startswith(prefix) or len(candidates) >= 1000:
+                break
+            if term != prefix:
+                candidates.append(term)
+        return heapq.nlargest(PREFIX_EXPANSIONS, candidates, key=lambda term: len(self._postings[term][0]))
+
+    def _similar(self, term):
+        """Indexed terms a typo away from `term`, most frequent first; typos in the first letter are not found"""
+        limit = _typo_limit(term)
+        _, buckets = self._vocabulary_index()
+        similar = [
+            candidate
+            for length in range(len(term) - limit, len(term) + limit + 1)
+            for candidate in buckets.get((term[0], length), ())
+            if _within_distance(term, candidate, limit)
+        ]
+        return sorted(similar, key=lambda candidate: -len(self._postings[candidate][0]))
+
+    def _expand(self, term, prefix):
+        """{indexed term: weight} for a query term, and the correction used if any"""
+        expansions = {}
+        if term in self._postings:
+            expansions[term] = 1.0
+        if prefix and len(term) >= MIN_PREFIX:
+            for candidate in self._prefixed(term):
+                expansions[candidate] = PREFIX_WEIGHT
+        if expansions or not _typo_limit(term):
+            return expansions, None
+        similar = self._similar(term)
+        return {candidate: TYPO_WEIGHT for candidate in similar}, similar[0] if similar else None
+
+    def search(self, query, category=None, kind=None, limit=20, offset=0):
+        """
+        Rank the documents matching any word of `query`:
+        {'count', 'hits': [(kind, id, score)], 'facets': {category: count},
+        'corrections': {word: indexed term}}. Facets count the matches
+        before the category filter is applied.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        # The word being typed is matched as a prefix
+        prefix_term = terms[-1] if terms and query[-1:].isalnum() else None
+        self._reload_if_changed()
+        with self._lock:
+            documents = len(self._numbers)
+            average_length = self._total_length / documents if documents else 1
+            # BM25 term frequency normalisation: tf / (tf + constant + per_length * length)
+            constant = K1 * (1 - B)
+            per_length = K1 * B / average_length
+            lengths = self._lengths
+            scores = {}
+            corrections = {}
+            for term in terms:
+                expansions, correction = self._expand(term, prefix=term == prefix_term)
+                if correction:
+                    corrections[term] = correction
+                best = None
+                for candidate, weight in expansions.items():
+                    numbers, frequencies = self._postings[candidate]
+                    idf = math.log(1 + (documents - len(numbers) + 0.5) / (len(numbers) + 0.5))
+                    weight *= idf * (K1 + 1)
+                    candidate_scores = {
+                        number: weight * frequency / (frequency + constant + per_length * lengths[number])
+                        for number, frequency in zip(numbers, frequencies)
+                    }
+                    if best is None:
+                        best = candidate_scores
+                        continue
+                    # A document counts its best match of the query term
+                    for number, score in candidate_scores.items():
+                        if score > best.get(number, 0):
+                            best[number] = score
+                if not best:
+                    continue
+                if not scores:
+                    scores = best
+                    continue
+                for number, score in best.items():
+                    scores[number] = scores.get(number, 0) + score
+
+            keys = self._keys
+            categories = self._categories
+            if kind:
+                scores = {number: score for number, score in scores.items() if keys[number][0] == kind}
+            facets = dict(Counter(map(categories.__getitem__, scores)))
+            if category:
+                scores = {number: score for number, score in scores.items() if categories[number] == category}
+            top = heapq.nlargest(offset + limit, scores.items(), key=itemgetter(1))[offset:]
+            hits = [keys[number] + (round(score, 4),) for number, score in top]
+        return {'count': len(scores), 'hits': hits, 'facets': facets, 'corrections': corrections}
+
+    # Persistence
+
+    def _state(self):
+        return {
+            'version': FORMAT_VERSION, 'numbers': self._numbers, 'keys': self._keys,
+            'categories': self._categories, 'lengths': self._lengths, 'doc_terms': self._doc_terms,
+            'postings': self._postings, 'total_length': self._total_length,
+        }
+
+    def save(self, generation=0):
+        """Write the index to self.path (atomically) with the current source signature and `generation`"""
+        if not self.path:
+            return
+        signature = source_signature()
+        with self._lock:
+            # The header comes first, so it can be read without the rest
+            data = pickle.dumps((FORMAT_VERSION, signature, generation), protocol=pickle.HIGHEST_PROTOCOL)
+            data += pickle.dumps(self._state(), protocol=pickle.HIGHEST_PROTOCOL)
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, self.path)
+        self._file_mtime = os.stat(self.path).st_mtime_ns
+
+    def changed(self, generation):
+        """Note that this process applied the change numbered `generation`"""
+        with self._lock:
+            self._changed_at = max(self._changed_at, generation)
+
+    def load(self, signature=None):
+        """
+        Replace the index with the saved one; False if there is no usable file,
+        it was saved for another `signature` or it predates this process's
+        own changes.
+        """
+        # Unpickled without the lock, so searches go on meanwhile; only the swap takes it
+        try:
+            with open(self.path, 'rb') as file:
+                mtime = os.fstat(file.fileno()).st_mtime_ns
+                version, saved_signature, generation = pickle.load(file)
+                if version != FORMAT_VERSION or generation < self._changed_at or (
+                    signature is not None and saved_signature != signature
+                ):
+                    return False
+                state = pickle.load(file)
+        except (OSError, TypeError, ValueError, EOFError, pickle.UnpicklingError):
+            return False
+        with self._lock:
+            if generation < self._changed_at:
+                return False  # A change was applied while it loaded
+            self._numbers = state['numbers']
+            self._keys = state['keys']
+            self._categories = state['categories']
+            self._lengths = state['lengths']
+            self._doc_terms = state['doc_terms']
+            self._postings = state['postings']
+            self._total_length = state['total_length']
+            self._vocabulary = None
+            self._file_mtime = mtime
+        return True
+
+    def _reload_if_changed(self):
+        """Pick up the file once rebuild_search_index has rewritten it"""
+        if not self.path:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if mtime == self._file_mtime:
+                return
+            # Read by one thread, and once even if it turns out to be too old
+            self._file_mtime = mtime
+        self.load()
+
+    def open(self):
+        """Load the saved index, or without a file to use build it"""
+        if not self.path:
+            self.build()
+        elif not self.load():
+            logger.warning('No search index at %s yet; run rebuild_search_index', self.path)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(load=True):
+    """This process's index, opened on first use; with load=False None until then"""
+    global _index
+    with _index_lock:
+        if _index is None and load:
+            index = SearchIndex(getattr(settings, 'HEALTH_SEARCH_INDEX_FILE', None))
+            index.open()
+            _index = index
+        return _index
+
+
+def reset_index():
+    """Forget this process's index (tests, or after restoring the database)"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def _committed(index):
+    path = getattr(settings, 'HEALTH_SEARCH_INDEX_FILE', None)
+    if path:
+        generation = bump_generation(path)
+        if index is not None:
+            index.changed(generation)
+
+
+def _changed(update):
+    # Processes that have not opened the index get the change with the next rebuild
+    index = get_index(load=False)
+    if index is not None:
+        update(index)
+    transaction.on_commit(lambda: _committed(index))
+
+
+def article_saved(article):
+    _changed(lambda index: index.add_article(article))
+
+
+def faq_saved(faq):
+    _changed(lambda index: index.add_faq(faq))
+
+
+def document_deleted(kind, doc_id):
+    _changed(lambda index: index.remove(kind, doc_id))
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import search
+from .cache import invalidate
+from .models import HealthArticle, PrivacyPolicy, FAQ
+
+
+@receiver(post_save, sender=HealthArticle)
+@receiver(post_delete, sender=HealthArticle)
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+@receiver(post_save, sender=PrivacyPolicy)
+@receiver(post_delete, sender=PrivacyPolicy)
+def invalidate_public_cache(sender, **kwargs):
+    invalidate()
+
+
+@receiver(post_save, sender=HealthArticle)
+def index_article(sender, instance, **kwargs):
+    search.article_saved(instance)
+
+
+@receiver(post_save, sender=FAQ)
+def index_faq(sender, instance, **kwargs):
+    search.faq_saved(instance)
+
+
+@receiver(post_delete, sender=HealthArticle)
+@receiver(post_delete, sender=FAQ)
+def unindex_document(sender, instance, **kwargs):
+    search.document_deleted('article' if sender is HealthArticle else 'faq', instance.pk)
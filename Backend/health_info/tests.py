@@ -1,3 +1,430 @@
-from django.test import TestCase
+import fcntl
+import itertools
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from pymongo import MongoClient
+from rest_framework.test import APIClient
+
+from core.benchmarks import benchmark, measure, report
+from . import async_views, search
+from .cache import get_cache, cache_stats
+from .models import HealthArticle, FAQ
+from .queries import latest_per_category, _mongo_latest
+from .search import SearchIndex, get_index, source_signature
+
+
+def create_articles(count, category='general'):
+    HealthArticle.objects.bulk_create([
+        HealthArticle(
+            title=f'Article {i}', slug=f'{category}-article-{i}', summary='Summary',
+            content='<p>Content</p>', category=category, is_featured=i % 5 == 0
+        )
+        for i in range(count)
+    ])
+
+
+class PublicResponseCacheTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        create_articles(3)
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/api/health/articles/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/health/articles/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        # Query params are part of the key
+        self.assertEqual(self.client.get('/api/health/articles/?category=flu')['X-Cache'], 'MISS')
+        self.assertGreaterEqual(cache_stats()['hits'], 1)
+
+    def test_conditional_requests(self):
+        response = self.client.get('/api/health/faqs/')
+        not_modified = self.client.get('/api/health/faqs/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.client.get('/api/health/faqs/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+        changed = self.client.get('/api/health/faqs/', HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(changed.status_code, 200)
+
+    def test_model_changes_invalidate(self):
+        self.assertEqual(len(self.client.get('/api/health/public/').data['faqs']), 0)
+        faq = FAQ.objects.create(question='Q?', answer='A')
+        response = self.client.get('/api/health/public/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['faqs']), 1)
+
+        faq.delete()
+        self.assertEqual(len(self.client.get('/api/health/public/').data['faqs']), 0)
+
+    def test_async_views_serve_cached_entries(self):
+        first = self.client.get('/api/health/faqs/')
+        request = AsyncRequestFactory().get('/api/health/faqs/')
+        with self.assertNumQueries(0):
+            response = async_to_sync(async_views.faq_list_view)(request)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(json.loads(response.content), first.data)
+
+        request = AsyncRequestFactory().get('/api/health/faqs/', if_none_match=first['ETag'])
+        self.assertEqual(async_to_sync(async_views.faq_list_view)(request).status_code, 304)
+        self.assertEqual(async_to_sync(async_views.faq_list_view)(
+            AsyncRequestFactory().post('/api/health/faqs/')
+        ).status_code, 405)
+
+    @override_settings(PAGINATION_UNPAGINATED_LIMIT=3)
+    def test_capped_list_keeps_its_link(self):
+        for i in range(5):
+            FAQ.objects.create(question=f'Q{i}?', answer='A')
+        first = self.client.get('/api/health/faqs/')
+        second = self.client.get('/api/health/faqs/')
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        for response in (first, second):
+            self.assertEqual(len(response.data), 3)
+            self.assertIn('rel="next"', response['Link'])
+        self.assertFalse(self.client.get('/api/health/articles/').has_header('Link'))
+
+    def test_cursor_pagination(self):
+        create_articles(5, category='flu')
+        first = self.client.get('/api/health/articles/?category=flu&page_size=4&count=1')
+        self.assertEqual(first.data['count'], 5)
+        second = self.client.get('/api/health/articles/', {'category': 'flu', 'page_size': 4,
+                                                           'cursor': first.data['next_cursor']})
+        slugs = [a['slug'] for a in first.data['results'] + second.data['results']]
+        self.assertEqual(slugs, [a['slug'] for a in self.client.get('/api/health/articles/?category=flu').data])
+        self.assertEqual(len(set(slugs)), 5)
+
+    @override_settings(HEALTH_INFO_CACHE_ENABLED=False)
+    def test_cache_can_be_disabled(self):
+        self.client.get('/api/health/articles/featured/')
+        self.assertFalse(self.client.get('/api/health/articles/featured/').has_header('X-Cache'))
+
+    @benchmark
+    def test_benchmark_anonymous_throughput(self):
+        create_articles(500, category='covid')
+        FAQ.objects.bulk_create([FAQ(question=f'Q{i}?', answer='A', order=i) for i in range(50)])
+        urls = ['/api/health/public/', '/api/health/articles/latest/', '/api/health/articles/featured/',
+                '/api/health/faqs/', '/api/health/privacy-policy/']
+
+        def throughput(seconds=2):
+            requests = 0
+            started = time.perf_counter()
+            while time.perf_counter() - started < seconds:
+                self.client.get(urls[requests % len(urls)])
+                requests += 1
+            return requests / (time.perf_counter() - started)
+
+        with override_settings(HEALTH_INFO_CACHE_ENABLED=False):
+            uncached = throughput()
+        cached = throughput()
+        print(f'\nanonymous public endpoints: {uncached:.0f} req/s uncached, {cached:.0f} req/s cached')
+
+
+def legacy_latest_articles():
+    """LatestArticlesView before latest_per_category: one query per category plus a fill-up"""
+    articles = []
+    for cat in ['covid', 'flu', 'mental_health']:
+        article = HealthArticle.objects.filter(is_published=True, category=cat).first()
+        if article:
+            articles.append(article)
+    if len(articles) < 3:
+        extra = HealthArticle.objects.filter(is_published=True).exclude(
+            id__in=[a.id for a in articles]
+        )[:3 - len(articles)]
+        articles.extend(extra)
+    return articles
+
+
+@override_settings(HEALTH_INFO_CACHE_ENABLED=False)
+class LatestPerCategoryTest(TestCase):
+
+    def add(self, slug, category, hours_ago, is_published=True):
+        article = HealthArticle.objects.create(
+            title=slug, slug=slug, summary='Summary', content='Content',
+            category=category, is_published=is_published
+        )
+        # created_at is auto_now_add, so age the article afterwards
+        HealthArticle.objects.filter(pk=article.pk).update(
+            created_at=timezone.now() - timedelta(hours=hours_ago)
+        )
+
+    def test_one_query_matches_legacy(self):
+        self.add('covid-old', 'covid', 10)
+        self.add('covid-new', 'covid', 5)
+        self.add('flu-draft', 'flu', 1, is_published=False)
+        self.add('mental', 'mental_health', 20)
+        self.add('nutrition', 'nutrition', 2)
+        self.add('fitness', 'fitness', 3)
+
+        with self.assertNumQueries(1):
+            slugs = [a.slug for a in latest_per_category()]
+        self.assertEqual(slugs, ['covid-new', 'mental', 'nutrition'])
+        self.assertEqual(slugs, [a.slug for a in legacy_latest_articles()])
+
+        slugs = [a.slug for a in latest_per_category(['covid', 'fitness'], per_category=2)]
+        self.assertEqual(slugs, ['covid-new', 'covid-old', 'fitness', 'nutrition'])
+
+    def test_view_parameters(self):
+        self.add('covid', 'covid', 1)
+        client = APIClient()
+        response = client.get('/api/health/articles/latest/?categories=covid&per_category=2')
+        self.assertEqual([a['slug'] for a in response.data], ['covid'])
+        self.assertEqual(client.get('/api/health/articles/latest/?categories=nope').status_code, 400)
+        self.assertEqual(client.get('/api/health/articles/latest/?per_category=0').status_code, 400)
+
+    @benchmark
+    def test_benchmark_against_legacy_loop(self):
+        create_articles(3000, category='general')
+        for category in ('covid', 'flu', 'mental_health'):
+            create_articles(200, category=category)
+        report('latest articles (legacy loop)', measure(legacy_latest_articles, repeat=50))
+        report('latest articles (one query)', measure(latest_per_category, repeat=50))
+
+
+@skipUnless(os.getenv('MONGODB_TEST_URI'), 'set MONGODB_TEST_URI to test against a mongod')
+class MongoLatestPerCategoryTest(TestCase):
+
+    def setUp(self):
+        client = MongoClient(os.getenv('MONGODB_TEST_URI'))
+        self.addCleanup(client.close)
+        self.collection = client.get_database('latest_test').health_articles
+        self.collection.drop()
+        self.addCleanup(self.collection.drop)
+        self.now = datetime.utcnow().replace(microsecond=0)
+
+    def insert(self, count, category, content_size=0, offset=0):
+        self.collection.insert_many([{
+            'id': self.collection.estimated_document_count() + i + 1, 'title': f'{category} {i}',
+            'slug': f'{category}-{i}', 'summary': 'Summary', 'content': 'x' * content_size,
+            'category': category, 'image_url': None, 'is_featured': False, 'is_published': True,
+            'created_at': self.now - timedelta(minutes=2 * i + offset),
+        } for i in range(count)])
+
+    def test_newest_per_category(self):
+        self.insert(5, 'covid')
+        self.insert(3, 'general', offset=1)
+        by_category, latest = _mongo_latest(self.collection, ['covid', 'flu'], 2, 4)
+        self.assertEqual([a.slug for a in by_category['covid']], ['covid-0', 'covid-1'])
+        self.assertEqual(by_category['flu'], [])
+        self.assertEqual([a.slug for a in latest], ['covid-0', 'general-0', 'covid-1', 'general-1'])
+
+    @benchmark
+    def test_benchmark_large_categories(self):
+        # Together well over the 16MB a single grouped document may hold
+        self.collection.create_index([('is_published', 1), ('created_at', -1)])
+        for category in ('covid', 'flu', 'mental_health'):
+            self.insert(20000, category, content_size=1000)
+        report('latest articles (mongod, 60k articles)', measure(
+            lambda: _mongo_latest(self.collection, ['covid', 'flu', 'mental_health'], 1, 6), repeat=20
+        ))
+
+
+@override_settings(HEALTH_INFO_CACHE_ENABLED=False)
+class SearchTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'search.idx')
+        settings_override = override_settings(HEALTH_SEARCH_INDEX_FILE=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        search.reset_index()
+        self.addCleanup(search.reset_index)
+        self.client = APIClient()
+
+        self.guide = HealthArticle.objects.create(
+            title='Flu vaccine guide', slug='flu-vaccine', summary='Who should get vaccinated',
+            content='<p>Get your <b>vaccine</b> every autumn &amp; stay well</p>', category='flu'
+        )
+        self.covid = HealthArticle.objects.create(
+            title='COVID-19 boosters', slug='covid-boosters', summary='Booster schedule',
+            content='<div class="highlight">A booster vaccine restores protection</div>', category='covid'
+        )
+        HealthArticle.objects.create(
+            title='Walking daily', slug='walking', summary='Steps', content='Exercise helps', category='fitness'
+        )
+        self.faq = FAQ.objects.create(question='When should I get a flu shot?', answer='Before winter', category='flu')
+        self.rebuild()
+
+    def rebuild(self, **options):
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out, **options)
+        return out.getvalue()
+
+    def search(self, query, **params):
+        response = self.client.get('/api/health/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranking_and_markup(self):
+        data = self.search('vaccine')
+        self.assertEqual(data['count'], 2)
+        # A title match outranks one in the body
+        self.assertEqual([r['item']['slug'] for r in data['results']], ['flu-vaccine', 'covid-boosters'])
+        self.assertGreater(data['results'][0]['score'], data['results'][1]['score'])
+        self.assertEqual(data['facets'], {'flu': 1, 'covid': 1})
+
+        # Tags, attributes and entities are not indexed
+        for query in ('highlight', 'div', 'amp'):
+            self.assertEqual(self.search(query + ' ')['count'], 0)
+        self.assertEqual(self.search('autumn')['count'], 1)
+        # Stop words alone match nothing; plurals match the singular
+        self.assertEqual(self.search('the when')['count'], 0)
+        self.assertEqual(self.search('vaccines')['count'], 2)
+
+    def test_prefix_typos_and_filters(self):
+        self.assertEqual(self.search('boost')['results'][0]['item']['slug'], 'covid-boosters')
+        # Only the word being typed is a prefix
+        self.assertEqual(self.search('boost ')['count'], 0)
+
+        data = self.search('vacicne')
+        self.assertEqual(data['corrections'], {'vacicne': 'vaccine'})
+        self.assertEqual(data['count'], 2)
+
+        data = self.search('flu', category='flu')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['facets'], {'flu': 2})
+        data = self.search('flu', type='faq')
+        self.assertEqual([(r['type'], r['item']['id']) for r in data['results']], [('faq', self.faq.id)])
+        self.assertEqual(len(self.search('vaccine', limit=1, offset=1)['results']), 1)
+
+        for params in ({}, {'q': 'x' * 201}, {'q': 'flu', 'type': 'policy'}, {'q': 'flu', 'limit': 0},
+                       {'q': 'flu', 'offset': -1}, {'q': 'flu', 'limit': 'ten'}):
+            self.assertEqual(self.client.get('/api/health/search/', params).status_code, 400)
+
+    def test_signals_update_the_index(self):
+        self.assertEqual(self.search('winter')['count'], 1)
+        HealthArticle.objects.create(title='Winter walks', slug='winter', summary='s', content='c')
+        self.assertEqual(self.search('winter')['count'], 2)
+
+        self.guide.is_published = False
+        self.guide.save()
+        self.faq.delete()
+        self.assertEqual(self.search('flu')['count'], 0)
+        self.guide.is_published = True
+        self.guide.save()
+        self.assertEqual(self.search('flu')['count'], 1)
+
+    def test_saved_index(self):
+        self.search('flu')
+        index = SearchIndex(self.path)
+        self.assertTrue(index.load(source_signature()))
+        self.assertEqual(len(index), 4)
+        with self.assertNumQueries(0):
+            self.assertEqual(index.search('booster')['hits'], get_index().search('booster')['hits'])
+
+        # Rows added without signals make the file stale; processes pick up the rebuilt one
+        self.assertIn('up to date', self.rebuild(if_stale=True))
+        create_articles(2)
+        self.assertIn('Indexed 6 documents', self.rebuild(if_stale=True))
+        self.search('flu')
+        self.assertEqual(len(get_index()), 6)
+
+        # So do committed changes, through the generation
+        search.bump_generation(self.path)
+        self.assertIn('Indexed 6 documents', self.rebuild(if_stale=True))
+        self.assertIn('up to date', self.rebuild(if_stale=True))
+
+        # One rebuild at a time
+        with open(f'{self.path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.assertIn('skipped', self.rebuild())
+
+    def test_requests_never_build_the_index(self):
+        search.reset_index()
+        os.remove(self.path)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_index()), 0)
+        self.assertEqual(self.search('vaccine')['count'], 0)
+        self.rebuild()
+        self.assertEqual(self.search('vaccine')['count'], 2)
+
+    def test_searches_do_not_wait_for_a_reload(self):
+        index = get_index()
+        loading, release = threading.Event(), threading.Event()
+        real_load = pickle.load
+
+        def slow_load(file):
+            state = real_load(file)
+            if isinstance(state, dict):  # The index itself, after the header
+                loading.set()
+                release.wait(5)
+            return state
+
+        HealthArticle.objects.bulk_create([HealthArticle(title='Winter walks', slug='winter', summary='s', content='c')])
+        self.rebuild()
+        with mock.patch('health_info.search.pickle.load', side_effect=slow_load):
+            reloader = threading.Thread(target=index.search, args=('winter',))
+            reloader.start()
+            self.assertTrue(loading.wait(5))
+            # The old index still answers while the new one is read
+            self.assertEqual(index.search('winter')['count'], 1)
+            release.set()
+            reloader.join()
+        self.assertEqual(index.search('winter')['count'], 2)
+
+    def test_older_file_keeps_local_changes(self):
+        self.search('winter')
+        older = SearchIndex(self.path)
+        older.build()
+        HealthArticle.objects.create(title='Winter walks', slug='winter', summary='s', content='c')
+        # What the commit of the save does
+        get_index().changed(search.bump_generation(self.path))
+        older.save()
+        self.assertEqual(self.search('winter')['count'], 2)
+        self.rebuild()
+        self.assertEqual(self.search('winter')['count'], 2)
+
+    @benchmark
+    def test_benchmark_query_latency(self):
+        random.seed(1)
+        words = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(random.randint(4, 10)))
+                 for _ in range(20000)]
+        # Zipf-like word frequencies
+        cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+        categories = [choice for choice, _ in HealthArticle.CATEGORY_CHOICES]
+        index = SearchIndex(self.path)
+        started = time.perf_counter()
+        for i in range(100000):
+            index.add('article', i, categories[i % len(categories)], {
+                'title': ' '.join(random.choices(words, cum_weights=cumulative, k=6)),
+                'summary': ' '.join(random.choices(words, cum_weights=cumulative, k=20)),
+                'content': '<p>%s</p>' % ' '.join(random.choices(words, cum_weights=cumulative, k=120)),
+            })
+        print(f'\nindexing 100k articles: {time.perf_counter() - started:.1f}s')
+
+        with self.assertNumQueries(4):
+            started = time.perf_counter()
+            index.save()
+        print(f'saving: {time.perf_counter() - started:.2f}s, {os.path.getsize(self.path) / 1e6:.0f}MB')
+        started = time.perf_counter()
+        SearchIndex(self.path).load()
+        print(f'loading: {time.perf_counter() - started:.2f}s')
+
+        common, medium, rare = words[5], words[200], words[5000]
+        report('search, common word', measure(lambda: index.search(common), repeat=20))
+        report('search, medium word', measure(lambda: index.search(medium), repeat=50))
+        report('search, rare word', measure(lambda: index.search(rare), repeat=50))
+        report('search, three words', measure(lambda: index.search(f'{medium} {rare} {words[1000]}'), repeat=50))
+        report('search, prefix', measure(lambda: index.search(medium[:3]), repeat=50))
+        typo = rare[0] + rare[2] + rare[1] + rare[3:]
+        report('search, typo', measure(lambda: index.search(typo + ' '), repeat=50))
@@ -1,21 +1,34 @@
 from django.urls import path
+
+from core.async_views import read_route
+from . import async_views
 from .views import (
     HealthArticleListView, HealthArticleDetailView, FeaturedArticlesView,
-    LatestArticlesView, PrivacyPolicyView, FAQListView, PublicHealthInfoView
+    LatestArticlesView, PrivacyPolicyView, FAQListView, PublicHealthInfoView, SearchView, CacheStatsView
 )
 
 urlpatterns = [
     # Health Articles
-    path('articles/', HealthArticleListView.as_view(), name='articles_list'),
-    path('articles/featured/', FeaturedArticlesView.as_view(), name='featured_articles'),
-    path('articles/latest/', LatestArticlesView.as_view(), name='latest_articles'),
+    read_route('articles/', HealthArticleListView.as_view(), async_views.articles_list_view, name='articles_list'),
+    read_route('articles/featured/', FeaturedArticlesView.as_view(), async_views.featured_articles_view,
+               name='featured_articles'),
+    read_route('articles/latest/', LatestArticlesView.as_view(), async_views.latest_articles_view,
+               name='latest_articles'),
     path('articles/<slug:slug>/', HealthArticleDetailView.as_view(), name='article_detail'),
     
     # Privacy & FAQ
-    path('privacy-policy/', PrivacyPolicyView.as_view(), name='privacy_policy'),
-    path('faqs/', FAQListView.as_view(), name='faq_list'),
+    read_route('privacy-policy/', PrivacyPolicyView.as_view(), async_views.privacy_policy_view,
+               name='privacy_policy'),
+    read_route('faqs/', FAQListView.as_view(), async_views.faq_list_view, name='faq_list'),
     
     # Combined
-    path('public/', PublicHealthInfoView.as_view(), name='public_health_info'),
+    read_route('public/', PublicHealthInfoView.as_view(), async_views.public_health_info_view,
+               name='public_health_info'),
+    
+    # Search
+    path('search/', SearchView.as_view(), name='health_search'),
+    
+    # Monitoring
+    path('cache-stats/', CacheStatsView.as_view(), name='health_cache_stats'),
 ]
 
@@ -1,8 +1,12 @@
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.pagination import KeysetPagination
+from .cache import cached_response, cache_stats
 from .models import HealthArticle, PrivacyPolicy, FAQ
+from .queries import latest_per_category
+from .search import get_index
 from .serializers import (
     HealthArticleListSerializer, HealthArticleDetailSerializer,
     PrivacyPolicySerializer, FAQSerializer
@@ -13,6 +17,11 @@ class HealthArticleListView(generics.ListAPIView):
     """Public endpoint - list all published health articles"""
     permission_classes = [permissions.AllowAny]
     serializer_class = HealthArticleListSerializer
+    pagination_class = KeysetPagination
+    
+    @cached_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
     
     def get_queryset(self):
         queryset = HealthArticle.objects.filter(is_published=True)
@@ -44,6 +53,7 @@ class FeaturedArticlesView(APIView):
     """Get featured health articles for homepage"""
     permission_classes = [permissions.AllowAny]
     
+    @cached_response
     def get(self, request):
         articles = HealthArticle.objects.filter(is_published=True, is_featured=True)[:6]
         serializer = HealthArticleListSerializer(articles, many=True)
@@ -51,29 +61,25 @@ class FeaturedArticlesView(APIView):
 
 
 class LatestArticlesView(APIView):
-    """Get latest health articles"""
+    """Get the latest article of each main category (?categories=a,b&per_category=n)"""
     permission_classes = [permissions.AllowAny]
     
+    @cached_response
     def get(self, request):
-        # Get one article from each main category
-        categories = ['covid', 'flu', 'mental_health']
-        articles = []
-        
-        for cat in categories:
-            article = HealthArticle.objects.filter(
-                is_published=True, 
-                category=cat
-            ).first()
-            if article:
-                articles.append(article)
-        
-        # If not enough articles, get latest ones
-        if len(articles) < 3:
-            extra = HealthArticle.objects.filter(is_published=True).exclude(
-                id__in=[a.id for a in articles]
-            )[:3 - len(articles)]
-            articles.extend(extra)
+        categories = None
+        if request.query_params.get('categories'):
+            categories = request.query_params['categories'].split(',')
+            valid = {choice for choice, _ in HealthArticle.CATEGORY_CHOICES}
+            if not set(categories) <= valid:
+                return Response({'error': 'Unknown category'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            per_category = int(request.query_params.get('per_category', 1))
+        except ValueError:
+            per_category = 0
+        if not 1 <= per_category <= 10:
+            return Response({'error': 'per_category must be between 1 and 10'}, status=status.HTTP_400_BAD_REQUEST)
         
+        articles = latest_per_category(categories, per_category=per_category)
         serializer = HealthArticleListSerializer(articles, many=True)
         return Response(serializer.data)
 
@@ -82,6 +88,7 @@ class PrivacyPolicyView(APIView):
     """Get current active privacy policy"""
     permission_classes = [permissions.AllowAny]
     
+    @cached_response
     def get(self, request):
         policy = PrivacyPolicy.objects.filter(is_active=True).first()
         if policy:
@@ -99,6 +106,11 @@ class FAQListView(generics.ListAPIView):
     """Public endpoint - list FAQs"""
     permission_classes = [permissions.AllowAny]
     serializer_class = FAQSerializer
+    pagination_class = KeysetPagination
+    
+    @cached_response
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
     
     def get_queryset(self):
         queryset = FAQ.objects.filter(is_active=True)
@@ -114,9 +126,10 @@ class PublicHealthInfoView(APIView):
     """Combined public health information for homepage"""
     permission_classes = [permissions.AllowAny]
     
+    @cached_response
     def get(self, request):
-        # Get latest articles
-        latest_articles = HealthArticle.objects.filter(is_published=True)[:6]
+        # Get latest articles, two from each main category
+        latest_articles = latest_per_category(per_category=2, limit=6)
         
         # Get FAQ
         faqs = FAQ.objects.filter(is_active=True)[:5]
@@ -125,3 +138,61 @@ class PublicHealthInfoView(APIView):
             'articles': HealthArticleListSerializer(latest_articles, many=True).data,
             'faqs': FAQSerializer(faqs, many=True).data,
         })
+
+
+class SearchView(APIView):
+    """
+    Search articles and FAQs (?q=, optional ?category=, ?type=article|faq,
+    ?limit=, ?offset=), ranked by relevance with per-category match counts
+    """
+    permission_classes = [permissions.AllowAny]
+    
+    @cached_response
+    def get(self, request):
+        # Untrimmed: a trailing space ends the word being typed
+        query = request.query_params.get('q', '')
+        if not query.strip() or len(query) > 200:
+            return Response({'error': 'q must be 1 to 200 characters'}, status=status.HTTP_400_BAD_REQUEST)
+        kind = request.query_params.get('type') or None
+        if kind not in (None, 'article', 'faq'):
+            return Response({'error': 'type must be article or faq'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= 50 or offset < 0:
+            return Response({'error': 'limit must be between 1 and 50 and offset not negative'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        found = get_index().search(query, category=request.query_params.get('category') or None,
+                                   kind=kind, limit=limit, offset=offset)
+        ids = {'article': [], 'faq': []}
+        for hit_kind, hit_id, _ in found['hits']:
+            ids[hit_kind].append(hit_id)
+        items = {}
+        if ids['article']:
+            articles = HealthArticle.objects.filter(pk__in=ids['article'], is_published=True)
+            for data in HealthArticleListSerializer(articles, many=True).data:
+                items[('article', data['id'])] = data
+        if ids['faq']:
+            for data in FAQSerializer(FAQ.objects.filter(pk__in=ids['faq'], is_active=True), many=True).data:
+                items[('faq', data['id'])] = data
+        
+        return Response({
+            'count': found['count'],
+            'results': [
+                {'type': hit_kind, 'score': score, 'item': items[(hit_kind, hit_id)]}
+                for hit_kind, hit_id, score in found['hits'] if (hit_kind, hit_id) in items
+            ],
+            'facets': found['facets'],
+            'corrections': found['corrections'],
+        })
+
+
+class CacheStatsView(APIView):
+    """Hit/miss counters of the public response cache (this process)"""
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(cache_stats())
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import WellnessGoal, DailyGoalLog, PreventiveCareReminder, HealthTip
+from .models import WellnessGoal, DailyGoalLog, PreventiveCareReminder, HealthTip, WellnessDailyRollup
 
 
 @admin.register(WellnessGoal)
@@ -29,3 +29,11 @@ class HealthTipAdmin(admin.ModelAdmin):
     list_display = ['title', 'category', 'is_active', 'display_date']
     list_filter = ['category', 'is_active']
     search_fields = ['title', 'content']
+
+
+@admin.register(WellnessDailyRollup)
+class WellnessDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'goal_type', 'date', 'total', 'target', 'completed', 'log_count']
+    list_filter = ['goal_type', 'completed']
+    search_fields = ['user__email']
+    date_hierarchy = 'date'
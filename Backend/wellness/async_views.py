@@ -0,0 +1,81 @@
+"""
+Async variants of the dashboard's read endpoints, selected per route by
+ASYNC_READ_ROUTES (see core.async_views). They return the same data as
+TodayGoalsView, UpcomingRemindersView and HealthTipOfDayView.
+"""
+import logging
+
+from django.http import JsonResponse
+from django.utils import timezone
+
+from core.async_views import read_view, run_sync
+from core.mongo import get_async_collection, from_document, mongo_date
+from .dashboard import today_goals, upcoming_reminders
+from .models import WellnessGoal, PreventiveCareReminder, HealthTip
+from .serializers import WellnessGoalSerializer, PreventiveCareReminderSerializer
+from .tips import DEFAULT_TIP, tip_of_the_day
+
+logger = logging.getLogger(__name__)
+
+
+async def _find(collection, model, query, sort=None, limit=0):
+    cursor = collection.find(query, sort=sort, limit=limit)
+    return [from_document(model, document) async for document in cursor]
+
+
+@read_view(trust_token_claims=True)
+async def today_goals_view(request):
+    today = timezone.now().date()
+    try:
+        goals = []
+        collection = get_async_collection(WellnessGoal)
+        if collection is not None:
+            goals = await _find(
+                collection, WellnessGoal, {'user_id': request.user.id, 'date': mongo_date(today)},
+                sort=[('goal_type', 1)]
+            )
+        if not goals:
+            # No Motor, or recurring goals still to be materialized
+            goals = await run_sync(today_goals, request.user, today)
+        return WellnessGoalSerializer(goals, many=True).data
+    except Exception:
+        logger.exception('today_goals_view failed')
+        # Return empty goals instead of error to allow dashboard to load
+        return []
+
+
+@read_view(trust_token_claims=True)
+async def upcoming_reminders_view(request):
+    today = timezone.now().date()
+    try:
+        collection = get_async_collection(PreventiveCareReminder)
+        if collection is None:
+            reminders = await run_sync(lambda: list(upcoming_reminders(request.user, today)))
+        else:
+            reminders = await _find(
+                collection, PreventiveCareReminder,
+                {'user_id': request.user.id, 'status': 'upcoming', 'scheduled_date': {'$gte': mongo_date(today)}},
+                sort=[('scheduled_date', 1)], limit=5
+            )
+        return PreventiveCareReminderSerializer(reminders, many=True).data
+    except Exception:
+        logger.exception('upcoming_reminders_view failed')
+        return []
+
+
+@read_view(public=True)
+async def health_tip_view(request):
+    today = timezone.now().date()
+    category = request.GET.get('category')
+    if category and category not in dict(HealthTip.CATEGORY_CHOICES):
+        return JsonResponse({'error': 'Unknown category'}, status=400)
+    try:
+        # Served from the scheduler's cache; only a cold cache leaves the loop
+        tip = tip_of_the_day(today, request.user, category, load=False)
+        if tip is None:
+            tip = await run_sync(tip_of_the_day, today, request.user, category)
+        return tip
+    except Exception:
+        logger.exception('health_tip_view failed')
+        # Return default tip on error
+        return DEFAULT_TIP
@@ -0,0 +1,127 @@
+"""
+Sections of the patient dashboard and their concurrent execution.
+
+The dashboard front-end used to call five endpoints; DashboardV2View returns
+the same data in one response. The sections do not depend on each other, so
+with DASHBOARD_PARALLEL build_dashboard() runs them on a shared thread pool
+(database drivers release the GIL while waiting on the server) and the
+response takes about as long as its slowest section. Pool threads keep their
+database connections between requests, checking out of the alias's shared
+MongoClient pool (core.mongo_backend). Each section is timed for the
+Server-Timing header, and a failing section is reported without failing the
+others.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import WellnessGoal, PreventiveCareReminder
+from .rollover import materialize_goals
+from .serializers import WellnessGoalSerializer, PreventiveCareReminderSerializer
+from .stats import progress_summary
+from .tips import tip_of_the_day
+
+logger = logging.getLogger(__name__)
+
+def today_goals(user, today):
+    """Today's goals, materializing recurring ones if the nightly rollover has not"""
+    goals = list(WellnessGoal.objects.filter(user=user, date=today))
+    # Goals are normally materialized by the nightly rollover_recurring_goals
+    # job; create them here only for users it has not covered yet
+    if not goals:
+        materialize_goals([user.id], today)
+        goals = list(WellnessGoal.objects.filter(user=user, date=today))
+    return goals
+
+
+def upcoming_reminders(user, today, limit=5):
+    return PreventiveCareReminder.objects.filter(
+        user=user,
+        status='upcoming',
+        scheduled_date__gte=today
+    ).order_by('scheduled_date')[:limit]
+
+
+def _user_section(user, today):
+    return {'first_name': user.first_name, 'last_name': user.last_name}
+
+
+def _goals_section(user, today):
+    return WellnessGoalSerializer(today_goals(user, today), many=True).data
+
+
+def _reminders_section(user, today):
+    return PreventiveCareReminderSerializer(upcoming_reminders(user, today), many=True).data
+
+
+def _tip_section(user, today):
+    return tip_of_the_day(today, user)
+
+
+def _weekly_section(user, today):
+    return progress_summary(user, today, days=7)
+
+
+SECTIONS = {
+    'user': _user_section,
+    'goals': _goals_section,
+    'reminders': _reminders_section,
+    'health_tip': _tip_section,
+    'weekly': _weekly_section,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DASHBOARD_WORKERS, thread_name_prefix='dashboard'
+            )
+        return _executor
+
+
+def _run_section(name, user, today, in_pool):
+    started = time.perf_counter()
+    try:
+        return SECTIONS[name](user, today), None, (time.perf_counter() - started) * 1000
+    except Exception as e:
+        logger.exception('Dashboard section %s failed', name)
+        if in_pool:
+            # Pool threads otherwise keep their connection; drop it if it broke
+            close_old_connections()
+        return None, str(e), (time.perf_counter() - started) * 1000
+
+
+def build_dashboard(user, today, sections):
+    """({section: data}, {section: ms}, {section: error}) for the requested sections"""
+    if settings.DASHBOARD_PARALLEL and len(sections) > 1:
+        executor = get_executor()
+        # Each task runs in a copy of the request's context, so per-request
+        # instrumentation (core.mongo_pool) sees its queries
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, _run_section, name, user, today, True)
+            for name in sections
+        }
+        results = {name: future.result() for name, future in futures.items()}
+    else:
+        results = {name: _run_section(name, user, today, False) for name in sections}
+
+    data = {name: result for name, (result, _, _) in results.items()}
+    timings = {name: ms for name, (_, _, ms) in results.items()}
+    errors = {name: error for name, (_, error, _) in results.items() if error}
+    return data, timings, errors
+
+
+def server_timing(timings, total_ms):
+    metrics = [f'{name};dur={ms:.1f}' for name, ms in timings.items()]
+    metrics.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(metrics)
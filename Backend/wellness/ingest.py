@@ -0,0 +1,212 @@
+"""
+Bulk ingestion of wearable readings into DailyGoalLog.
+
+Readings are parsed from the request body as a stream (a JSON array or
+NDJSON) and processed in fixed-size chunks, so memory stays bounded however
+many readings a device uploads. For each chunk the target goals are resolved
+(and created if missing) with one query, the logs are bulk-created and the
+per-goal totals are applied as atomic increments. A single reading may take
+at most MAX_READING_SIZE characters, so a malformed body fails early rather
+than being buffered to its end.
+"""
+import codecs
+import json
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import WellnessGoal, DailyGoalLog
+from .progress import apply_increments
+from .rollover import default_goal, create_goals
+
+MAX_READINGS_PER_REQUEST = 10000
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+MAX_READING_SIZE = 64 * 1024
+
+GOAL_TYPES = {choice for choice, _ in WellnessGoal.GOAL_TYPE_CHOICES}
+
+
+def iter_ndjson(stream, max_item_size=MAX_READING_SIZE):
+    """Yield one decoded value per non-blank line; undecodable lines yield a ValueError"""
+    while True:
+        line = stream.readline(max_item_size + 1)
+        if not line:
+            return
+        if len(line) > max_item_size:
+            raise ValueError(f'Reading longer than {max_item_size} bytes')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield e
+
+
+def iter_json_array(stream, chunk_size=64 * 1024, max_item_size=MAX_READING_SIZE):
+    """Yield the items of a top-level JSON array without reading the whole body into memory"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    eof = False
+
+    def fill():
+        nonlocal buffer, eof
+        if eof:
+            return False
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer += utf8.decode(chunk or b'', final=eof)
+        return True
+
+    def next_char():
+        nonlocal buffer
+        while True:
+            buffer = buffer.lstrip()
+            if buffer:
+                return buffer[0]
+            if not fill():
+                raise ValueError('Unexpected end of JSON array')
+
+    if next_char() != '[':
+        raise ValueError('Expected a JSON array')
+    buffer = buffer[1:]
+    if next_char() == ']':
+        return
+
+    while True:
+        next_char()
+        try:
+            item, end = decoder.raw_decode(buffer)
+            # A value ending exactly at the buffer edge may continue in the next chunk
+            if end == len(buffer) and not eof:
+                raise ValueError
+        except ValueError:
+            # Reading more would only buffer the rest of a malformed body
+            if len(buffer) > max_item_size:
+                raise ValueError(f'Invalid JSON array, or an item longer than {max_item_size} characters')
+            if not fill():
+                raise ValueError('Invalid JSON array')
+            continue
+        yield item
+        buffer = buffer[end:]
+
+        separator = next_char()
+        buffer = buffer[1:]
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError('Expected "," or "]" in JSON array')
+
+
+def _parse_reading(reading, now):
+    """Validate one reading; returns (goal_type, date, value, logged_at, notes)"""
+    if isinstance(reading, ValueError):
+        raise ValueError('Invalid JSON')
+    if not isinstance(reading, dict):
+        raise ValueError('Reading must be an object')
+
+    goal_type = reading.get('goal_type')
+    if goal_type not in GOAL_TYPES:
+        raise ValueError('Unknown goal_type')
+    try:
+        value = float(reading.get('value'))
+    except (TypeError, ValueError):
+        raise ValueError('value must be a number')
+
+    logged_at = now
+    if reading.get('logged_at'):
+        logged_at = parse_datetime(str(reading['logged_at']))
+        if logged_at is None:
+            raise ValueError('logged_at must be an ISO 8601 datetime')
+        if timezone.is_naive(logged_at):
+            logged_at = timezone.make_aware(logged_at)
+        if logged_at > now:
+            raise ValueError('logged_at is in the future')
+
+    notes = reading.get('notes') or ''
+    return goal_type, timezone.localtime(logged_at).date(), value, logged_at, str(notes)
+
+
+class ReadingIngestor:
+    """Accumulates readings for one user and writes them in chunks"""
+
+    def __init__(self, user, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.now = timezone.now()
+        self.goal_ids = {}  # (goal_type, date) -> goal id, reused across chunks
+        self.pending = []
+        self.received = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.goals_created = 0
+        self.errors = []
+
+    def reject(self, index, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'index': index, 'error': message})
+
+    def add(self, reading):
+        index = self.received
+        self.received += 1
+        try:
+            self.pending.append(_parse_reading(reading, self.now))
+        except ValueError as e:
+            self.reject(index, str(e))
+            return
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def _resolve_goals(self, keys):
+        missing = keys - set(self.goal_ids)
+        if not missing:
+            return
+        goal_types = {goal_type for goal_type, _ in missing}
+        dates = {date for _, date in missing}
+
+        def lookup():
+            rows = WellnessGoal.objects.filter(
+                user=self.user, goal_type__in=goal_types, date__in=dates
+            ).values_list('id', 'goal_type', 'date')
+            for goal_id, goal_type, date in rows:
+                self.goal_ids[(goal_type, date)] = goal_id
+
+        lookup()
+        to_create = [
+            default_goal(self.user.id, goal_type, date, is_recurring=False)
+            for goal_type, date in missing - set(self.goal_ids)
+        ]
+        if to_create:
+            self.goals_created += create_goals(to_create)
+            lookup()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self._resolve_goals({(goal_type, date) for goal_type, date, _, _, _ in self.pending})
+
+        logs = []
+        totals = {}
+        counts = {}
+        for goal_type, date, value, logged_at, notes in self.pending:
+            goal_id = self.goal_ids[(goal_type, date)]
+            logs.append(DailyGoalLog(goal_id=goal_id, value=value, notes=notes, logged_at=logged_at))
+            totals[goal_id] = totals.get(goal_id, 0.0) + value
+            counts[goal_id] = counts.get(goal_id, 0) + 1
+
+        DailyGoalLog.objects.bulk_create(logs, batch_size=self.chunk_size)
+        apply_increments(totals, counts)
+        self.accepted += len(logs)
+        self.pending = []
+
+    def summary(self):
+        return {
+            'received': self.received,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'goals_created': self.goals_created,
+            'errors': self.errors,
+        }
@@ -0,0 +1,48 @@
+"""
+Management command to create the upcoming occurrences of recurring reminders
+for all users, up to the horizon (see wellness.recurrence)
+Run nightly (e.g. from cron) to move the horizon forward: python manage.py backfill_reminder_occurrences
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from wellness.recurrence import extend_users
+from .backfill_wellness_rollups import iter_user_batches
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming occurrences of recurring preventive-care reminders up to the horizon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Treat this YYYY-MM-DD date as today (default: today)')
+        parser.add_argument('--horizon-days', type=int, default=settings.REMINDER_HORIZON_DAYS,
+                            help='Create occurrences up to this many days ahead')
+        parser.add_argument('--max-upcoming', type=int, default=settings.REMINDER_HORIZON_OCCURRENCES,
+                            help='Upcoming occurrences to keep per series')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per batch')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+
+        started = time.monotonic()
+        user_count = 0
+        created = 0
+        for user_ids in iter_user_batches(options['batch_size']):
+            created += extend_users(
+                user_ids, today=today,
+                horizon_days=options['horizon_days'], max_upcoming=options['max_upcoming']
+            )
+            user_count += len(user_ids)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} reminder occurrences for {user_count} users in {elapsed:.2f}s'
+        ))
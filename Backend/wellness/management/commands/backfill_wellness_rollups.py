@@ -0,0 +1,46 @@
+"""
+Management command to build WellnessDailyRollup from existing goals and logs
+Run: python manage.py backfill_wellness_rollups
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from wellness.rollups import reconcile_users
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Backfill the daily wellness rollup table from WellnessGoal and DailyGoalLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Users per batch')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        totals = {'checked': 0, 'missing': 0, 'stale': 0, 'orphaned': 0}
+        user_count = 0
+        for user_ids in iter_user_batches(options['batch_size']):
+            for key, value in reconcile_users(user_ids, fix=True).items():
+                totals[key] += value
+            user_count += len(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled rollups for {user_count} users in {time.monotonic() - started:.2f}s: "
+            f"{totals['missing']} created, {totals['stale']} updated, {totals['orphaned']} removed"
+        ))
+
+
+def iter_user_batches(batch_size):
+    """Yield lists of user ids in keyset order"""
+    users = User.objects.order_by('id')
+    last_id = None
+    while True:
+        batch = users if last_id is None else users.filter(id__gt=last_id)
+        user_ids = list(batch.values_list('id', flat=True)[:batch_size])
+        if not user_ids:
+            return
+        yield user_ids
+        last_id = user_ids[-1]
@@ -0,0 +1,75 @@
+"""
+Management command to send notifications for preventive-care reminders as
+they fall due, through the channels in REMINDER_NOTIFICATION_CHANNELS
+(see wellness.notifications)
+Run as a long-lived process: python manage.py dispatch_reminder_notifications
+or once a minute from cron: python manage.py dispatch_reminder_notifications --once
+"""
+import signal
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wellness.notifications import Dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Send notifications for preventive-care reminders as they fall due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send what is due now and exit')
+        parser.add_argument('--tick', type=float, default=1.0, help='Longest sleep between checks, in seconds')
+        parser.add_argument('--refresh', type=float, default=5.0,
+                            help='Seconds between loading changed reminders')
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between progress lines')
+        parser.add_argument('--lookahead-hours', type=int, default=settings.REMINDER_DISPATCH_LOOKAHEAD_HOURS,
+                            help='Keep reminders due within this many hours in memory')
+        parser.add_argument('--catchup-hours', type=int, default=settings.REMINDER_DISPATCH_CATCHUP_HOURS,
+                            help='Still send reminders that fell due up to this many hours ago')
+        parser.add_argument('--batch-size', type=int, default=settings.REMINDER_NOTIFICATION_BATCH_SIZE,
+                            help='Notifications per batch sent to a channel')
+
+    def handle(self, *args, **options):
+        dispatcher = Dispatcher(
+            lookahead=timedelta(hours=options['lookahead_hours']),
+            catchup=timedelta(hours=options['catchup_hours']),
+            batch_size=options['batch_size'],
+        )
+        started = time.monotonic()
+        if options['once']:
+            try:
+                dispatcher.run_once()
+            finally:
+                dispatcher.close()
+        else:
+            stop = threading.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+            self.stdout.write(f"Dispatching reminder notifications to {', '.join(dispatcher.channels)}")
+            dispatcher.run(
+                stop, tick=options['tick'], refresh_interval=options['refresh'],
+                stats_interval=options['stats_interval'], report=self._report,
+            )
+
+        stats = dispatcher.metrics.stats()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {stats['sent']} reminder notifications ({stats['failed']} failed, "
+            f"{stats['retries']} retries) in {elapsed:.2f}s" + self._lag(stats)
+        ))
+
+    def _report(self, stats):
+        self.stdout.write(
+            f"sent {stats['sent']}, failed {stats['failed']}, retries {stats['retries']}, "
+            f"waiting {stats['waiting']}, batches in flight {stats['in_flight']}" + self._lag(stats)
+        )
+
+    @staticmethod
+    def _lag(stats):
+        if 'lag_p50' not in stats:
+            return ''
+        return f"; lag p50 {stats['lag_p50']}s, p99 {stats['lag_p99']}s, max {stats['lag_max']}s"
@@ -0,0 +1,66 @@
+"""
+Management command to materialize the next day's wellness goals for all patients
+Run nightly (e.g. from cron): python manage.py rollover_recurring_goals
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from wellness.rollover import materialize_goals
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Bulk-create recurring and default wellness goals for a date (default: tomorrow)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Target date as YYYY-MM-DD (default: tomorrow)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per batch')
+        parser.add_argument(
+            '--lookback-days', type=int, default=None,
+            help='Look for recurring goals to copy forward this far back first (default: whole history); '
+                 'users with none that recent are still searched over their whole history'
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        else:
+            date = timezone.now().date() + timedelta(days=1)
+
+        batch_size = options['batch_size']
+        users = User.objects.filter(is_active=True, role='patient').order_by('id')
+
+        self.stdout.write(f'Materializing goals for {date}...')
+        started = time.monotonic()
+        user_count = 0
+        goal_count = 0
+        last_id = None
+
+        # Keyset batches so memory stays bounded regardless of user count
+        while True:
+            batch = users if last_id is None else users.filter(id__gt=last_id)
+            user_ids = list(batch.values_list('id', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            goal_count += materialize_goals(
+                user_ids, date,
+                lookback_days=options['lookback_days'],
+                batch_size=batch_size
+            )
+            user_count += len(user_ids)
+            last_id = user_ids[-1]
+
+        elapsed = time.monotonic() - started
+        rate = user_count / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {goal_count} goals for {user_count} users in {elapsed:.2f}s '
+            f'({rate:.0f} users/sec)'
+        ))
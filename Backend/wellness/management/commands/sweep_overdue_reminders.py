@@ -0,0 +1,61 @@
+"""
+Management command to mark preventive-care reminders that are still upcoming
+after their date as missed (see wellness.sweeper)
+Run periodically (e.g. hourly from cron, on any number of nodes): python manage.py sweep_overdue_reminders
+"""
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.leases import Lease, LeaseLost
+from wellness.sweeper import overdue_cutoff, overdue_reminders, sweep_overdue
+
+
+class Command(BaseCommand):
+    help = 'Mark overdue preventive-care reminders as missed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Treat this YYYY-MM-DD date as today (default: today)')
+        parser.add_argument('--grace-days', type=int, default=settings.REMINDER_MISSED_AFTER_DAYS,
+                            help='Reminders become missed this many days after their date')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Reminders per update')
+        parser.add_argument('--extend-recurrences', action='store_true',
+                            help='Top up the series of swept recurring reminders')
+        parser.add_argument('--dry-run', action='store_true', help='Count the overdue reminders without changing them')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be in YYYY-MM-DD format')
+        if options['grace_days'] < 0:
+            raise CommandError('--grace-days must not be negative')
+        cutoff = overdue_cutoff(today, options['grace_days'])
+
+        if options['dry_run']:
+            count = overdue_reminders(cutoff).count()
+            self.stdout.write(self.style.SUCCESS(f'Would mark {count} reminders dated before {cutoff} missed'))
+            return
+
+        lease = Lease('sweep_overdue_reminders', ttl=settings.REMINDER_SWEEP_LEASE_SECONDS)
+        if not lease.acquire():
+            self.stdout.write('Another node is sweeping overdue reminders; skipped')
+            return
+        started = time.monotonic()
+        with lease:
+            try:
+                counts = sweep_overdue(
+                    cutoff, batch_size=options['batch_size'],
+                    extend=options['extend_recurrences'], lease=lease,
+                )
+            except LeaseLost as error:
+                raise CommandError(f'{error}; stopped sweeping')
+
+        message = f"Marked {counts['missed']} reminders dated before {cutoff} missed in {counts['batches']} batches"
+        if options['extend_recurrences']:
+            message += f", created {counts['occurrences']} occurrences"
+        self.stdout.write(self.style.SUCCESS(f'{message} in {time.monotonic() - started:.2f}s'))
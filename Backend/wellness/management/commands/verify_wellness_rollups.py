@@ -0,0 +1,34 @@
+"""
+Management command to check WellnessDailyRollup against the raw goals and logs
+Run: python manage.py verify_wellness_rollups [--fix]
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from wellness.rollups import reconcile_users
+from .backfill_wellness_rollups import iter_user_batches
+
+
+class Command(BaseCommand):
+    help = 'Verify the daily wellness rollup table against WellnessGoal and DailyGoalLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Users per batch')
+        parser.add_argument('--fix', action='store_true', help='Repair any mismatched rows')
+
+    def handle(self, *args, **options):
+        totals = {'checked': 0, 'missing': 0, 'stale': 0, 'orphaned': 0}
+        for user_ids in iter_user_batches(options['batch_size']):
+            for key, value in reconcile_users(user_ids, fix=options['fix']).items():
+                totals[key] += value
+
+        mismatches = totals['missing'] + totals['stale'] + totals['orphaned']
+        summary = (
+            f"Checked {totals['checked']} rollup rows: {totals['missing']} missing, "
+            f"{totals['stale']} stale, {totals['orphaned']} orphaned"
+        )
+        if mismatches and not options['fix']:
+            raise CommandError(summary)
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f'{summary} (repaired)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
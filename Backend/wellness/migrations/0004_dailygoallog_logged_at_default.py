@@ -0,0 +1,19 @@
+# Generated by Django 3.1.12 on 2026-10-18 04:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wellness', '0003_wellnessgoal_is_recurring'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailygoallog',
+            name='logged_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
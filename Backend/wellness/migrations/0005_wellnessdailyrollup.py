@@ -0,0 +1,41 @@
+# Generated by Django 3.1.12 on 2026-10-18 04:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wellness', '0004_dailygoallog_logged_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WellnessDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('goal_type', models.CharField(choices=[('steps', 'Steps'), ('active_time', 'Active Time'), ('sleep', 'Sleep'), ('water', 'Water Intake'), ('calories', 'Calories'), ('custom', 'Custom')], max_length=20)),
+                ('total', models.FloatField(default=0)),
+                ('target', models.FloatField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('log_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wellness_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date', 'goal_type'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='wellnessdailyrollup',
+            index=models.Index(fields=['user', 'date'], name='rollup_user_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='wellnessdailyrollup',
+            unique_together={('user', 'goal_type', 'date')},
+        ),
+    ]
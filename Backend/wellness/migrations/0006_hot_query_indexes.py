@@ -0,0 +1,33 @@
+# Generated by Django 3.1.12 on 2026-10-18 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wellness', '0005_wellnessdailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailygoallog',
+            index=models.Index(fields=['goal', '-logged_at'], name='goallog_goal_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthtip',
+            index=models.Index(fields=['-display_date', '-created_at', 'is_active'], name='tip_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='preventivecarereminder',
+            index=models.Index(fields=['user', 'status', 'scheduled_date'], name='reminder_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wellnessgoal',
+            index=models.Index(fields=['user', '-date'], name='goal_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wellnessgoal',
+            index=models.Index(fields=['date', 'is_recurring'], name='goal_date_recurring_idx'),
+        ),
+    ]
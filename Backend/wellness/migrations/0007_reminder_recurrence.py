@@ -0,0 +1,26 @@
+# Generated by Django 3.1.12 on 2026-10-18 05:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wellness', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preventivecarereminder',
+            name='recurrence_of',
+            field=models.PositiveIntegerField(blank=True, help_text='First reminder of the series', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='preventivecarereminder',
+            index=models.Index(fields=['user', 'scheduled_date'], name='reminder_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='preventivecarereminder',
+            index=models.Index(fields=['recurrence_of', 'scheduled_date'], name='reminder_series_idx'),
+        ),
+    ]
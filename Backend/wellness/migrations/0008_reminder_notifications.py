@@ -0,0 +1,26 @@
+# Generated by Django 3.1.12 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wellness', '0007_reminder_recurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preventivecarereminder',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='preventivecarereminder',
+            index=models.Index(fields=['status', 'scheduled_date'], name='reminder_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='preventivecarereminder',
+            index=models.Index(fields=['updated_at'], name='reminder_updated_idx'),
+        ),
+    ]
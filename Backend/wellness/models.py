@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 
 class WellnessGoal(models.Model):
@@ -42,6 +43,10 @@ class WellnessGoal(models.Model):
     class Meta:
         ordering = ['-date', 'goal_type']
         unique_together = ['user', 'goal_type', 'date']
+        indexes = [
+            models.Index(fields=['user', '-date'], name='goal_user_date_idx'),
+            models.Index(fields=['date', 'is_recurring'], name='goal_date_recurring_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.title} - {self.date}"
@@ -75,10 +80,11 @@ class DailyGoalLog(models.Model):
     goal = models.ForeignKey(WellnessGoal, on_delete=models.CASCADE, related_name='logs')
     value = models.FloatField(default=0)  # Changed from DecimalField to FloatField
     notes = models.TextField(blank=True, null=True)
-    logged_at = models.DateTimeField(auto_now_add=True)
+    logged_at = models.DateTimeField(default=timezone.now)  # Devices may log readings after the fact
     
     class Meta:
         ordering = ['-logged_at']
+        indexes = [models.Index(fields=['goal', '-logged_at'], name='goallog_goal_time_idx')]
     
     def __str__(self):
         return f"{self.goal.title} - {self.value} at {self.logged_at}"
@@ -123,12 +129,23 @@ class PreventiveCareReminder(models.Model):
     # For recurring reminders
     is_recurring = models.BooleanField(default=False)
     recurrence_interval = models.PositiveIntegerField(blank=True, null=True, help_text="Days between reminders")
+    # Occurrences created by wellness.recurrence point at the reminder that started the series
+    recurrence_of = models.PositiveIntegerField(blank=True, null=True, help_text="First reminder of the series")
+    # Set by wellness.notifications when the reminder was sent for its current date and time
+    notified_at = models.DateTimeField(blank=True, null=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['scheduled_date', 'scheduled_time']
+        indexes = [
+            models.Index(fields=['user', 'status', 'scheduled_date'], name='reminder_user_status_idx'),
+            models.Index(fields=['user', 'scheduled_date'], name='reminder_user_date_idx'),
+            models.Index(fields=['recurrence_of', 'scheduled_date'], name='reminder_series_idx'),
+            models.Index(fields=['status', 'scheduled_date'], name='reminder_due_idx'),
+            models.Index(fields=['updated_at'], name='reminder_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.title} - {self.scheduled_date}"
@@ -154,6 +171,38 @@ class HealthTip(models.Model):
     
     class Meta:
         ordering = ['-display_date', '-created_at']
+        indexes = [models.Index(fields=['-display_date', '-created_at', 'is_active'], name='tip_order_idx')]
     
     def __str__(self):
         return self.title
+
+
+class WellnessDailyRollup(models.Model):
+    """Per-day, per-goal-type totals for trend queries, kept in sync by wellness.rollups"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wellness_rollups')
+    date = models.DateField()
+    goal_type = models.CharField(max_length=20, choices=WellnessGoal.GOAL_TYPE_CHOICES)
+    total = models.FloatField(default=0)
+    target = models.FloatField(default=0)
+    completed = models.BooleanField(default=False)
+    log_count = models.PositiveIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['date', 'goal_type']
+        unique_together = ['user', 'goal_type', 'date']
+        indexes = [models.Index(fields=['user', 'date'], name='rollup_user_date_idx')]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.goal_type} - {self.date}"
+
+
+class JobLease(models.Model):
+    """Lets one node at a time run a periodic job (see core.leases.Lease)"""
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=200, blank=True, default='')
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name} - {self.owner} until {self.expires_at}"
@@ -0,0 +1,402 @@
+"""
+Notifications for due preventive-care reminders.
+
+Dispatcher keeps the upcoming reminders due within a look-ahead window in a
+heap ordered by due time (scheduled_date at scheduled_time, or
+REMINDER_DEFAULT_TIME). It loads the window once, then refreshes
+incrementally: whole days as they enter the window, and reminders whose
+updated_at is newer than the last one seen, so reschedules, completions and
+new reminders are picked up without reloading. Heap entries superseded by a
+refresh are skipped when they come up.
+
+Due reminders are sent in batches to every channel in
+REMINDER_NOTIFICATION_CHANNELS. Each channel has its own thread pool, sized
+by its CONCURRENCY, and retries a failed batch up to MAX_ATTEMPTS times with
+exponential backoff. A reminder is marked notified (notified_at) once every
+channel has taken its batch. A reminder whose batch a channel gave up on is
+left unmarked and queued again, to be sent REMINDER_DISPATCH_RETRY_SECONDS
+later, and again after each failure, for as long as the dispatcher runs; a
+restarted dispatcher sends those still within its catch-up window. Delivery
+is at least once. Moving a reminder to a later time makes it due again.
+
+The dispatch_reminder_notifications command runs a Dispatcher.
+"""
+import heapq
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import PreventiveCareReminder
+
+logger = logging.getLogger(__name__)
+
+FIELDS = [
+    'id', 'user_id', 'user__email', 'title', 'reminder_type', 'location',
+    'scheduled_date', 'scheduled_time', 'status', 'notified_at', 'updated_at',
+]
+
+
+def due_time(scheduled_date, scheduled_time):
+    """When a reminder is due, in the current time zone"""
+    if scheduled_time is None:
+        scheduled_time = datetime.strptime(settings.REMINDER_DEFAULT_TIME, '%H:%M').time()
+    return timezone.make_aware(datetime.combine(scheduled_date, scheduled_time))
+
+
+# Channels
+
+class Channel:
+    """Sends batches of notifications (dicts); send() raises to have the batch retried"""
+
+    def __init__(self, concurrency=1, max_attempts=5, retry_delay=1.0):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def send(self, notifications):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileChannel(Channel):
+    """Appends notifications to a file as JSON lines"""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notifications):
+        lines = ''.join(json.dumps(notification) + '\n' for notification in notifications)
+        with self._lock, open(self.path, 'a') as file:
+            file.write(lines)
+
+
+class EmailChannel(Channel):
+    """One email per notification through EMAIL_BACKEND, over one connection per batch"""
+
+    def send(self, notifications):
+        messages = [
+            EmailMessage(
+                subject=f"Reminder: {notification['title']}",
+                body=f"Your {notification['title']} is due at {notification['due_at']}"
+                     + (f" at {notification['location']}." if notification['location'] else '.'),
+                to=[notification['email']],
+            )
+            for notification in notifications if notification['email']
+        ]
+        with get_connection(fail_silently=False) as connection:
+            connection.send_messages(messages)
+
+
+class WebhookChannel(Channel):
+    """POSTs each batch as {"notifications": [...]} to a URL; any non-2xx status fails the batch"""
+
+    def __init__(self, url, timeout=10, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notifications):
+        request = urllib.request.Request(
+            self.url, data=json.dumps({'notifications': notifications}).encode(),
+            headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def load_channels():
+    """{name: Channel} from REMINDER_NOTIFICATION_CHANNELS"""
+    channels = {}
+    for name, config in settings.REMINDER_NOTIFICATION_CHANNELS.items():
+        channels[name] = import_string(config['BACKEND'])(
+            concurrency=config.get('CONCURRENCY', 1),
+            max_attempts=config.get('MAX_ATTEMPTS', 5),
+            retry_delay=config.get('RETRY_DELAY', 1.0),
+            **config.get('OPTIONS', {}),
+        )
+    return channels
+
+
+# Dispatcher
+
+class DispatchMetrics:
+
+    def __init__(self, samples=100000):
+        self._lock = threading.Lock()
+        self._lags = deque(maxlen=samples)  # Seconds from due to delivered, for the latest notifications
+        self.counts = {'sent': 0, 'failed': 0, 'retries': 0, 'batches': 0, 'skipped': 0}
+
+    def add(self, **changes):
+        with self._lock:
+            for name, change in changes.items():
+                self.counts[name] += change
+
+    def delivered(self, lags):
+        with self._lock:
+            self.counts['sent'] += len(lags)
+            self._lags.extend(lags)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            lags = sorted(self._lags)
+        if lags:
+            stats['lag_p50'] = round(lags[len(lags) // 2], 3)
+            stats['lag_p99'] = round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 3)
+            stats['lag_max'] = round(lags[-1], 3)
+        return stats
+
+
+class Dispatcher:
+
+    def __init__(self, channels=None, lookahead=None, catchup=None, batch_size=None, retry_after=None,
+                 clock=timezone.now):
+        self.channels = load_channels() if channels is None else channels
+        self.lookahead = lookahead or timedelta(hours=settings.REMINDER_DISPATCH_LOOKAHEAD_HOURS)
+        # Reminders that fell due this long before the dispatcher started are still sent
+        self.catchup = catchup or timedelta(hours=settings.REMINDER_DISPATCH_CATCHUP_HOURS)
+        self.batch_size = batch_size or settings.REMINDER_NOTIFICATION_BATCH_SIZE
+        # Reminders of a failed batch are sent again this long after it failed
+        self.retry_after = retry_after or timedelta(seconds=settings.REMINDER_DISPATCH_RETRY_SECONDS)
+        self.clock = clock
+        self.metrics = DispatchMetrics()
+
+        self._heap = []           # (due_at, reminder id)
+        self._pending = {}        # reminder id -> (due_at, row) for the current schedule
+        self._retries = []        # (retry at, reminder id, due_at) for reminders of failed batches
+        self._loaded_through = None
+        self._last_update = None
+        self._executors = {
+            name: ThreadPoolExecutor(channel.concurrency, thread_name_prefix=f'notify-{name}')
+            for name, channel in self.channels.items()
+        }
+        self._batches = {}        # batch number -> {'rows', 'remaining', 'failed', 'finished'}
+        self._batch_numbers = itertools.count(1)
+        self._max_in_flight = 2 * max([channel.concurrency for channel in self.channels.values()] or [1])
+        self._finished = queue.Queue()  # (batch number, ok, when) from the channel threads
+
+    def __len__(self):
+        """Reminders waiting to fall due"""
+        return len(self._pending)
+
+    @property
+    def in_flight(self):
+        return len(self._batches)
+
+    # Schedule
+
+    def _track(self, row):
+        due_at = due_time(row['scheduled_date'], row['scheduled_time'])
+        if self._last_update is None or row['updated_at'] > self._last_update:
+            self._last_update = row['updated_at']
+        notified = row['notified_at'] is not None and row['notified_at'] >= due_at
+        if row['status'] != 'upcoming' or notified:
+            self._pending.pop(row['id'], None)
+            return
+        current = self._pending.get(row['id'])
+        self._pending[row['id']] = (due_at, row)
+        if current is None or current[0] != due_at:
+            heapq.heappush(self._heap, (due_at, row['id']))
+
+    def refresh(self):
+        """Load reminders that entered the window or changed since the last refresh"""
+        now = self.clock()
+        first = (now - self.catchup).date()
+        through = (now + self.lookahead).date()
+        reminders = PreventiveCareReminder.objects.order_by().values(*FIELDS)
+        if self._loaded_through is None:
+            rows = reminders.filter(status='upcoming', scheduled_date__gte=first, scheduled_date__lte=through)
+        else:
+            rows = []
+            if through > self._loaded_through:
+                rows = list(reminders.filter(
+                    status='upcoming', scheduled_date__gt=self._loaded_through, scheduled_date__lte=through
+                ))
+            if self._last_update is not None:
+                # >= as several rows can share a timestamp; seen ones are tracked again harmlessly
+                rows += list(reminders.filter(
+                    updated_at__gte=self._last_update, scheduled_date__gte=first, scheduled_date__lte=through
+                ))
+        if self._last_update is None:
+            self._last_update = now
+        for row in rows:
+            self._track(row)
+        self._loaded_through = through
+
+    def _current(self, reminder_id, due_at):
+        """Whether the schedule still has the reminder due at `due_at`"""
+        current = self._pending.get(reminder_id)
+        return current is not None and current[0] == due_at
+
+    def next_due(self):
+        """Time the earliest reminder waiting (or retry) is to be sent, or None"""
+        while self._heap and not self._current(self._heap[0][1], self._heap[0][0]):
+            heapq.heappop(self._heap)
+        while self._retries and not self._current(*self._retries[0][1:]):
+            heapq.heappop(self._retries)
+        return min([waiting[0][0] for waiting in (self._heap, self._retries) if waiting], default=None)
+
+    # Sending
+
+    def dispatch_due(self):
+        """Send every reminder due by now; returns how many were handed to the channels"""
+        now = self.clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, reminder_id = heapq.heappop(self._heap)
+            current = self._pending.get(reminder_id)
+            if current is not None and current[0] == due_at:
+                del self._pending[reminder_id]
+                due.append(current)
+        while self._retries and self._retries[0][0] <= now:
+            _, reminder_id, due_at = heapq.heappop(self._retries)
+            if self._current(reminder_id, due_at):
+                due.append(self._pending.pop(reminder_id))
+        sent = 0
+        for start in range(0, len(due), self.batch_size):
+            # Keep a few batches queued per channel thread rather than all of
+            # them, so early batches are not held up behind building later ones
+            while len(self._batches) >= self._max_in_flight:
+                self.collect(timeout=1)
+            sent += self._submit(due[start:start + self.batch_size], now)
+        return sent
+
+    def _submit(self, batch, now):
+        # Drop reminders deleted or completed since the last refresh
+        ids = [row['id'] for _, row in batch]
+        # (status is checked here rather than in the query, which could otherwise
+        # pick the status index over the primary key)
+        still_due = {
+            reminder_id for reminder_id, status
+            in PreventiveCareReminder.objects.filter(pk__in=ids).order_by().values_list('id', 'status')
+            if status == 'upcoming'
+        }
+        batch = [(due_at, row) for due_at, row in batch if row['id'] in still_due]
+        self.metrics.add(skipped=len(ids) - len(batch))
+        if not batch:
+            return 0
+
+        notifications = [{
+            'reminder_id': row['id'],
+            'user_id': row['user_id'],
+            'email': row['user__email'],
+            'title': row['title'],
+            'reminder_type': row['reminder_type'],
+            'location': row['location'],
+            'due_at': due_at.isoformat(),
+            'dispatched_at': now.isoformat(),
+        } for due_at, row in batch]
+        number = next(self._batch_numbers)
+        self._batches[number] = {'rows': batch, 'remaining': len(self.channels), 'failed': False, 'finished': now}
+        self.metrics.add(batches=1)
+        for name, channel in self.channels.items():
+            self._executors[name].submit(self._deliver, number, name, channel, notifications)
+        if not self.channels:
+            self._finished.put((number, True, now))
+        return len(batch)
+
+    def _deliver(self, number, name, channel, notifications):
+        """Runs on the channel's threads"""
+        ok = False
+        for attempt in range(channel.max_attempts):
+            if attempt:
+                self.metrics.add(retries=1)
+                time.sleep(channel.retry_delay * 2 ** (attempt - 1))
+            try:
+                channel.send(notifications)
+                ok = True
+                break
+            except Exception:
+                logger.warning('Reminder notifications to %s failed (attempt %d of %d)',
+                               name, attempt + 1, channel.max_attempts, exc_info=True)
+        if not ok:
+            logger.error('Gave up sending %d reminder notifications to %s', len(notifications), name)
+        self._finished.put((number, ok, self.clock()))
+
+    def collect(self, timeout=0):
+        """Record the batches the channels finished; mark their reminders notified"""
+        while True:
+            try:
+                number, ok, finished = self._finished.get(timeout=timeout)
+            except queue.Empty:
+                return
+            timeout = 0
+            batch = self._batches[number]
+            batch['remaining'] -= 1
+            batch['failed'] |= not ok
+            batch['finished'] = max(batch['finished'], finished)
+            if batch['remaining'] > 0:
+                continue
+            del self._batches[number]
+            if batch['failed']:
+                self.metrics.add(failed=len(batch['rows']))
+                self._retry(batch['rows'], batch['finished'] + self.retry_after)
+                continue
+            finished = batch['finished']
+            PreventiveCareReminder.objects.filter(
+                pk__in=[row['id'] for _, row in batch['rows']]
+            ).update(notified_at=finished)
+            self.metrics.delivered([(finished - due_at).total_seconds() for due_at, _ in batch['rows']])
+
+    def _retry(self, rows, when):
+        for due_at, row in rows:
+            # Unless a refresh has picked it up again in the meantime
+            if row['id'] not in self._pending:
+                self._pending[row['id']] = (due_at, row)
+                heapq.heappush(self._retries, (when, row['id'], due_at))
+
+    def drain(self):
+        """Wait for every batch in flight"""
+        while self._batches:
+            self.collect(timeout=1)
+
+    def run_once(self):
+        """Send what is due now and wait for it"""
+        self.refresh()
+        self.dispatch_due()
+        self.drain()
+
+    def run(self, stop, tick=1.0, refresh_interval=5.0, stats_interval=60.0, report=None):
+        """Dispatch until the `stop` event is set, calling report(stats) every stats_interval seconds"""
+        next_refresh = next_report = time.monotonic()
+        try:
+            while not stop.is_set():
+                if time.monotonic() >= next_refresh:
+                    self.refresh()
+                    close_old_connections()
+                    next_refresh = time.monotonic() + refresh_interval
+                self.dispatch_due()
+                self.collect()
+                if report and time.monotonic() >= next_report:
+                    report(dict(self.metrics.stats(), waiting=len(self), in_flight=self.in_flight))
+                    next_report = time.monotonic() + stats_interval
+                # Sleep until the next reminder falls due, at most a tick
+                due_at = self.next_due()
+                wait = tick if due_at is None else (due_at - self.clock()).total_seconds()
+                stop.wait(min(max(wait, 0.01), tick))
+        finally:
+            self.drain()
+            self.close()
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        for channel in self.channels.values():
+            channel.close()
@@ -0,0 +1,94 @@
+"""
+Atomic goal progress updates.
+
+Progress is added to WellnessGoal.current_value inside the database instead of
+read-modify-write in Python, so concurrent logs (UI and device sync) never
+overwrite each other. On MongoDB this is a single update pipeline that also
+recomputes is_completed; other databases use an equivalent F-expression update.
+The goals' rollup rows get the same change as a delta (rollups.add_to_rollups).
+"""
+from django.db.models import BooleanField, Case, F, Value, When
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from core.mongo import get_collection, mongo_datetime
+from .models import WellnessGoal, DailyGoalLog
+from .rollups import ROLLUP_KEY, add_to_rollups
+
+
+def _mongo_increment(value, now):
+    """Update pipeline adding `value` to current_value and recomputing is_completed"""
+    return [
+        {'$set': {
+            'current_value': {'$add': [{'$ifNull': ['$current_value', 0]}, value]},
+            'updated_at': mongo_datetime(now),
+        }},
+        # Same rule as WellnessGoal.save(): completion is never reset by logging
+        {'$set': {
+            'is_completed': {'$or': [
+                {'$ifNull': ['$is_completed', False]},
+                {'$and': [
+                    {'$gt': ['$target_value', 0]},
+                    {'$gte': ['$current_value', '$target_value']},
+                ]},
+            ]},
+        }},
+    ]
+
+
+def _orm_increment(queryset, value, now):
+    # In an UPDATE the right-hand side sees the old current_value
+    return queryset.update(
+        current_value=F('current_value') + value,
+        is_completed=Case(
+            When(target_value__gt=0, current_value__gte=F('target_value') - value, then=Value(True)),
+            default=F('is_completed'),
+            output_field=BooleanField(),
+        ),
+        updated_at=now,
+    )
+
+
+def log_progress(goal_id, user, value, notes=''):
+    """Atomically add `value` to one of `user`'s goals and log it; returns False if the goal was not found"""
+    value = float(value)
+    now = timezone.now()
+    collection = get_collection(WellnessGoal)
+    keys = None
+    if collection is not None:
+        key = collection.find_one_and_update(
+            {'id': goal_id, 'user_id': user.id},
+            _mongo_increment(value, now),
+            projection=ROLLUP_KEY,
+        )
+        if key is None:
+            return False
+        keys = {goal_id: key}
+    elif not _orm_increment(WellnessGoal.objects.filter(pk=goal_id, user=user), value, now):
+        return False
+    # bulk_create skips the log signal, the rollup delta below includes the log
+    DailyGoalLog.objects.bulk_create([DailyGoalLog(goal_id=goal_id, value=value, notes=notes)])
+    add_to_rollups({goal_id: (value, 1)}, keys=keys)
+    return True
+
+
+def apply_increments(totals, log_counts):
+    """
+    Atomically apply {goal_id: value} increments to goals whose ownership is
+    already checked, for the {goal_id: count} logs the caller bulk-created
+    """
+    if not totals:
+        return
+    now = timezone.now()
+    collection = get_collection(WellnessGoal)
+    if collection is not None:
+        # One round-trip for all goals
+        collection.bulk_write([
+            UpdateOne({'id': goal_id}, _mongo_increment(float(value), now))
+            for goal_id, value in totals.items()
+        ], ordered=False)
+    else:
+        for goal_id, value in totals.items():
+            _orm_increment(WellnessGoal.objects.filter(pk=goal_id), float(value), now)
+    # Bulk-created logs bypass the rollup signals
+    add_to_rollups({goal_id: (value, log_counts.get(goal_id, 0)) for goal_id, value in totals.items()})
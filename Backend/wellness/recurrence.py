@@ -0,0 +1,166 @@
+"""
+Recurring preventive-care reminders.
+
+A reminder with is_recurring and a recurrence_interval (in days) starts a
+series. Its later occurrences are stored as reminders of their own that point
+back at it through recurrence_of. They are created ahead of time up to a
+bounded horizon: REMINDER_HORIZON_DAYS ahead, at most
+REMINDER_HORIZON_OCCURRENCES upcoming per series, and always at least the
+next one. Calendar and upcoming queries are then plain indexed range scans
+over stored rows rather than expanding recurrences on every read.
+
+Each series continues from its latest occurrence, which carries the schedule:
+turning recurrence off there ends the series. Occurrences that passed while
+nothing extended a series are skipped rather than created in the past.
+
+extend_users() tops up every series of a batch of users with one query and
+batched inserts; the nightly backfill_reminder_occurrences command runs it
+for everyone to move the horizon forward. Saving a reminder updates its own
+series (wellness.signals), so completing an occurrence or changing the
+schedule takes effect at once. Deleting the reminder that started a series
+ends it and removes its upcoming occurrences; deleting the latest occurrence
+ends the series where it now stops. Other deleted occurrences are not
+recreated, as a series only continues from its latest occurrence.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PreventiveCareReminder
+
+# Series whose occurrences this thread is deleting itself, so reminder_deleted leaves them be
+_dropping = threading.local()
+
+FIELDS = [
+    'id', 'user_id', 'reminder_type', 'title', 'description', 'scheduled_date', 'scheduled_time',
+    'status', 'location', 'is_recurring', 'recurrence_interval', 'recurrence_of',
+]
+
+
+def series_key(reminder):
+    """Id of the reminder that started the series of `reminder` (a row dict or a model)"""
+    if isinstance(reminder, dict):
+        return reminder['recurrence_of'] or reminder['id']
+    return reminder.recurrence_of or reminder.pk
+
+
+def build_occurrences(rows, today, horizon_days=None, max_upcoming=None):
+    """
+    Unsaved occurrences that bring the series in `rows` up to the horizon.
+    `rows` must hold every reminder (FIELDS values) of those series.
+    """
+    horizon_days = settings.REMINDER_HORIZON_DAYS if horizon_days is None else horizon_days
+    max_upcoming = settings.REMINDER_HORIZON_OCCURRENCES if max_upcoming is None else max_upcoming
+    horizon = today + timedelta(days=horizon_days)
+
+    latest = {}
+    upcoming = {}
+    for row in rows:
+        key = series_key(row)
+        current = latest.get(key)
+        if current is None or (row['scheduled_date'], row['id']) > (current['scheduled_date'], current['id']):
+            latest[key] = row
+        if row['status'] == 'upcoming' and row['scheduled_date'] >= today:
+            upcoming[key] = upcoming.get(key, 0) + 1
+
+    occurrences = []
+    for key, row in latest.items():
+        interval = row['recurrence_interval']
+        if not row['is_recurring'] or not interval:
+            continue
+        date = row['scheduled_date'] + timedelta(days=interval)
+        if date < today:
+            date += timedelta(days=interval * -(-(today - date).days // interval))
+        count = upcoming.get(key, 0)
+        while count < max_upcoming and (date <= horizon or count == 0):
+            occurrences.append(PreventiveCareReminder(
+                user_id=row['user_id'],
+                reminder_type=row['reminder_type'],
+                title=row['title'],
+                description=row['description'],
+                scheduled_date=date,
+                scheduled_time=row['scheduled_time'],
+                status='upcoming',
+                location=row['location'],
+                is_recurring=True,
+                recurrence_interval=interval,
+                recurrence_of=key,
+            ))
+            count += 1
+            date += timedelta(days=interval)
+    return occurrences
+
+
+def _extend(reminders, today, batch_size, **horizon):
+    occurrences = build_occurrences(reminders.values(*FIELDS), today or timezone.now().date(), **horizon)
+    PreventiveCareReminder.objects.bulk_create(occurrences, batch_size=batch_size)
+    return len(occurrences)
+
+
+def extend_users(user_ids, today=None, batch_size=1000, **horizon):
+    """Top up every series of these users; returns the number of occurrences created"""
+    reminders = PreventiveCareReminder.objects.filter(user_id__in=list(user_ids)).filter(
+        Q(is_recurring=True) | Q(recurrence_of__isnull=False)
+    )
+    return _extend(reminders, today, batch_size, **horizon)
+
+
+def extend_series(keys, today=None, batch_size=1000, **horizon):
+    """Top up the series started by the reminders `keys`"""
+    keys = list(keys)
+    reminders = PreventiveCareReminder.objects.filter(Q(pk__in=keys) | Q(recurrence_of__in=keys))
+    return _extend(reminders, today, batch_size, **horizon)
+
+
+def _drop(key, occurrences):
+    _dropping.key = key
+    try:
+        occurrences.delete()
+    finally:
+        _dropping.key = None
+
+
+def reminder_saved(reminder, created):
+    """Keep the series of a saved reminder in step with it"""
+    key = series_key(reminder)
+    if created:
+        if reminder.is_recurring and reminder.recurrence_interval:
+            extend_series([key])
+        return
+    if not (reminder.recurrence_of or reminder.is_recurring):
+        return
+
+    # Upcoming occurrences after this one follow its schedule; drop them if it
+    # changed (recurrence turned off, new interval or date) and start over
+    later = PreventiveCareReminder.objects.filter(
+        recurrence_of=key, status='upcoming', scheduled_date__gt=reminder.scheduled_date
+    )
+    interval = reminder.recurrence_interval if reminder.is_recurring else None
+    schedule = list(later.values_list('scheduled_date', 'recurrence_interval'))
+    if any(
+        not interval or other_interval != interval or (date - reminder.scheduled_date).days % interval
+        for date, other_interval in schedule
+    ):
+        _drop(key, later)
+    extend_series([key])
+
+
+def reminder_deleted(reminder):
+    """End the series of a deleted reminder if it started the series or was its latest occurrence"""
+    key = series_key(reminder)
+    if getattr(_dropping, 'key', None) == key:
+        return
+    series = PreventiveCareReminder.objects.filter(Q(pk=key) | Q(recurrence_of=key))
+    if reminder.recurrence_of is None:
+        _drop(key, series.filter(status='upcoming', scheduled_date__gte=timezone.now().date()))
+    elif series.filter(
+        Q(scheduled_date__gt=reminder.scheduled_date) | Q(scheduled_date=reminder.scheduled_date, pk__gt=reminder.pk)
+    ).exists():
+        return
+    # The series continues from its latest occurrence: stop it there
+    latest = series.order_by('-scheduled_date', '-pk').values_list('pk', flat=True).first()
+    if latest is not None:
+        PreventiveCareReminder.objects.filter(pk=latest).update(is_recurring=False)
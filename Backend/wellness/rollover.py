@@ -0,0 +1,137 @@
+"""
+Materialization of daily wellness goals.
+
+Each user's recurring goals (or the default goal set for users without any)
+are copied forward to a given date in bulk. The nightly
+``rollover_recurring_goals`` command runs this for every patient so that
+TodayGoalsView only has to read; the view falls back to it for a single user
+the job has not covered yet (e.g. someone who registered today).
+"""
+from datetime import timedelta
+
+from django.db import DatabaseError
+
+from .models import WellnessGoal
+from .rollups import refresh_rollups
+
+# Goal types created for users that have no recurring goals yet
+DEFAULT_GOAL_TYPES = ['steps', 'active_time', 'sleep']
+
+
+def default_goal(user_id, goal_type, date, is_recurring=True):
+    """Unsaved goal of `goal_type` using WellnessGoal.DEFAULT_GOALS (recurring by default)"""
+    defaults = WellnessGoal.DEFAULT_GOALS.get(goal_type, {})
+    return WellnessGoal(
+        user_id=user_id,
+        goal_type=goal_type,
+        date=date,
+        title=defaults.get('title', goal_type.replace('_', ' ').title()),
+        target_value=float(defaults.get('target_value', 0)),
+        current_value=0.0,
+        unit=defaults.get('unit', ''),
+        is_recurring=is_recurring,
+    )
+
+
+def _recurring_templates(user_ids, date, lookback_days=None):
+    """{user: {goal type: most recent recurring goal before `date`}}"""
+    recurring = WellnessGoal.objects.filter(
+        user_id__in=user_ids,
+        is_recurring=True,
+        date__lt=date
+    )
+    if lookback_days is not None:
+        recurring = recurring.filter(date__gte=date - timedelta(days=lookback_days))
+
+    templates = {}
+    for row in recurring.order_by('-date').values(
+        'user_id', 'goal_type', 'title', 'target_value', 'unit'
+    ):
+        templates.setdefault(row['user_id'], {}).setdefault(row['goal_type'], row)
+    return templates
+
+
+def build_goals_for_date(user_ids, date, lookback_days=None):
+    """
+    Return unsaved WellnessGoal objects for the users that have no goals on `date`.
+
+    Runs two queries for the whole batch: one for goals already on `date` and
+    one for recurring goals before it. `lookback_days` narrows the search for
+    recurring goals to recent ones (None searches the whole history); users
+    with none that recent are searched again over their whole history, so
+    they never lose their custom goals to the defaults.
+    """
+    user_ids = list(user_ids)
+    users_with_goals = set(
+        WellnessGoal.objects.filter(user_id__in=user_ids, date=date)
+        .values_list('user_id', flat=True).distinct()
+    )
+    pending = [user_id for user_id in user_ids if user_id not in users_with_goals]
+    if not pending:
+        return []
+
+    templates = _recurring_templates(pending, date, lookback_days)
+    if lookback_days is not None:
+        inactive = [user_id for user_id in pending if user_id not in templates]
+        if inactive:
+            templates.update(_recurring_templates(inactive, date))
+
+    goals = []
+    for user_id in pending:
+        user_templates = templates.get(user_id)
+        if not user_templates:
+            goals.extend(default_goal(user_id, goal_type, date) for goal_type in DEFAULT_GOAL_TYPES)
+            continue
+        for goal_type, row in user_templates.items():
+            goals.append(WellnessGoal(
+                user_id=user_id,
+                goal_type=goal_type,
+                date=date,
+                title=row['title'],
+                target_value=float(row['target_value'] or 0),
+                current_value=0.0,
+                unit=row['unit'],
+                is_recurring=True,
+            ))
+    return goals
+
+
+def create_goals(goals, batch_size=500):
+    """Bulk-create unsaved goals, tolerating ones created concurrently; returns the number created"""
+    if not goals:
+        return 0
+    try:
+        WellnessGoal.objects.bulk_create(goals, batch_size=batch_size)
+    except DatabaseError:
+        # Another request created some of these goals concurrently;
+        # unique_together (user, goal_type, date) keeps the retry idempotent.
+        created = 0
+        for goal in goals:
+            _, was_created = WellnessGoal.objects.get_or_create(
+                user_id=goal.user_id,
+                goal_type=goal.goal_type,
+                date=goal.date,
+                defaults={
+                    'title': goal.title,
+                    'target_value': goal.target_value,
+                    'current_value': 0.0,
+                    'unit': goal.unit,
+                    'is_recurring': goal.is_recurring,
+                }
+            )
+            created += was_created
+        return created
+
+    # bulk_create skips the post_save signal that maintains the rollups
+    refresh_rollups(WellnessGoal.objects.filter(
+        user_id__in={goal.user_id for goal in goals},
+        goal_type__in={goal.goal_type for goal in goals},
+        date__in={goal.date for goal in goals},
+    ))
+    return len(goals)
+
+
+def materialize_goals(user_ids, date, lookback_days=None, batch_size=500):
+    """Create the goals returned by build_goals_for_date; returns the number created"""
+    goals = build_goals_for_date(user_ids, date, lookback_days=lookback_days)
+    return create_goals(goals, batch_size=batch_size)
@@ -0,0 +1,237 @@
+"""
+Maintenance of WellnessDailyRollup, the pre-aggregated history used by trends.
+
+A rollup row mirrors one goal (goals are unique per user, date and type): its
+current_value, target_value and is_completed, plus the number of logs. Paths
+that log progress apply their change to the row as an atomic delta in the
+database - $inc-style on MongoDB, F() expressions elsewhere - alongside the
+goal's own increment (add_to_rollups), so concurrent logs neither race on the
+row nor re-read the raw data. ORM saves and deletes of goals and logs reach
+the rows through wellness.signals. A row that does not exist yet is created
+from the raw data, as are the rows of goals created in bulk (refresh_rollups).
+
+reconcile_users(), run by verify_wellness_rollups, recomputes rows from
+WellnessGoal and DailyGoalLog to find and fix any drift.
+"""
+from contextlib import nullcontext
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BooleanField, Case, Count, F, Subquery, Value, When
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from core.mongo import get_collection, mongo_datetime
+from .models import WellnessGoal, DailyGoalLog, WellnessDailyRollup
+
+ROLLUP_FIELDS = ('total', 'target', 'completed', 'log_count')
+ROLLUP_KEY = {'_id': 0, 'id': 1, 'user_id': 1, 'date': 1, 'goal_type': 1}  # Projection of a goal document
+
+
+def compute_rollups(goals):
+    """Expected rollup values for a WellnessGoal queryset: {(user_id, date, goal_type): values}"""
+    rows = list(goals.values(
+        'id', 'user_id', 'date', 'goal_type', 'current_value', 'target_value', 'is_completed'
+    ).order_by())
+    if not rows:
+        return {}
+    goal_ids = [row['id'] for row in rows]
+    log_counts = {}
+    for i in range(0, len(goal_ids), 1000):
+        log_counts.update(
+            DailyGoalLog.objects.filter(goal_id__in=goal_ids[i:i + 1000])
+            .values('goal_id').annotate(count=Count('id')).order_by()
+            .values_list('goal_id', 'count')
+        )
+    return {
+        (row['user_id'], row['date'], row['goal_type']): {
+            'total': float(row['current_value'] or 0),
+            'target': float(row['target_value'] or 0),
+            'completed': bool(row['is_completed']),
+            'log_count': log_counts.get(row['id'], 0),
+        }
+        for row in rows
+    }
+
+
+def existing_rollups(keys):
+    """Stored rollup rows for a set of (user_id, date, goal_type) keys"""
+    if not keys:
+        return {}
+    rows = WellnessDailyRollup.objects.filter(
+        user_id__in={key[0] for key in keys},
+        date__in={key[1] for key in keys},
+        goal_type__in={key[2] for key in keys},
+    )
+    return {
+        (row.user_id, row.date, row.goal_type): row
+        for row in rows
+        if (row.user_id, row.date, row.goal_type) in keys
+    }
+
+
+def write_rollups(expected, existing):
+    """Create missing rows and update stale ones; returns (created, updated)"""
+    to_create = []
+    updated = 0
+    for key, values in expected.items():
+        row = existing.get(key)
+        if row is None:
+            user_id, date, goal_type = key
+            to_create.append(WellnessDailyRollup(user_id=user_id, date=date, goal_type=goal_type, **values))
+        elif any(getattr(row, field) != values[field] for field in ROLLUP_FIELDS):
+            WellnessDailyRollup.objects.filter(pk=row.pk).update(**values)
+            updated += 1
+    if to_create:
+        WellnessDailyRollup.objects.bulk_create(to_create, batch_size=500)
+    return len(to_create), updated
+
+
+def refresh_rollups(goals):
+    """Bring the rollup rows of the goals in a WellnessGoal queryset up to date"""
+    expected = compute_rollups(goals)
+    return write_rollups(expected, existing_rollups(set(expected)))
+
+
+def refresh_goal_rollups(goal_ids):
+    return refresh_rollups(WellnessGoal.objects.filter(id__in=list(goal_ids)))
+
+
+def _savepoint():
+    return transaction.atomic() if connection.features.supports_transactions else nullcontext()
+
+
+def create_missing_rollups(goal_ids):
+    """Create the rows of goals that have none, from their raw data"""
+    goals = WellnessGoal.objects.filter(id__in=list(goal_ids))
+    try:
+        with _savepoint():
+            write_rollups(compute_rollups(goals), existing_rollups(set()))
+    except IntegrityError:
+        # Created concurrently: recompute them, including what that writer did
+        refresh_rollups(goals)
+
+
+def _mongo_delta(value, logs, now):
+    """Update pipeline adding to total and log_count and recomputing completed, as for the goal"""
+    return [
+        {'$set': {
+            'total': {'$add': [{'$ifNull': ['$total', 0]}, value]},
+            'log_count': {'$add': [{'$ifNull': ['$log_count', 0]}, logs]},
+            'updated_at': mongo_datetime(now),
+        }},
+        {'$set': {
+            'completed': {'$or': [
+                {'$ifNull': ['$completed', False]},
+                {'$and': [{'$gt': ['$target', 0]}, {'$gte': ['$total', '$target']}]},
+            ]},
+        }},
+    ]
+
+
+def _orm_delta(value, logs, now):
+    # In an UPDATE the right-hand side sees the old total
+    return {
+        'total': F('total') + value,
+        'log_count': F('log_count') + logs,
+        'completed': Case(
+            When(target__gt=0, total__gte=F('target') - value, then=Value(True)),
+            default=F('completed'),
+            output_field=BooleanField(),
+        ),
+        'updated_at': now,
+    }
+
+
+def add_to_rollups(deltas, keys=None):
+    """
+    Apply {goal_id: (value, logs)} to the goals' rows: `value` added to their
+    current_value, `logs` log entries added (or removed, when negative). Goals
+    without a row get one from the raw data, which already includes the change.
+    `keys` may give the goals' documents (ROLLUP_KEY) on MongoDB.
+    """
+    if not deltas:
+        return
+    now = timezone.now()
+    collection = get_collection(WellnessDailyRollup)
+    if collection is not None:
+        if keys is None:
+            keys = {
+                document['id']: document
+                for document in get_collection(WellnessGoal).find({'id': {'$in': list(deltas)}}, ROLLUP_KEY)
+            }
+        filters = {
+            goal_id: {'user_id': key['user_id'], 'date': key['date'], 'goal_type': key['goal_type']}
+            for goal_id, key in keys.items()
+        }
+        if not filters:
+            return  # The goals are gone
+        result = collection.bulk_write([
+            UpdateOne(filters[goal_id], _mongo_delta(float(value), logs, now))
+            for goal_id, (value, logs) in deltas.items() if goal_id in filters
+        ], ordered=False)
+        missing = []
+        if result.matched_count < len(filters):
+            found = {
+                (row['user_id'], row['date'], row['goal_type'])
+                for row in collection.find({'$or': list(filters.values())}, {'user_id': 1, 'date': 1, 'goal_type': 1})
+            }
+            missing = [
+                goal_id for goal_id, key in filters.items()
+                if (key['user_id'], key['date'], key['goal_type']) not in found
+            ]
+    else:
+        missing = []
+        for goal_id, (value, logs) in deltas.items():
+            goal = WellnessGoal.objects.filter(pk=goal_id)
+            updated = WellnessDailyRollup.objects.filter(
+                user_id=Subquery(goal.values('user_id')[:1]),
+                date=Subquery(goal.values('date')[:1]),
+                goal_type=Subquery(goal.values('goal_type')[:1]),
+            ).update(**_orm_delta(float(value), logs, now))
+            if not updated:
+                missing.append(goal_id)
+    if missing:
+        create_missing_rollups(missing)
+
+
+def goal_saved(goal):
+    """Copy a saved goal's values to its row"""
+    updated = WellnessDailyRollup.objects.filter(
+        user_id=goal.user_id, date=goal.date, goal_type=goal.goal_type
+    ).update(
+        total=float(goal.current_value or 0),
+        target=float(goal.target_value or 0),
+        completed=bool(goal.is_completed),
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        create_missing_rollups([goal.pk])
+
+
+def delete_goal_rollup(goal):
+    WellnessDailyRollup.objects.filter(user_id=goal.user_id, date=goal.date, goal_type=goal.goal_type).delete()
+
+
+def reconcile_users(user_ids, fix=False):
+    """
+    Compare the rollup rows of some users with their raw goals and logs.
+
+    Returns counts of missing, stale and orphaned rows; with fix=True the rows
+    are rewritten to match.
+    """
+    expected = compute_rollups(WellnessGoal.objects.filter(user_id__in=user_ids))
+    existing = {
+        (row.user_id, row.date, row.goal_type): row
+        for row in WellnessDailyRollup.objects.filter(user_id__in=user_ids)
+    }
+    orphaned = [row.pk for key, row in existing.items() if key not in expected]
+    missing = sum(1 for key in expected if key not in existing)
+    stale = sum(
+        1 for key, values in expected.items()
+        if key in existing and any(getattr(existing[key], field) != values[field] for field in ROLLUP_FIELDS)
+    )
+    if fix:
+        write_rollups(expected, existing)
+        if orphaned:
+            WellnessDailyRollup.objects.filter(pk__in=orphaned).delete()
+    return {'checked': len(expected), 'missing': missing, 'stale': stale, 'orphaned': len(orphaned)}
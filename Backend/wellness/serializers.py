@@ -75,6 +75,17 @@ class LogGoalProgressSerializer(serializers.Serializer):
     notes = serializers.CharField(required=False, allow_blank=True)
 
 
+class LogGoalProgressEntrySerializer(LogGoalProgressSerializer):
+    goal_id = serializers.IntegerField()
+    logged_at = serializers.DateTimeField(required=False)
+
+
+class LogGoalProgressBatchSerializer(serializers.Serializer):
+    entries = serializers.ListField(
+        child=LogGoalProgressEntrySerializer(), allow_empty=False, max_length=1000
+    )
+
+
 class PreventiveCareReminderSerializer(serializers.ModelSerializer):
     scheduled_time = serializers.TimeField(required=False, allow_null=True)
     recurrence_interval = serializers.IntegerField(required=False, allow_null=True)
@@ -84,9 +95,9 @@ class PreventiveCareReminderSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'reminder_type', 'title', 'description', 'scheduled_date',
             'scheduled_time', 'status', 'location', 'notes', 'is_recurring',
-            'recurrence_interval', 'created_at', 'updated_at'
+            'recurrence_interval', 'recurrence_of', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'recurrence_of', 'created_at', 'updated_at']
         extra_kwargs = {
             'description': {'required': False, 'allow_blank': True},
             'location': {'required': False, 'allow_blank': True},
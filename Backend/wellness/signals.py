@@ -0,0 +1,47 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import WellnessGoal, DailyGoalLog, PreventiveCareReminder, HealthTip
+from .recurrence import reminder_saved, reminder_deleted
+from .rollups import add_to_rollups, goal_saved, delete_goal_rollup
+from .tips import get_scheduler
+
+
+@receiver(post_save, sender=WellnessGoal)
+def update_rollup_on_goal_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        goal_saved(instance)
+
+
+@receiver(post_delete, sender=WellnessGoal)
+def delete_rollup_on_goal_delete(sender, instance, **kwargs):
+    delete_goal_rollup(instance)
+
+
+# The goal's own save brings the value; a log adds to the count
+@receiver(post_save, sender=DailyGoalLog)
+def count_log_on_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_to_rollups({instance.goal_id: (0, 1)})
+
+
+@receiver(post_delete, sender=DailyGoalLog)
+def uncount_log_on_delete(sender, instance, **kwargs):
+    add_to_rollups({instance.goal_id: (0, -1)})
+
+
+@receiver(post_save, sender=PreventiveCareReminder)
+def update_reminder_series(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        reminder_saved(instance, created)
+
+
+@receiver(post_delete, sender=PreventiveCareReminder)
+def end_reminder_series(sender, instance, **kwargs):
+    reminder_deleted(instance)
+
+
+@receiver(post_save, sender=HealthTip)
+@receiver(post_delete, sender=HealthTip)
+def invalidate_tips(sender, **kwargs):
+    get_scheduler().invalidate()
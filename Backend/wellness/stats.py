@@ -0,0 +1,152 @@
+"""
+Goal statistics computed in a single query.
+
+goal_type_summary groups a user's goals in a date window by goal type in the
+database: a raw aggregation pipeline on MongoDB (Djongo's translation of Sum
+over FloatFields is unreliable) and a grouped annotate() elsewhere.
+summarize_goals produces the same structure from goals already loaded.
+progress_summary builds the goals/weekly/ payload on top of either.
+rollup_trends serves long-range trends from the pre-aggregated rollup table,
+read from a secondary when MONGODB_SECONDARY_READS is on.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+
+from core.mongo import get_collection, mongo_date
+from core.routers import read_alias
+from .models import WellnessGoal, WellnessDailyRollup
+
+
+def _empty_row():
+    return {'count': 0, 'completed': 0, 'total': 0.0, 'target': 0.0}
+
+
+def goal_type_summary(user, start, end):
+    """{goal_type: {count, completed, total, target}} for user's goals dated start..end"""
+    collection = get_collection(WellnessGoal)
+    if collection is not None:
+        rows = collection.aggregate([
+            {'$match': {
+                'user_id': user.id,
+                'date': {'$gte': mongo_date(start), '$lte': mongo_date(end)},
+            }},
+            {'$group': {
+                '_id': '$goal_type',
+                'count': {'$sum': 1},
+                'completed': {'$sum': {'$cond': [{'$eq': ['$is_completed', True]}, 1, 0]}},
+                'total': {'$sum': {'$toDouble': {'$ifNull': ['$current_value', 0]}}},
+                'target': {'$sum': {'$toDouble': {'$ifNull': ['$target_value', 0]}}},
+            }},
+        ])
+        return {
+            row['_id']: {
+                'count': row['count'],
+                'completed': row['completed'],
+                'total': row['total'],
+                'target': row['target'],
+            }
+            for row in rows
+        }
+
+    rows = WellnessGoal.objects.filter(
+        user=user, date__gte=start, date__lte=end
+    ).values('goal_type').annotate(
+        count=Count('id'),
+        completed=Count('id', filter=Q(is_completed=True)),
+        total=Sum('current_value'),
+        target=Sum('target_value'),
+    ).order_by()
+    return {
+        row['goal_type']: {
+            'count': row['count'],
+            'completed': row['completed'],
+            'total': float(row['total'] or 0),
+            'target': float(row['target'] or 0),
+        }
+        for row in rows
+    }
+
+
+def summarize_goals(goals):
+    """Same structure as goal_type_summary, computed from loaded WellnessGoal objects"""
+    summary = {}
+    for goal in goals:
+        row = summary.setdefault(goal.goal_type, _empty_row())
+        row['count'] += 1
+        row['completed'] += 1 if goal.is_completed else 0
+        row['total'] += float(goal.current_value or 0)
+        row['target'] += float(goal.target_value or 0)
+    return summary
+
+
+def progress_summary(user, end, days, detail=False):
+    """
+    Progress over the `days` days up to `end`. With detail the goals are
+    loaded (and returned under 'goals' as model instances) and summarized in
+    Python, otherwise the database does the grouping; one query either way.
+    """
+    start = end - timedelta(days=days)
+    goals = None
+    if detail:
+        goals = list(WellnessGoal.objects.filter(user=user, date__gte=start, date__lte=end))
+        by_type = summarize_goals(goals)
+    else:
+        by_type = goal_type_summary(user, start, end)
+
+    total_goals = sum(row['count'] for row in by_type.values())
+    completed_goals = sum(row['completed'] for row in by_type.values())
+    steps = by_type.get('steps')
+
+    data = {
+        'range': days,
+        'start_date': start,
+        'end_date': end,
+        'total_goals': total_goals,
+        'completed_goals': completed_goals,
+        'completion_rate': round((completed_goals / total_goals * 100) if total_goals > 0 else 0, 1),
+        'steps_summary': {
+            'total': steps['total'] if steps else None,
+            'target': steps['target'] if steps else None,
+        },
+        'by_goal_type': by_type,
+    }
+    if detail:
+        data['goals'] = goals
+    return data
+
+
+def bucket_start(date, bucket):
+    """First day of the week (Monday) or month containing `date`"""
+    if bucket == 'week':
+        return date - timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def rollup_trends(user, start, end, bucket, goal_type=None):
+    """Weekly or monthly buckets per goal type, read from WellnessDailyRollup"""
+    rows = WellnessDailyRollup.objects.using(read_alias()).filter(user=user, date__gte=start, date__lte=end)
+    if goal_type:
+        rows = rows.filter(goal_type=goal_type)
+
+    buckets = {}
+    for date, row_type, total, target, completed, log_count in rows.values_list(
+        'date', 'goal_type', 'total', 'target', 'completed', 'log_count'
+    ).order_by():
+        key = (bucket_start(date, bucket), row_type)
+        entry = buckets.get(key)
+        if entry is None:
+            entry = buckets[key] = {
+                'period_start': key[0], 'goal_type': row_type, 'days': 0,
+                'completed_days': 0, 'total': 0.0, 'target': 0.0, 'log_count': 0,
+            }
+        entry['days'] += 1
+        entry['completed_days'] += 1 if completed else 0
+        entry['total'] += total or 0
+        entry['target'] += target or 0
+        entry['log_count'] += log_count or 0
+
+    result = [buckets[key] for key in sorted(buckets)]
+    for entry in result:
+        entry['completion_rate'] = round(entry['completed_days'] / entry['days'] * 100, 1)
+    return result
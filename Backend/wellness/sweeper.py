@@ -0,0 +1,77 @@
+"""
+Marks overdue preventive-care reminders missed.
+
+A reminder still upcoming REMINDER_MISSED_AFTER_DAYS after its
+scheduled_date was missed. sweep_overdue() walks those reminders along
+reminder_due_idx (status, scheduled_date) a batch at a time, so memory stays
+bounded by the batch size however many reminders are overdue. Each batch is
+flipped with a single UPDATE over a range of that index: the dates the batch
+covers in full. The batch's last date may go on into the next batch, so it
+is left for that one, unless the whole batch falls on one date, which is
+then updated by id. Swept reminders drop out of the range, so the next batch
+starts at the date the last one stopped.
+
+The update repeats the status condition, so a reminder completed in the
+meantime is left alone and the counts are the rows actually changed. It also
+sets updated_at, which the notification dispatcher watches. Bulk updates skip
+the post_save signals, so the series of swept recurring reminders are topped
+up here if asked.
+
+Runs hold a core.leases.Lease so that when the sweep is scheduled on several nodes only
+one works at a time; should a lease expire mid-run, the conditional update
+keeps the overlap harmless.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import PreventiveCareReminder
+from .recurrence import extend_series, series_key
+
+logger = logging.getLogger(__name__)
+
+
+def overdue_cutoff(today=None, grace_days=None):
+    """Reminders dated before this are missed"""
+    today = today or timezone.now().date()
+    grace_days = settings.REMINDER_MISSED_AFTER_DAYS if grace_days is None else grace_days
+    return today - timedelta(days=grace_days)
+
+
+def overdue_reminders(cutoff):
+    return PreventiveCareReminder.objects.filter(status='upcoming', scheduled_date__lt=cutoff).order_by('scheduled_date')
+
+
+def sweep_overdue(cutoff, batch_size=5000, extend=False, lease=None):
+    """Mark reminders dated before `cutoff` missed; returns counts"""
+    reminders = overdue_reminders(cutoff)
+    counts = {'missed': 0, 'batches': 0, 'occurrences': 0}
+    reached = None
+    while True:
+        page = reminders if reached is None else reminders.filter(scheduled_date__gte=reached)
+        rows = list(page.values('id', 'scheduled_date', 'is_recurring', 'recurrence_of')[:batch_size])
+        if not rows:
+            return counts
+        if lease is not None:
+            lease.renew()
+        first, last = rows[0]['scheduled_date'], rows[-1]['scheduled_date']
+        # Conditions on the index columns only, so the range is as narrow as it can be
+        upcoming = PreventiveCareReminder.objects.filter(status='upcoming')
+        if len(rows) < batch_size:
+            batch = upcoming.filter(scheduled_date__gte=first, scheduled_date__lt=cutoff)  # The rest
+        elif first < last:
+            batch = upcoming.filter(scheduled_date__gte=first, scheduled_date__lt=last)
+            rows = [row for row in rows if row['scheduled_date'] < last]
+        else:
+            batch = upcoming.filter(scheduled_date=last, pk__in=[row['id'] for row in rows])
+        missed = batch.update(status='missed', updated_at=timezone.now())
+        reached = last
+        counts['missed'] += missed
+        counts['batches'] += 1
+        if extend:
+            series = {series_key(row) for row in rows if row['is_recurring'] or row['recurrence_of']}
+            if series:
+                counts['occurrences'] += extend_series(series)
+        logger.debug('Marked %d reminders missed up to %s', missed, reached)
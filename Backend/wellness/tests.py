@@ -1,3 +1,1240 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts import authentication
+from accounts.authentication import token_for_user
+from accounts.revocation import RevocationStore, get_store
+from accounts.models import User
+from core.benchmarks import benchmark, measure, report
+from core.leases import Lease, LeaseLost
+from core.mongo import from_document, mongo_date
+from . import async_views, dashboard
+from .tips import TipScheduler, get_scheduler, tip_of_the_day
+from .ingest import iter_json_array, iter_ndjson
+from .notifications import Channel, Dispatcher, FileChannel, WebhookChannel
+from .models import WellnessGoal, DailyGoalLog, WellnessDailyRollup, PreventiveCareReminder, HealthTip, JobLease
+from .serializers import WellnessGoalSerializer, HealthTipSerializer
+from .sweeper import overdue_cutoff, sweep_overdue
+
+
+class RolloverRecurringGoalsTest(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.tomorrow = self.today + timedelta(days=1)
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.new_patient = User.objects.create_user(
+            email='new@test.com', password='pass1234', first_name='New', last_name='Patient'
+        )
+        WellnessGoal.objects.create(
+            user=self.patient, goal_type='water', title='Water', date=self.today,
+            target_value=10, current_value=4, unit='glasses', is_recurring=True
+        )
+        WellnessGoal.objects.create(
+            user=self.patient, goal_type='calories', title='Calories', date=self.today,
+            target_value=300, is_recurring=False
+        )
+
+    def rollover(self):
+        out = StringIO()
+        call_command('rollover_recurring_goals', date=str(self.tomorrow), stdout=out)
+        return out.getvalue()
+
+    def test_copies_recurring_goals_forward(self):
+        self.rollover()
+        goals = WellnessGoal.objects.filter(user=self.patient, date=self.tomorrow)
+        self.assertEqual([g.goal_type for g in goals], ['water'])
+        self.assertEqual(goals[0].target_value, 10)
+        self.assertEqual(goals[0].current_value, 0)
+
+    def test_creates_defaults_for_users_without_recurring_goals(self):
+        self.rollover()
+        goal_types = set(
+            WellnessGoal.objects.filter(user=self.new_patient, date=self.tomorrow)
+            .values_list('goal_type', flat=True)
+        )
+        self.assertEqual(goal_types, {'steps', 'active_time', 'sleep'})
+
+    def test_users_inactive_past_the_lookback_keep_their_goals(self):
+        WellnessGoal.objects.create(
+            user=self.new_patient, goal_type='sleep', title='Sleep', date=self.today - timedelta(days=40),
+            target_value=9, unit='hours', is_recurring=True
+        )
+        call_command('rollover_recurring_goals', date=str(self.tomorrow), lookback_days=30, stdout=StringIO())
+        goals = WellnessGoal.objects.filter(user=self.new_patient, date=self.tomorrow)
+        self.assertEqual([(g.goal_type, g.target_value) for g in goals], [('sleep', 9)])
+
+    def test_is_idempotent(self):
+        output = self.rollover()
+        self.assertIn('users/sec', output)
+        count = WellnessGoal.objects.filter(date=self.tomorrow).count()
+        self.rollover()
+        self.assertEqual(WellnessGoal.objects.filter(date=self.tomorrow).count(), count)
+
+
+class LogGoalProgressTest(TransactionTestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.goal = WellnessGoal.objects.create(
+            user=self.patient, goal_type='steps', title='Steps',
+            date=timezone.now().date(), target_value=50
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def log_concurrently(self, threads, per_thread):
+        """POST `per_thread` logs of 1 from each of `threads` clients at once; returns the errors"""
+        errors = []
+
+        def worker():
+            client = self.client_for(self.patient)
+            try:
+                for _ in range(per_thread):
+                    response = client.post(f'/api/wellness/goals/{self.goal.id}/log/', {'value': 1})
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return errors
+
+    def test_concurrent_logs_are_not_lost(self):
+        # Needs a database file or server (core.test_settings for SQLite)
+        threads, per_thread = 8, 10
+        self.assertEqual(self.log_concurrently(threads, per_thread), [])
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_value, threads * per_thread)
+        self.assertTrue(self.goal.is_completed)
+        self.assertEqual(DailyGoalLog.objects.filter(goal=self.goal).count(), threads * per_thread)
+        rollup = WellnessDailyRollup.objects.get(user=self.patient, goal_type=self.goal.goal_type, date=self.goal.date)
+        self.assertEqual((rollup.total, rollup.log_count), (threads * per_thread, threads * per_thread))
+
+    @benchmark
+    def test_benchmark_concurrent_logs(self):
+        for threads in (1, 4, 16):
+            WellnessGoal.objects.filter(id=self.goal.id).update(current_value=0)
+            per_thread = 400 // threads
+            started = time.perf_counter()
+            self.assertEqual(self.log_concurrently(threads, per_thread), [])
+            elapsed = time.perf_counter() - started
+            print(f'\n{threads} threads logging to one goal: '
+                  f'{threads * per_thread / elapsed:.0f} requests/sec over {threads * per_thread} requests')
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_value, 400)
+
+    def test_failed_log_leaves_goal_unchanged(self):
+        with mock.patch.object(DailyGoalLog.objects, 'bulk_create', side_effect=RuntimeError('insert failed')), \
+                self.assertRaises(RuntimeError):
+            self.client_for(self.patient).post(f'/api/wellness/goals/{self.goal.id}/log/', {'value': 5})
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_value, 0)
+
+    def test_failed_batch_increment_stores_no_logs(self):
+        with mock.patch('wellness.views.apply_increments', side_effect=RuntimeError('update failed')), \
+                self.assertRaises(RuntimeError):
+            self.client_for(self.patient).post('/api/wellness/goals/log/batch/', {'entries': [
+                {'goal_id': self.goal.id, 'value': 5},
+            ]}, format='json')
+        self.assertFalse(DailyGoalLog.objects.filter(goal=self.goal).exists())
+
+    def test_other_users_goal_is_not_found(self):
+        other = User.objects.create_user(
+            email='other@test.com', password='pass1234', first_name='Other', last_name='Patient'
+        )
+        response = self.client_for(other).post(f'/api/wellness/goals/{self.goal.id}/log/', {'value': 5})
+        self.assertEqual(response.status_code, 404)
+        self.goal.refresh_from_db()
+        self.assertEqual(self.goal.current_value, 0)
+
+    def test_batch_log(self):
+        logged_at = timezone.now() - timedelta(hours=3)
+        response = self.client_for(self.patient).post('/api/wellness/goals/log/batch/', {'entries': [
+            {'goal_id': self.goal.id, 'value': 20, 'logged_at': logged_at.isoformat()},
+            {'goal_id': self.goal.id, 'value': 35},
+            {'goal_id': self.goal.id + 100, 'value': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(len(response.data['rejected']), 1)
+        self.assertEqual(response.data['goals'][0]['current_value'], 55)
+        self.assertTrue(response.data['goals'][0]['is_completed'])
+        self.assertTrue(DailyGoalLog.objects.filter(goal=self.goal, logged_at=logged_at).exists())
+
+
+class BulkGoalLogTest(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        self.today = timezone.now().date()
+
+    def readings(self, count):
+        now = timezone.now()
+        for i in range(count):
+            yield {
+                'goal_type': ['steps', 'water', 'sleep'][i % 3],
+                'value': 1,
+                'logged_at': (now - timedelta(days=i % 4)).isoformat(),
+            }
+
+    def test_json_array_parser_handles_chunk_boundaries(self):
+        items = [{'value': i, 'note': 'x' * (i % 7)} for i in range(50)] + [12345]
+        body = io.BytesIO(json.dumps(items).encode())
+        self.assertEqual(list(iter_json_array(body, chunk_size=3)), items)
+        self.assertEqual(list(iter_json_array(io.BytesIO(b' [ ] '))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.BytesIO(b'[{"value": 1},')))
+
+    def test_json_array_body(self):
+        WellnessGoal.objects.create(
+            user=self.patient, goal_type='steps', title='Steps', date=self.today,
+            target_value=100, current_value=5
+        )
+        body = list(self.readings(2400)) + [{'goal_type': 'unknown', 'value': 1}, {'goal_type': 'steps'}]
+        response = self.client.post('/api/wellness/logs/bulk/', json.dumps(body), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['accepted'], 2400)
+        self.assertEqual(response.data['rejected'], 2)
+        # 3 goal types over 4 days, one of which already existed
+        self.assertEqual(response.data['goals_created'], 11)
+        self.assertEqual(DailyGoalLog.objects.count(), 2400)
+        steps = WellnessGoal.objects.get(user=self.patient, goal_type='steps', date=self.today)
+        self.assertEqual(steps.current_value, 5 + 200)
+        self.assertTrue(steps.is_completed)
+
+    def test_ndjson_body(self):
+        lines = [json.dumps(r) for r in self.readings(30)] + ['not json', '']
+        response = self.client.post(
+            '/api/wellness/logs/bulk/', '\n'.join(lines), content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['accepted'], 30)
+        self.assertEqual(response.data['rejected'], 1)
+        self.assertEqual(response.data['errors'][0], {'index': 30, 'error': 'Invalid JSON'})
+
+    def test_malformed_body(self):
+        response = self.client.post('/api/wellness/logs/bulk/', '{"goal_type": "steps"}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        # Readings stored before the error are reported, without failing the request
+        body = json.dumps(list(self.readings(5)))[:-1] + ', {"goal_type": "steps", "value": 1'
+        response = self.client.post('/api/wellness/logs/bulk/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['accepted'], 5)
+        self.assertEqual(DailyGoalLog.objects.count(), 5)
+
+    def test_oversized_item_stops_the_parser(self):
+        body = io.BytesIO(b'[{"value": 1}, {"notes": "' + b'x' * 10 ** 6)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(body, chunk_size=1024, max_item_size=4096))
+        self.assertLess(body.tell(), 8192)
+
+        body = io.BytesIO(b'{"value": 1}\n{"notes": "' + b'x' * 10 ** 6)
+        with self.assertRaises(ValueError):
+            list(iter_ndjson(body, max_item_size=4096))
+        self.assertLess(body.tell(), 8192)
+
+
+class WeeklyProgressTest(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def seed(self, days):
+        today = timezone.now().date()
+        goals = []
+        for offset in range(days):
+            date = today - timedelta(days=offset)
+            goals.append(WellnessGoal(
+                user=self.patient, goal_type='steps', title='Steps', date=date,
+                target_value=6000, current_value=6000 if offset % 2 else 3000,
+                is_completed=bool(offset % 2)
+            ))
+            goals.append(WellnessGoal(
+                user=self.patient, goal_type='sleep', title='Sleep', date=date,
+                target_value=8, current_value=7
+            ))
+        WellnessGoal.objects.bulk_create(goals)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_single_query_summary(self):
+        self.seed(40)
+        detailed, detailed_queries = self.get('/api/wellness/goals/weekly/')
+        summary, summary_queries = self.get('/api/wellness/goals/weekly/?detail=false')
+        self.assertEqual(detailed_queries, 1)
+        self.assertEqual(summary_queries, 1)
+
+        # 8 days (today and the 7 before it), 2 goals a day, steps met every other day
+        self.assertEqual(detailed.data['total_goals'], 16)
+        self.assertEqual(detailed.data['completed_goals'], 4)
+        self.assertEqual(detailed.data['steps_summary'], {'total': 36000.0, 'target': 48000.0})
+        self.assertEqual(len(detailed.data['goals']), 16)
+        self.assertNotIn('goals', summary.data)
+        for key in ('total_goals', 'completed_goals', 'completion_rate', 'steps_summary', 'by_goal_type'):
+            self.assertEqual(detailed.data[key], summary.data[key])
+
+    def test_range(self):
+        self.seed(40)
+        response, _ = self.get('/api/wellness/goals/weekly/?range=30&detail=false')
+        self.assertEqual(response.data['total_goals'], 62)
+        self.assertEqual(response.data['by_goal_type']['sleep']['target'], 31 * 8)
+        self.assertEqual(self.client.get('/api/wellness/goals/weekly/?range=12').status_code, 400)
+
+    @benchmark
+    def test_benchmark_year_of_history(self):
+        self.seed(365)
+        today = timezone.now().date()
+
+        def legacy():
+            # The view before single-pass aggregation: four queries over the window
+            goals = WellnessGoal.objects.filter(
+                user=self.patient, date__gte=today - timedelta(days=7), date__lte=today
+            )
+            goals.count()
+            goals.filter(is_completed=True).count()
+            goals.filter(goal_type='steps').aggregate(total=Sum('current_value'), target=Sum('target_value'))
+            WellnessGoalSerializer(goals, many=True).data
+
+        report('weekly progress (legacy, 7 days)', measure(legacy))
+        for days in (7, 365):
+            report(f'weekly progress ({days} days)', measure(
+                lambda: self.client.get(f'/api/wellness/goals/weekly/?range={days}')
+            ))
+            report(f'weekly progress ({days} days, detail=false)', measure(
+                lambda: self.client.get(f'/api/wellness/goals/weekly/?range={days}&detail=false')
+            ))
+
+
+class WellnessRollupTest(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        self.today = timezone.now().date()
+        self.goal = WellnessGoal.objects.create(
+            user=self.patient, goal_type='steps', title='Steps', date=self.today, target_value=100
+        )
+
+    def rollup(self):
+        return WellnessDailyRollup.objects.get(user=self.patient, goal_type='steps', date=self.today)
+
+    def test_rollup_follows_every_write_path(self):
+        self.assertEqual(self.rollup().target, 100)
+
+        self.client.post(f'/api/wellness/goals/{self.goal.id}/log/', {'value': 30})
+        self.client.post('/api/wellness/goals/log/batch/', {'entries': [
+            {'goal_id': self.goal.id, 'value': 20}, {'goal_id': self.goal.id, 'value': 10},
+        ]}, format='json')
+        self.client.post('/api/wellness/logs/bulk/', json.dumps([
+            {'goal_type': 'steps', 'value': 40}, {'goal_type': 'water', 'value': 2},
+        ]), content_type='application/json')
+        rollup = self.rollup()
+        self.assertEqual((rollup.total, rollup.log_count, rollup.completed), (100, 4, True))
+        self.assertTrue(WellnessDailyRollup.objects.filter(goal_type='water', total=2).exists())
+
+        self.client.patch(f'/api/wellness/goals/{self.goal.id}/', {'target_value': 200}, format='json')
+        self.assertEqual(self.rollup().target, 200)
+
+        self.client.delete(f'/api/wellness/goals/{self.goal.id}/')
+        self.assertFalse(WellnessDailyRollup.objects.filter(goal_type='steps').exists())
+
+    def test_rollup_counts_deleted_logs(self):
+        self.client.post(f'/api/wellness/goals/{self.goal.id}/log/', {'value': 30})
+        DailyGoalLog.objects.create(goal=self.goal, value=0)
+        self.assertEqual(self.rollup().log_count, 2)
+
+        DailyGoalLog.objects.filter(goal=self.goal).first().delete()
+        self.assertEqual(self.rollup().log_count, 1)
+        call_command('verify_wellness_rollups', stdout=StringIO())
+
+    def test_missing_rollup_is_created_from_the_goal(self):
+        WellnessDailyRollup.objects.all().delete()
+        self.client.post(f'/api/wellness/goals/{self.goal.id}/log/', {'value': 30})
+        rollup = self.rollup()
+        self.assertEqual((rollup.total, rollup.log_count, rollup.target), (30, 1, 100))
+
+    def test_trends(self):
+        for offset in range(1, 60):
+            WellnessGoal.objects.create(
+                user=self.patient, goal_type='steps', title='Steps',
+                date=self.today - timedelta(days=offset), target_value=100, current_value=offset
+            )
+        response = self.client.get('/api/wellness/trends/?bucket=month&type=steps')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(b['days'] for b in response.data['buckets']), 60)
+        self.assertEqual(sum(b['total'] for b in response.data['buckets']), sum(range(60)))
+
+        response = self.client.get(f'/api/wellness/trends/?start={self.today - timedelta(days=6)}&end={self.today}')
+        self.assertLessEqual(len(response.data['buckets']), 2)
+        self.assertEqual(self.client.get('/api/wellness/trends/?start=2024-02-30').status_code, 400)
+        self.assertEqual(self.client.get('/api/wellness/trends/?bucket=day').status_code, 400)
+
+    def test_verify_and_backfill(self):
+        WellnessDailyRollup.objects.all().delete()
+        WellnessGoal.objects.filter(pk=self.goal.pk).update(current_value=50)
+        with self.assertRaises(CommandError):
+            call_command('verify_wellness_rollups', stdout=StringIO())
+
+        call_command('backfill_wellness_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup().total, 50)
+        call_command('verify_wellness_rollups', stdout=StringIO())
+
+    @benchmark
+    def test_benchmark_multi_year_trends(self):
+        rollups = [
+            WellnessDailyRollup(
+                user=self.patient, goal_type=goal_type, date=self.today - timedelta(days=offset),
+                total=offset, target=100, completed=bool(offset % 2), log_count=3
+            )
+            for offset in range(1, 3 * 365) for goal_type in ('sleep', 'water', 'active_time')
+        ]
+        WellnessDailyRollup.objects.bulk_create(rollups, batch_size=1000)
+        for bucket, days in (('week', 365), ('month', 3 * 365)):
+            url = f'/api/wellness/trends/?bucket={bucket}&start={self.today - timedelta(days=days)}'
+            report(f'trends ({bucket}, {days} days)', measure(lambda: self.client.get(url)))
+
+
+class DashboardV2Test(TransactionTestCase):
+    """TransactionTestCase so the section threads see the test data"""
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        today = timezone.now().date()
+        WellnessGoal.objects.create(
+            user=self.patient, goal_type='steps', title='Steps', date=today,
+            target_value=6000, current_value=6000, is_completed=True
+        )
+        for offset in range(7):
+            PreventiveCareReminder.objects.create(
+                user=self.patient, reminder_type='checkup', title=f'Checkup {offset}',
+                scheduled_date=today + timedelta(days=offset)
+            )
+        HealthTip.objects.create(title='Walk', content='Walk daily', display_date=today)
+
+    @override_settings(DASHBOARD_PARALLEL=True)
+    def test_all_sections(self):
+        response = self.client.get('/api/wellness/dashboard/v2/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), set(dashboard.SECTIONS))
+        self.assertEqual(response.data['user'], {'first_name': 'Test', 'last_name': 'Patient'})
+        self.assertEqual(len(response.data['goals']), 1)
+        self.assertEqual(len(response.data['reminders']), 5)
+        self.assertEqual(response.data['health_tip']['title'], 'Walk')
+        self.assertEqual(response.data['weekly']['completed_goals'], 1)
+        self.assertNotIn('goals', response.data['weekly'])
+
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, list(dashboard.SECTIONS) + ['total'])
+
+    @override_settings(DASHBOARD_PARALLEL=False)
+    def test_sections_subset(self):
+        response = self.client.get('/api/wellness/dashboard/v2/?sections=health_tip,goals,goals')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'health_tip', 'goals'})
+        self.assertIn('goals;dur=', response['Server-Timing'])
+
+        self.assertEqual(self.client.get('/api/wellness/dashboard/v2/?sections=goals,bmi').status_code, 400)
+        provider = User.objects.create_user(
+            email='provider@test.com', password='pass1234', first_name='P', last_name='R', role='provider'
+        )
+        self.client.force_authenticate(provider)
+        self.assertEqual(self.client.get('/api/wellness/dashboard/v2/').status_code, 403)
+
+    def test_failed_section_does_not_fail_the_rest(self):
+        def broken(user, today):
+            raise RuntimeError('tip store unavailable')
+
+        with mock.patch.dict(dashboard.SECTIONS, {'health_tip': broken}), \
+                self.assertLogs('wellness.dashboard', 'ERROR'):
+            response = self.client.get('/api/wellness/dashboard/v2/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['health_tip'])
+        self.assertEqual(response.data['errors'], {'health_tip': 'tip store unavailable'})
+        self.assertEqual(len(response.data['reminders']), 5)
+
+    @benchmark
+    def test_benchmark_dashboard_round_trips(self):
+        urls = [
+            '/api/wellness/dashboard/', '/api/wellness/goals/today/', '/api/wellness/reminders/upcoming/',
+            '/api/wellness/health-tip/', '/api/wellness/goals/weekly/',
+        ]
+        report('dashboard (5 separate requests)', measure(lambda: [self.client.get(url) for url in urls]))
+        with override_settings(DASHBOARD_PARALLEL=False):
+            report('dashboard v2 (sequential)', measure(lambda: self.client.get('/api/wellness/dashboard/v2/')))
+        with override_settings(DASHBOARD_PARALLEL=True):
+            report('dashboard v2 (parallel)', measure(lambda: self.client.get('/api/wellness/dashboard/v2/')))
+
+
+class FakeMotorCollection:
+    """Answers find() with the given documents, as Motor's async cursor would"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.queries = []
+
+    def find(self, query, sort=None, limit=0):
+        self.queries.append((query, sort, limit))
+        return self._cursor(self.documents[:limit or None])
+
+    @staticmethod
+    async def _cursor(documents):
+        for document in documents:
+            yield document
+
+
+class AsyncReadViewTest(TransactionTestCase):
+    """The async variants (served under ASGI) return what the sync views do"""
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.token = str(token_for_user(self.patient).access_token)
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        today = timezone.now().date()
+        for goal_type in ('sleep', 'steps'):
+            WellnessGoal.objects.create(user=self.patient, goal_type=goal_type, title=goal_type, date=today)
+        for offset in range(7):
+            PreventiveCareReminder.objects.create(
+                user=self.patient, reminder_type='checkup', title=f'Checkup {offset}',
+                scheduled_date=today + timedelta(days=offset)
+            )
+        HealthTip.objects.create(title='Walk', content='Walk daily', display_date=today)
+
+    def call(self, view, method='get', token=None):
+        request = getattr(AsyncRequestFactory(), method)('/', authorization=f'Bearer {token or self.token}')
+        return async_to_sync(view)(request)
+
+    def test_same_data_as_sync_views(self):
+        for view, url in (
+            (async_views.today_goals_view, '/api/wellness/goals/today/'),
+            (async_views.upcoming_reminders_view, '/api/wellness/reminders/upcoming/'),
+            (async_views.health_tip_view, '/api/wellness/health-tip/'),
+        ):
+            response = self.call(view)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.content), self.client.get(url).json(), url)
+
+    def test_errors(self):
+        self.assertEqual(self.call(async_views.today_goals_view, token='not-a-token').status_code, 401)
+        response = async_to_sync(async_views.today_goals_view)(AsyncRequestFactory().get('/'))
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        self.assertEqual(self.call(async_views.today_goals_view, method='post').status_code, 405)
+
+    def test_motor_path(self):
+        def document(instance):
+            values = {}
+            for field in instance._meta.concrete_fields:
+                value = getattr(instance, field.attname)
+                if isinstance(value, datetime):
+                    value = timezone.make_naive(value, timezone.utc)
+                elif isinstance(value, date):
+                    value = mongo_date(value)
+                values[field.column] = value
+            return values
+
+        collections = {
+            model: FakeMotorCollection([document(instance) for instance in model.objects.order_by(*order)])
+            for model, order in ((WellnessGoal, ['goal_type']), (PreventiveCareReminder, ['scheduled_date']))
+        }
+        with mock.patch.object(async_views, 'get_async_collection', side_effect=collections.get), \
+                mock.patch.object(async_views, 'run_sync', side_effect=AssertionError('left the event loop')):
+            for view, url in (
+                (async_views.today_goals_view, '/api/wellness/goals/today/'),
+                (async_views.upcoming_reminders_view, '/api/wellness/reminders/upcoming/'),
+            ):
+                response = self.call(view)
+                self.assertEqual(json.loads(response.content), self.client.get(url).json(), url)
+        today = mongo_date(timezone.now().date())
+        self.assertEqual(collections[WellnessGoal].queries, [
+            ({'user_id': self.patient.id, 'date': today}, [('goal_type', 1)], 0),
+        ])
+        self.assertEqual(collections[PreventiveCareReminder].queries, [(
+            {'user_id': self.patient.id, 'status': 'upcoming', 'scheduled_date': {'$gte': today}},
+            [('scheduled_date', 1)], 5,
+        )])
+
+    def test_revocations_are_checked_without_blocking_the_loop(self):
+        self.assertEqual(self.call(async_views.health_tip_view).status_code, 200)
+        with mock.patch.object(authentication, 'REVOCATION_SYNC_SECONDS', 60), \
+                mock.patch.object(RevocationStore, 'is_revoked', side_effect=AssertionError('blocking check')), \
+                mock.patch.object(RevocationStore, 'sync', side_effect=AssertionError('blocking read')):
+            self.assertEqual(self.call(async_views.today_goals_view).status_code, 200)
+            get_store().revoke_token(AccessToken(self.token))
+            self.assertEqual(self.call(async_views.today_goals_view).status_code, 401)
+
+    def test_from_document(self):
+        goal = WellnessGoal.objects.get(goal_type='steps')
+        document = {
+            'id': goal.id, 'user_id': self.patient.id, 'goal_type': 'steps', 'title': 'steps',
+            'target_value': 6000.0, 'current_value': 0.0, 'unit': goal.unit, 'date': mongo_date(goal.date),
+            'is_completed': False, 'is_recurring': goal.is_recurring, 'extra_data': '{"device": "watch"}',
+            'created_at': timezone.make_naive(goal.created_at, timezone.utc),
+            'updated_at': timezone.make_naive(goal.updated_at, timezone.utc),
+        }
+        restored = from_document(WellnessGoal, document)
+        self.assertEqual((restored.pk, restored.date, restored.created_at), (goal.pk, goal.date, goal.created_at))
+        self.assertEqual(restored.extra_data, {'device': 'watch'})
+        self.assertFalse(restored._state.adding)
+
+
+class HealthTipOfDayTest(TestCase):
+
+    def setUp(self):
+        get_scheduler().invalidate()  # Tips cached by earlier tests were rolled back
+        HealthTip.objects.bulk_create([
+            HealthTip(title=f'Tip {i}', content='Content', category='sleep' if i % 3 == 0 else 'general')
+            for i in range(12)
+        ])
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+
+    def test_same_tip_everywhere_and_no_queries_once_cached(self):
+        first = self.client.get('/api/wellness/health-tip/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/wellness/health-tip/')
+        self.assertEqual(first.data, second.data)
+        self.assertNotEqual(first.data['id'], 0)
+
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get('/api/wellness/dashboard/').data['health_tip'], first.data)
+
+    def test_rotates_by_date_and_honours_schedule(self):
+        today = timezone.now().date()
+        picks = [tip_of_the_day(today + timedelta(days=offset))['id'] for offset in range(30)]
+        self.assertEqual(picks[0], tip_of_the_day(today)['id'])
+        self.assertGreater(len(set(picks)), 3)
+
+        # Saving a tip invalidates the cache
+        scheduled = HealthTip.objects.create(title='Today', content='Scheduled', display_date=today)
+        self.assertEqual(self.client.get('/api/wellness/health-tip/').data['id'], scheduled.id)
+        scheduled.is_active = False
+        scheduled.save()
+        self.assertEqual(self.client.get('/api/wellness/health-tip/').data['id'], picks[0])
+
+        HealthTip.objects.all().delete()
+        self.assertEqual(self.client.get('/api/wellness/health-tip/').data['id'], 0)
+
+    def test_category_and_per_user(self):
+        response = self.client.get('/api/wellness/health-tip/?category=sleep')
+        self.assertEqual(response.data['category'], 'sleep')
+        self.assertEqual(self.client.get('/api/wellness/health-tip/?category=bogus').status_code, 400)
+
+        today = timezone.now().date()
+        users = [User(id=user_id) for user_id in range(1, 41)]
+        self.assertEqual(len({tip_of_the_day(today, user)['id'] for user in users}), 1)
+        with override_settings(HEALTH_TIP_PER_USER=True):
+            self.assertGreater(len({tip_of_the_day(today, user)['id'] for user in users}), 3)
+            self.assertEqual(tip_of_the_day(today, users[0]), tip_of_the_day(today, users[0]))
+
+    def test_lookups_do_not_wait_for_a_load(self):
+        scheduler = TipScheduler(max_age=60)
+        loading, release = threading.Event(), threading.Event()
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return time.monotonic(), {None: []}, {}, {}
+
+        today = timezone.now().date()
+        with mock.patch.object(scheduler, '_load_index', side_effect=slow_load):
+            loader = threading.Thread(target=scheduler.tip, args=(today,))
+            loader.start()
+            self.assertTrue(loading.wait(5))
+            # The async view's lookup returns at once, and a change during the load discards it
+            self.assertIsNone(scheduler.tip(today, load=False))
+            scheduler.invalidate()
+            release.set()
+            loader.join()
+        self.assertIsNone(scheduler.tip(today, load=False))
+        self.assertEqual(scheduler.tip(today), scheduler.tip(today, load=False))
+
+    @benchmark
+    def test_benchmark_tip_of_the_day(self):
+        HealthTip.objects.bulk_create([
+            HealthTip(title=f'Tip {i}', content='Content ' * 50) for i in range(5000)
+        ])
+        today = timezone.now().date()
+
+        def legacy():
+            # The view before the scheduler: no tip scheduled today, so load them all
+            HealthTip.objects.filter(display_date=today, is_active=True).first()
+            tips = list(HealthTip.objects.filter(is_active=True))
+            HealthTipSerializer(tips[today.toordinal() % len(tips)]).data
+
+        report('tip of the day (legacy, 5000 tips)', measure(legacy))
+        get_scheduler().invalidate()
+        report('tip of the day (cold cache)', measure(lambda: (get_scheduler().invalidate(), tip_of_the_day(today))))
+        report('tip of the day (endpoint, cached)', measure(
+            lambda: self.client.get('/api/wellness/health-tip/'), repeat=200
+        ))
+
+
+class CursorPaginationTest(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def walk(self, url, page_size):
+        """Every item of a paginated list, following next_cursor"""
+        items, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get(url, {'cursor': cursor, 'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            items.extend(response.data['results'])
+            cursor = response.data['next_cursor']
+        return items
+
+    def test_goals_follow_the_model_ordering(self):
+        today = timezone.now().date()
+        WellnessGoal.objects.bulk_create([
+            WellnessGoal(user=self.patient, goal_type=goal_type, title=goal_type, date=today - timedelta(days=day))
+            for day in range(7) for goal_type in ('water', 'steps', 'sleep')
+        ])
+        unpaginated = self.client.get('/api/wellness/goals/').data
+        self.assertIsInstance(unpaginated, list)
+        self.assertEqual([goal['id'] for goal in self.walk('/api/wellness/goals/', 4)],
+                         [goal['id'] for goal in unpaginated])
+
+        response = self.client.get('/api/wellness/goals/', {'page_size': 5, 'count': 'true', 'type': 'water'})
+        self.assertEqual(response.data['count'], 7)
+        self.assertIn('cursor=', response.data['next'])
+        self.assertNotIn('count', self.client.get('/api/wellness/goals/', {'page_size': 5}).data)
+        self.assertEqual(self.client.get('/api/wellness/goals/', {'cursor': 'garbage'}).status_code, 400)
+
+    @override_settings(PAGINATION_UNPAGINATED_LIMIT=5)
+    def test_unpaginated_lists_are_capped(self):
+        today = timezone.now().date()
+        WellnessGoal.objects.bulk_create([
+            WellnessGoal(user=self.patient, goal_type='water', title=f'G{day}', date=today - timedelta(days=day))
+            for day in range(7)
+        ])
+        response = self.client.get('/api/wellness/goals/')
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('rel="next"', response['Link'])
+        following = self.client.get(response['Link'][1:response['Link'].index('>')])
+        self.assertEqual([goal['id'] for goal in response.data + following.data['results']],
+                         [goal['id'] for goal in self.walk('/api/wellness/goals/', 3)])
+
+        WellnessGoal.objects.filter(title__in=['G5', 'G6']).delete()
+        response = self.client.get('/api/wellness/goals/')
+        self.assertEqual(len(response.data), 5)
+        self.assertFalse(response.has_header('Link'))
+
+    def test_reminders_with_missing_times(self):
+        today = timezone.now().date()
+        reminders = PreventiveCareReminder.objects.bulk_create([
+            PreventiveCareReminder(
+                user=self.patient, reminder_type='checkup', title=f'R{i}', scheduled_date=today + timedelta(days=i % 3),
+                scheduled_time=None if i % 2 else f'{8 + i % 4}:00'
+            )
+            for i in range(11)
+        ])
+        self.assertEqual(len(reminders), 11)
+        unpaginated = self.client.get('/api/wellness/reminders/').data
+        for page_size in (1, 2, 5):
+            self.assertEqual([r['id'] for r in self.walk('/api/wellness/reminders/', page_size)],
+                             [r['id'] for r in unpaginated])
+
+        # Rows inserted before the cursor do not shift the next page
+        first = self.client.get('/api/wellness/reminders/', {'page_size': 3})
+        PreventiveCareReminder.objects.create(
+            user=self.patient, reminder_type='checkup', title='Earlier', scheduled_date=today - timedelta(days=1)
+        )
+        second = self.client.get('/api/wellness/reminders/', {'cursor': first.data['next_cursor'], 'page_size': 3})
+        self.assertEqual(second.data['results'][0]['id'], unpaginated[3]['id'])
+
+    @benchmark
+    def test_benchmark_deep_pages(self):
+        start = timezone.now().date()
+        WellnessGoal.objects.bulk_create([
+            WellnessGoal(user=self.patient, goal_type=goal_type, title=goal_type, date=start - timedelta(days=day))
+            for day in range(5000) for goal_type in ('steps', 'water', 'sleep', 'calories', 'active_time', 'custom')
+        ], batch_size=2000)
+        # A cursor 28,000 goals in, as a client walking the list would hold
+        cursor = ''
+        for _ in range(28):
+            cursor = self.client.get('/api/wellness/goals/', {'cursor': cursor, 'page_size': 1000}).data['next_cursor']
+
+        def offset_page():
+            # What the endpoint did with LimitOffsetPagination, minus the HTTP round trip
+            WellnessGoalSerializer(WellnessGoal.objects.filter(user=self.patient)[28000:28050], many=True).data
+
+        def cursor_page():
+            self.client.get('/api/wellness/goals/', {'cursor': cursor, 'page_size': 50})
+
+        report('goals page at 28k (offset, no HTTP)', measure(offset_page))
+        report('goals page at 28k (cursor endpoint)', measure(cursor_page))
+        report('goals first page (cursor endpoint)', measure(lambda: self.client.get('/api/wellness/goals/?page_size=50')))
+        report('all 30k goals (unpaginated endpoint)', measure(lambda: self.client.get('/api/wellness/goals/'), repeat=3))
+
+
+@override_settings(REMINDER_HORIZON_DAYS=100, REMINDER_HORIZON_OCCURRENCES=3)
+class RecurringReminderTest(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def create(self, interval, days_ahead=0):
+        response = self.client.post('/api/wellness/reminders/', {
+            'reminder_type': 'checkup', 'title': 'Checkup', 'is_recurring': True,
+            'recurrence_interval': interval, 'scheduled_date': str(self.today + timedelta(days=days_ahead)),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def schedule(self, root_id):
+        """Days from today of the upcoming reminders in a series"""
+        reminders = PreventiveCareReminder.objects.filter(status='upcoming').filter(
+            id=root_id) | PreventiveCareReminder.objects.filter(status='upcoming', recurrence_of=root_id)
+        return sorted((r.scheduled_date - self.today).days for r in reminders)
+
+    def test_occurrences_up_to_the_horizon(self):
+        root = self.create(30)
+        self.assertEqual(self.schedule(root), [0, 30, 60])
+        # Past the horizon, a series still keeps its next occurrence
+        annual = self.create(365)
+        self.assertEqual(self.schedule(annual), [0])
+        self.client.patch(f'/api/wellness/reminders/{annual}/', {'status': 'completed'})
+        self.assertEqual(self.schedule(annual), [365])
+
+        # Completing one tops the series up
+        response = self.client.patch(f'/api/wellness/reminders/{root}/', {'status': 'completed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.schedule(root), [30, 60, 90])
+
+        response = self.client.get('/api/wellness/reminders/calendar/', {'end': str(self.today + timedelta(days=90))})
+        reminders = response.data['reminders']
+        self.assertEqual(len(reminders), 5)  # Both series' first reminders, and three occurrences
+        self.assertEqual({r['recurrence_of'] for r in reminders if r['scheduled_date'] != str(self.today)}, {root})
+        self.assertEqual(self.client.get('/api/wellness/reminders/calendar/', {'start': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/wellness/reminders/calendar/', {
+            'start': str(self.today), 'end': str(self.today + timedelta(days=400))
+        }).status_code, 400)
+
+    def test_schedule_changes_restart_the_series(self):
+        root = self.create(30)
+        occurrence = PreventiveCareReminder.objects.get(recurrence_of=root, scheduled_date=self.today + timedelta(days=30))
+        self.client.patch(f'/api/wellness/reminders/{occurrence.id}/', {'recurrence_interval': 7})
+        self.assertEqual(self.schedule(root), [0, 30, 37])
+
+        # Editing the title of an occurrence leaves the others alone
+        self.client.patch(f'/api/wellness/reminders/{occurrence.id}/', {'title': 'Annual checkup'})
+        self.assertEqual(self.schedule(root), [0, 30, 37])
+
+        self.client.patch(f'/api/wellness/reminders/{occurrence.id}/', {'is_recurring': False})
+        self.assertEqual(self.schedule(root), [0, 30])
+
+    def test_deletes_end_the_series(self):
+        root = self.create(30)
+        self.assertEqual(self.client.delete(f'/api/wellness/reminders/{root}/').status_code, 204)
+        self.assertFalse(PreventiveCareReminder.objects.filter(recurrence_of=root).exists())
+        call_command('backfill_reminder_occurrences', stdout=StringIO())
+        self.assertFalse(PreventiveCareReminder.objects.filter(recurrence_of=root).exists())
+
+        # Deleting one occurrence does not bring it back; deleting the latest ends the series
+        root = self.create(30)
+        middle, latest = PreventiveCareReminder.objects.filter(recurrence_of=root).order_by('scheduled_date')
+        self.client.delete(f'/api/wellness/reminders/{middle.id}/')
+        call_command('backfill_reminder_occurrences', stdout=StringIO())
+        self.assertEqual(self.schedule(root), [0, 60, 90])
+        latest = PreventiveCareReminder.objects.filter(recurrence_of=root).latest('scheduled_date')
+        self.client.delete(f'/api/wellness/reminders/{latest.id}/')
+        call_command('backfill_reminder_occurrences', date=str(self.today + timedelta(days=200)), stdout=StringIO())
+        self.assertEqual(self.schedule(root), [0, 60])
+
+    def test_backfill_command(self):
+        other = User.objects.create_user(email='other@test.com', password='pass1234')
+        PreventiveCareReminder.objects.bulk_create([
+            # Started long ago: the occurrences that passed are skipped
+            PreventiveCareReminder(user=self.patient, reminder_type='dental', title='Dental', is_recurring=True,
+                                   recurrence_interval=180, scheduled_date=self.today - timedelta(days=400)),
+            PreventiveCareReminder(user=other, reminder_type='screening', title='Screening', is_recurring=True,
+                                   recurrence_interval=10, scheduled_date=self.today),
+            PreventiveCareReminder(user=other, reminder_type='custom', title='Once',
+                                   scheduled_date=self.today),
+        ])
+        out = StringIO()
+        call_command('backfill_reminder_occurrences', stdout=out)
+        self.assertIn('Created 3 reminder occurrences for 2 users', out.getvalue())
+        dental = PreventiveCareReminder.objects.filter(title='Dental', recurrence_of__isnull=False)
+        self.assertEqual([(r.scheduled_date - self.today).days for r in dental], [140])
+
+        out = StringIO()
+        call_command('backfill_reminder_occurrences', stdout=out)
+        self.assertIn('Created 0 reminder occurrences', out.getvalue())
+        # A later run moves the horizon forward
+        call_command('backfill_reminder_occurrences', date=str(self.today + timedelta(days=15)), stdout=out)
+        self.assertEqual(PreventiveCareReminder.objects.filter(title='Screening').count(), 5)
+
+    @benchmark
+    def test_benchmark_backfill_one_million(self):
+        User.objects.bulk_create([User(email=f'user{i}@test.com') for i in range(5000)])
+        users = list(User.objects.filter(email__startswith='user'))
+        reminders = []
+        for user in users:
+            for i in range(200):
+                recurring = i < 10
+                reminders.append(PreventiveCareReminder(
+                    user=user, reminder_type='checkup', title=f'R{i}', status='completed',
+                    scheduled_date=self.today - timedelta(days=i * 7 + 1),
+                    is_recurring=recurring, recurrence_interval=(30, 90, 365)[i % 3] if recurring else None,
+                ))
+            if len(reminders) >= 100000:
+                PreventiveCareReminder.objects.bulk_create(reminders, batch_size=5000)
+                reminders = []
+        PreventiveCareReminder.objects.bulk_create(reminders, batch_size=5000)
+
+        started = time.perf_counter()
+        call_command('backfill_reminder_occurrences', stdout=StringIO())
+        created = PreventiveCareReminder.objects.filter(recurrence_of__isnull=False).count()
+        print(f'\nbackfill over 1M reminders, 50k series: {time.perf_counter() - started:.1f}s, {created} created')
+        started = time.perf_counter()
+        call_command('backfill_reminder_occurrences', stdout=StringIO())
+        print(f'backfill again (nothing to do): {time.perf_counter() - started:.1f}s')
+
+        user = users[0]
+        end = self.today + timedelta(days=90)
+        report('calendar query, 90 days', measure(lambda: list(PreventiveCareReminder.objects.filter(
+            user=user, scheduled_date__gte=self.today, scheduled_date__lte=end))))
+        report('upcoming reminders', measure(lambda: list(dashboard.upcoming_reminders(user, self.today))))
+
+
+class ListChannel(Channel):
+    """Keeps what it was sent; fails the first `failures` batches"""
+
+    def __init__(self, failures=0, **kwargs):
+        super().__init__(retry_delay=0, **kwargs)
+        self.failures = failures
+        self.notifications = []
+
+    def send(self, notifications):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('channel down')
+        self.notifications.extend(notifications)
+
+    def titles(self):
+        return sorted(notification['title'] for notification in self.notifications)
+
+
+class ReminderNotificationTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now().replace(second=0, microsecond=0)
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        self.remind('Past due', minutes=-60)
+        self.remind('Later', minutes=60)
+        self.remind('Done', minutes=-30, status='completed')
+        self.remind('Already sent', minutes=-30, notified_at=self.now - timedelta(minutes=10))
+
+    def remind(self, title, minutes, **fields):
+        due_at = self.now + timedelta(minutes=minutes)
+        return PreventiveCareReminder.objects.create(
+            user=self.patient, reminder_type='checkup', title=title,
+            scheduled_date=due_at.date(), scheduled_time=due_at.time(), **fields
+        )
+
+    def dispatcher(self, *channels, minutes=0):
+        clock = {'now': self.now + timedelta(minutes=minutes)}
+        dispatcher = Dispatcher(
+            channels={f'channel{i}': channel for i, channel in enumerate(channels)},
+            clock=lambda: clock['now'],
+        )
+        self.addCleanup(dispatcher.close)
+        return dispatcher, clock
+
+    def test_sends_due_reminders_once(self):
+        channel = ListChannel()
+        dispatcher, clock = self.dispatcher(channel)
+        dispatcher.run_once()
+        self.assertEqual(channel.titles(), ['Past due'])
+        self.assertEqual(channel.notifications[0]['email'], 'patient@test.com')
+        self.assertEqual(len(dispatcher), 1)  # 'Later'
+        self.assertEqual(dispatcher.metrics.stats()['lag_max'], 3600)
+        self.assertEqual(PreventiveCareReminder.objects.get(title='Past due').notified_at, self.now)
+
+        dispatcher.run_once()
+        self.assertEqual(len(channel.notifications), 1)
+        # A new dispatcher does not send it again either
+        restarted, _ = self.dispatcher(channel, minutes=1)
+        restarted.run_once()
+        self.assertEqual(len(channel.notifications), 1)
+
+        clock['now'] += timedelta(minutes=60)
+        dispatcher.run_once()
+        self.assertEqual(channel.titles(), ['Later', 'Past due'])
+
+    def test_refresh_picks_up_changes(self):
+        channel = ListChannel()
+        dispatcher, clock = self.dispatcher(channel)
+        dispatcher.run_once()
+
+        self.remind('New', minutes=10)
+        later = PreventiveCareReminder.objects.get(title='Later')
+        later.status = 'completed'
+        later.save()
+        # Moving a reminder that was sent makes it due again
+        past_due = PreventiveCareReminder.objects.get(title='Past due')
+        past_due.scheduled_date = (self.now + timedelta(minutes=90)).date()
+        past_due.scheduled_time = (self.now + timedelta(minutes=90)).time()
+        past_due.save()
+
+        clock['now'] += timedelta(minutes=120)
+        dispatcher.run_once()
+        self.assertEqual(channel.titles(), ['New', 'Past due', 'Past due'])
+        self.assertEqual(dispatcher.metrics.stats()['sent'], 3)
+
+    def test_retries_and_failures(self):
+        flaky = ListChannel(failures=2)
+        dispatcher, _ = self.dispatcher(flaky)
+        with self.assertLogs('wellness.notifications', 'WARNING'):
+            dispatcher.run_once()
+        self.assertEqual(flaky.titles(), ['Past due'])
+        self.assertEqual(dispatcher.metrics.stats()['retries'], 2)
+
+        # A reminder a channel gave up on stays unsent
+        PreventiveCareReminder.objects.filter(title='Past due').update(notified_at=None)
+        down = ListChannel(failures=10, max_attempts=2)
+        dispatcher, clock = self.dispatcher(ListChannel(), down)
+        with self.assertLogs('wellness.notifications', 'WARNING') as logs:
+            dispatcher.run_once()
+        self.assertIn('Gave up sending 1 reminder notifications to channel1', logs.output[-1])
+        stats = dispatcher.metrics.stats()
+        self.assertEqual((stats['sent'], stats['failed']), (0, 1))
+        self.assertIsNone(PreventiveCareReminder.objects.get(title='Past due').notified_at)
+
+        # The dispatcher sends it again once the retry delay has passed
+        clock['now'] += dispatcher.retry_after
+        down.failures = 0
+        dispatcher.run_once()
+        self.assertEqual(down.titles(), ['Past due'])
+        self.assertEqual(PreventiveCareReminder.objects.get(title='Past due').notified_at, clock['now'])
+
+    def test_command_once(self):
+        path = Path(tempfile.mkdtemp()) / 'notifications.jsonl'
+        self.addCleanup(shutil.rmtree, path.parent)
+        channels = {'file': {'BACKEND': 'wellness.notifications.FileChannel', 'OPTIONS': {'path': str(path)}}}
+        out = StringIO()
+        with override_settings(REMINDER_NOTIFICATION_CHANNELS=channels):
+            call_command('dispatch_reminder_notifications', once=True, stdout=out)
+        self.assertIn('Sent 1 reminder notifications (0 failed, 0 retries)', out.getvalue())
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual([line['title'] for line in lines], ['Past due'])
+
+    @benchmark
+    def test_benchmark_100k_due_in_one_minute(self):
+        User.objects.bulk_create([User(email=f'user{i}@test.com') for i in range(2000)])
+        users = list(User.objects.filter(email__startswith='user'))
+        due_at = self.now - timedelta(seconds=1)
+        PreventiveCareReminder.objects.bulk_create([
+            PreventiveCareReminder(user=user, reminder_type='checkup', title=f'R{i}',
+                                   scheduled_date=due_at.date(), scheduled_time=due_at.time())
+            for user in users for i in range(50)
+        ], batch_size=5000)
+
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                received.append(len(json.loads(body)['notifications']))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        path = Path(tempfile.mkdtemp()) / 'notifications.jsonl'
+        self.addCleanup(shutil.rmtree, path.parent)
+
+        # The dispatcher loads the reminders ahead of time, and its clock
+        # reaches their due time as sending starts
+        clock = {'shift': timezone.now() - due_at + timedelta(minutes=1)}
+        dispatcher = Dispatcher(channels={
+            'file': FileChannel(str(path)),
+            'webhook': WebhookChannel(f'http://127.0.0.1:{server.server_port}/', concurrency=4),
+        }, clock=lambda: timezone.now() - clock['shift'])
+        started = time.perf_counter()
+        dispatcher.refresh()
+        loaded = time.perf_counter()
+        clock['shift'] = timezone.now() - due_at
+        dispatcher.dispatch_due()
+        dispatcher.drain()
+        dispatcher.close()
+        done = time.perf_counter()
+        stats = dispatcher.metrics.stats()
+        self.assertEqual((stats['sent'], sum(received)), (100001, 100001))
+        print(f'\n100k reminders due in one minute: load {loaded - started:.1f}s, '
+              f'send {done - loaded:.1f}s; lag p50 {stats["lag_p50"]}s, p99 {stats["lag_p99"]}s')
+
+
+class OverdueReminderSweepTest(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.patient = User.objects.create_user(
+            email='patient@test.com', password='pass1234', first_name='Test', last_name='Patient'
+        )
+        for days, status in [(-10, 'upcoming'), (-3, 'upcoming'), (-2, 'completed'),
+                             (-1, 'upcoming'), (0, 'upcoming'), (5, 'upcoming')]:
+            PreventiveCareReminder.objects.create(
+                user=self.patient, reminder_type='checkup', title=f'Day {days}',
+                scheduled_date=self.today + timedelta(days=days), status=status,
+            )
+
+    def statuses(self):
+        return {r.title: r.status for r in PreventiveCareReminder.objects.all()}
+
+    def test_sweep_marks_overdue_missed(self):
+        out = StringIO()
+        call_command('sweep_overdue_reminders', dry_run=True, stdout=out)
+        self.assertIn('Would mark 2 reminders', out.getvalue())
+        self.assertEqual(PreventiveCareReminder.objects.filter(status='missed').count(), 0)
+
+        out = StringIO()
+        call_command('sweep_overdue_reminders', batch_size=1, stdout=out)
+        self.assertIn('Marked 2 reminders', out.getvalue())
+        self.assertIn('in 2 batches', out.getvalue())
+        statuses = self.statuses()
+        self.assertEqual((statuses['Day -10'], statuses['Day -3'], statuses['Day -2'], statuses['Day -1']),
+                         ('missed', 'missed', 'completed', 'upcoming'))
+
+        # Yesterday's reminder is missed once its grace day has passed
+        out = StringIO()
+        call_command('sweep_overdue_reminders', date=str(self.today + timedelta(days=1)), stdout=out)
+        self.assertIn('Marked 1 reminders', out.getvalue())
+        self.assertEqual(self.statuses()['Day 0'], 'upcoming')
+
+    def test_extends_recurring_series(self):
+        # A series nothing has extended yet
+        PreventiveCareReminder.objects.bulk_create([PreventiveCareReminder(
+            user=self.patient, reminder_type='dental', title='Dental', is_recurring=True,
+            recurrence_interval=30, scheduled_date=self.today - timedelta(days=40),
+        )])
+        root = PreventiveCareReminder.objects.get(title='Dental')
+        out = StringIO()
+        call_command('sweep_overdue_reminders', extend_recurrences=True, stdout=out)
+        self.assertIn('Marked 3 reminders', out.getvalue())
+        upcoming = PreventiveCareReminder.objects.filter(recurrence_of=root.id, status='upcoming')
+        self.assertEqual([(r.scheduled_date - self.today).days for r in upcoming[:3]], [20, 50, 80])
+
+    def test_one_node_at_a_time(self):
+        held = Lease('sweep_overdue_reminders', owner='other-node')
+        self.assertTrue(held.acquire())
+        out = StringIO()
+        call_command('sweep_overdue_reminders', stdout=out)
+        self.assertIn('Another node is sweeping', out.getvalue())
+        self.assertEqual(self.statuses()['Day -10'], 'upcoming')
+
+        # A node whose lease was taken over stops
+        mine = Lease('sweep_overdue_reminders', owner='this-node')
+        JobLease.objects.update(expires_at=timezone.now())
+        self.assertTrue(mine.acquire())
+        with self.assertRaises(LeaseLost):
+            held.renew()
+        mine.release()
+        call_command('sweep_overdue_reminders', stdout=out)
+        self.assertEqual(self.statuses()['Day -10'], 'missed')
+
+    @benchmark
+    def test_benchmark_sweep_one_million(self):
+        User.objects.bulk_create([User(email=f'user{i}@test.com') for i in range(5000)])
+        users = list(User.objects.filter(email__startswith='user'))
+        reminders = []
+        for user in users:
+            for i in range(200):
+                reminders.append(PreventiveCareReminder(
+                    user=user, reminder_type='checkup', title=f'R{i}',
+                    scheduled_date=self.today + timedelta(days=(user.id * 7 + i * 13) % 400 - 300),
+                    status='completed' if i % 4 == 0 else 'upcoming',
+                ))
+            if len(reminders) >= 100000:
+                PreventiveCareReminder.objects.bulk_create(reminders, batch_size=5000)
+                reminders = []
+        PreventiveCareReminder.objects.bulk_create(reminders, batch_size=5000)
+
+        lease = Lease('benchmark')
+        lease.acquire()
+        for batch_size in (1000, 10000):
+            PreventiveCareReminder.objects.filter(status='missed').update(status='upcoming')
+            started = time.perf_counter()
+            counts = sweep_overdue(overdue_cutoff(), batch_size=batch_size, lease=lease)
+            print(f'\nsweep over 1M reminders, batches of {batch_size}: {counts["missed"]} missed '
+                  f'in {counts["batches"]} updates, {time.perf_counter() - started:.1f}s')
+        started = time.perf_counter()
+        sweep_overdue(overdue_cutoff())
+        print(f'sweep again (nothing to do): {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,127 @@
+"""
+Health tip of the day.
+
+The tip endpoint used to load every active tip to pick one at random, and the
+dashboard showed a different one. TipScheduler picks the day's tip
+deterministically: the tip scheduled for the date (display_date) if there is
+one, otherwise the tip at position hash(date) in the id-ordered list of active
+tips - of one category if asked, and per user with HEALTH_TIP_PER_USER. The
+id lists and the serialized tips are kept in this process, so once warm a
+request makes no query. They are dropped when a HealthTip is saved or deleted
+(wellness.signals) and reloaded after HEALTH_TIP_CACHE_SECONDS, which bounds
+how long other processes show a changed tip. Loading happens outside the
+scheduler's lock and the result is swapped in, so a lookup with load=False (as
+the async view makes on the event loop) never waits for a query.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+
+from .models import HealthTip
+from .serializers import HealthTipSerializer
+
+DEFAULT_TIP = {
+    'id': 0,
+    'title': 'Stay Hydrated',
+    'content': 'Aim to drink at least 8 glasses of water per day to keep your body hydrated and functioning optimally.',
+    'category': 'hydration'
+}
+
+
+def _position(date, user_id, count):
+    key = f'{date.isoformat()}:{user_id or ""}'.encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big') % count
+
+
+class TipScheduler:
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._index = None
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._index = None
+
+    def _load_index(self):
+        """
+        (loaded_at, {category or None: [ids]}, {(date, category or None): id},
+        {id: serialized tip}) of the active tips, the last filled in as used
+        """
+        ids = {None: []}
+        scheduled = {}
+        for tip_id, category, display_date in HealthTip.objects.filter(is_active=True).order_by('id').values_list(
+            'id', 'category', 'display_date'
+        ):
+            ids[None].append(tip_id)
+            ids.setdefault(category, []).append(tip_id)
+            if display_date is not None:
+                # The newest tip wins when several are scheduled for a day
+                scheduled[(display_date, None)] = scheduled[(display_date, category)] = tip_id
+        return time.monotonic(), ids, scheduled, {}
+
+    def _current_index(self, load):
+        index = self._index
+        if index is None or time.monotonic() - index[0] > self.max_age:
+            if not load:
+                return None
+            generation = self._generation
+            index = self._load_index()
+            with self._lock:
+                # Unless a tip changed while it loaded
+                if self._generation == generation:
+                    self._index = index
+        return index
+
+    def tip(self, date, category=None, user_id=None, load=True):
+        """
+        The serialized tip for `date`, or DEFAULT_TIP when there are no active
+        tips. With load=False, None instead of querying on a cold cache.
+        """
+        index = self._current_index(load)
+        if index is None:
+            return None
+        _, ids, scheduled, tips = index
+
+        tip_id = scheduled.get((date, category))
+        if tip_id is None:
+            # Unknown or empty categories fall back to all tips
+            candidates = ids.get(category) or ids[None]
+            if not candidates:
+                return DEFAULT_TIP
+            tip_id = candidates[_position(date, user_id, len(candidates))]
+
+        data = tips.get(tip_id)
+        if data is None:
+            if not load:
+                return None
+            tip = HealthTip.objects.filter(pk=tip_id).first()
+            if tip is None:
+                return DEFAULT_TIP
+            data = tips[tip_id] = dict(HealthTipSerializer(tip).data)
+        return data
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TipScheduler(settings.HEALTH_TIP_CACHE_SECONDS)
+        return _scheduler
+
+
+def tip_of_the_day(date, user=None, category=None, load=True):
+    """The day's tip for `user` (used only with HEALTH_TIP_PER_USER); see TipScheduler.tip"""
+    user_id = None
+    if getattr(settings, 'HEALTH_TIP_PER_USER', False) and user is not None and user.is_authenticated:
+        user_id = user.id
+    return get_scheduler().tip(date, category, user_id, load=load)
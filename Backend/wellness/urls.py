@@ -1,27 +1,40 @@
 from django.urls import path
+
+from core.async_views import read_route
+from . import async_views
 from .views import (
-    WellnessGoalListCreateView, WellnessGoalDetailView, LogGoalProgressView,
+    WellnessGoalListCreateView, WellnessGoalDetailView, LogGoalProgressView, LogGoalProgressBatchView,
     TodayGoalsView, WeeklyProgressView, PreventiveCareReminderListCreateView,
-    PreventiveCareReminderDetailView, UpcomingRemindersView, HealthTipOfDayView,
-    DashboardSummaryView
+    PreventiveCareReminderDetailView, ReminderCalendarView, UpcomingRemindersView, HealthTipOfDayView,
+    DashboardSummaryView, DashboardV2View, BulkGoalLogView, TrendsView
 )
 
 urlpatterns = [
     # Goals - specific paths MUST come before generic pk patterns
-    path('goals/today/', TodayGoalsView.as_view(), name='today_goals'),
+    read_route('goals/today/', TodayGoalsView.as_view(), async_views.today_goals_view, name='today_goals'),
     path('goals/weekly/', WeeklyProgressView.as_view(), name='weekly_progress'),
+    path('goals/log/batch/', LogGoalProgressBatchView.as_view(), name='log_goal_progress_batch'),
     path('goals/', WellnessGoalListCreateView.as_view(), name='goals_list'),
     path('goals/<pk>/', WellnessGoalDetailView.as_view(), name='goal_detail'),
     path('goals/<goal_id>/log/', LogGoalProgressView.as_view(), name='log_goal_progress'),
     
+    # Long-range trends
+    path('trends/', TrendsView.as_view(), name='trends'),
+    
+    # Device sync
+    path('logs/bulk/', BulkGoalLogView.as_view(), name='bulk_goal_logs'),
+    
     # Reminders - specific paths before generic patterns
-    path('reminders/upcoming/', UpcomingRemindersView.as_view(), name='upcoming_reminders'),
+    read_route('reminders/upcoming/', UpcomingRemindersView.as_view(), async_views.upcoming_reminders_view,
+               name='upcoming_reminders'),
+    path('reminders/calendar/', ReminderCalendarView.as_view(), name='reminder_calendar'),
     path('reminders/', PreventiveCareReminderListCreateView.as_view(), name='reminders_list'),
     path('reminders/<pk>/', PreventiveCareReminderDetailView.as_view(), name='reminder_detail'),
     
     # Health Tips
-    path('health-tip/', HealthTipOfDayView.as_view(), name='health_tip'),
+    read_route('health-tip/', HealthTipOfDayView.as_view(), async_views.health_tip_view, name='health_tip'),
     
     # Dashboard
     path('dashboard/', DashboardSummaryView.as_view(), name='dashboard'),
+    path('dashboard/v2/', DashboardV2View.as_view(), name='dashboard_v2'),
 ]
@@ -1,21 +1,31 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import connection, transaction
 from django.utils import timezone
-from django.db.models import Sum
+from django.utils.dateparse import parse_date
+from contextlib import nullcontext
 from datetime import timedelta
-import random
+import time
 import traceback
 
+from core.pagination import KeysetPagination
 from .models import WellnessGoal, DailyGoalLog, PreventiveCareReminder, HealthTip
+from .ingest import ReadingIngestor, iter_json_array, iter_ndjson, MAX_READINGS_PER_REQUEST
+from .progress import log_progress, apply_increments
+from .stats import progress_summary, rollup_trends
+from .dashboard import SECTIONS, today_goals, upcoming_reminders, build_dashboard, server_timing
+from .tips import DEFAULT_TIP, tip_of_the_day
 from .serializers import (
     WellnessGoalSerializer, WellnessGoalCreateSerializer, WellnessGoalUpdateSerializer,
-    LogGoalProgressSerializer, PreventiveCareReminderSerializer, HealthTipSerializer
+    LogGoalProgressSerializer, LogGoalProgressBatchSerializer,
+    PreventiveCareReminderSerializer
 )
 
 
 class WellnessGoalListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -109,89 +119,123 @@ class LogGoalProgressView(APIView):
     
     def post(self, request, goal_id):
         try:
-            goal = WellnessGoal.objects.get(id=goal_id, user=request.user)
-        except WellnessGoal.DoesNotExist:
+            goal_id = int(goal_id)
+        except (TypeError, ValueError):
             return Response({'error': 'Goal not found'}, status=status.HTTP_404_NOT_FOUND)
         
         serializer = LogGoalProgressSerializer(data=request.data)
-        if serializer.is_valid():
-            value = serializer.validated_data['value']
-            notes = serializer.validated_data.get('notes', '')
-            
-            # Create log entry
-            DailyGoalLog.objects.create(goal=goal, value=value, notes=notes)
-            
-            # Update goal current value - convert to float for MongoDB Decimal128 compatibility
-            current = float(goal.current_value) if goal.current_value else 0
-            goal.current_value = current + float(value)
-            goal.save()
-            
-            return Response(WellnessGoalSerializer(goal).data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        value = serializer.validated_data['value']
+        notes = serializer.validated_data.get('notes', '')
+        
+        # Atomic in-database increment - concurrent logs can't lose updates.
+        # Where the database has transactions (not MongoDB) the log is written
+        # in the same one, so a failed insert leaves the goal as it was
+        with transaction.atomic() if connection.features.supports_transactions else nullcontext():
+            if not log_progress(goal_id, request.user, value, notes):
+                return Response({'error': 'Goal not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        goal = WellnessGoal.objects.get(id=goal_id)
+        return Response(WellnessGoalSerializer(goal).data)
+
+
+class LogGoalProgressBatchView(APIView):
+    """Log many progress entries, possibly for different goals, in one request"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        serializer = LogGoalProgressBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        entries = serializer.validated_data['entries']
+        goal_ids = {entry['goal_id'] for entry in entries}
+        owned = set(
+            WellnessGoal.objects.filter(user=request.user, id__in=goal_ids)
+            .values_list('id', flat=True)
+        )
+        
+        logs = []
+        totals = {}
+        counts = {}
+        rejected = []
+        now = timezone.now()
+        for index, entry in enumerate(entries):
+            goal_id = entry['goal_id']
+            if goal_id not in owned:
+                rejected.append({'index': index, 'goal_id': goal_id, 'error': 'Goal not found'})
+                continue
+            logs.append(DailyGoalLog(
+                goal_id=goal_id,
+                value=entry['value'],
+                notes=entry.get('notes', ''),
+                logged_at=entry.get('logged_at') or now,
+            ))
+            totals[goal_id] = totals.get(goal_id, 0.0) + entry['value']
+            counts[goal_id] = counts.get(goal_id, 0) + 1
+        
+        if logs:
+            # As for a single log, a failed increment leaves no uncounted logs
+            with transaction.atomic() if connection.features.supports_transactions else nullcontext():
+                DailyGoalLog.objects.bulk_create(logs)
+                apply_increments(totals, counts)
+        
+        goals = WellnessGoal.objects.filter(id__in=list(totals))
+        return Response({
+            'accepted': len(logs),
+            'rejected': rejected,
+            'goals': WellnessGoalSerializer(goals, many=True).data,
+        })
+
+
+class BulkGoalLogView(APIView):
+    """Bulk ingestion of wearable readings sent as a JSON array or NDJSON body"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        # Read the body as a stream instead of request.data so memory stays bounded
+        if request.stream is None:
+            return Response({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if 'ndjson' in request.content_type or 'jsonl' in request.content_type:
+            readings = iter_ndjson(request.stream)
+        else:
+            readings = iter_json_array(request.stream)
+        
+        ingestor = ReadingIngestor(request.user)
+        error = None
+        try:
+            for reading in readings:
+                if ingestor.received >= MAX_READINGS_PER_REQUEST:
+                    error = (f'At most {MAX_READINGS_PER_REQUEST} readings per request',
+                             status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                    break
+                ingestor.add(reading)
+        except ValueError as e:
+            error = (str(e), status.HTTP_400_BAD_REQUEST)
+        ingestor.flush()
+        
+        if error is None:
+            return Response(ingestor.summary())
+        message, error_status = error
+        # Readings before the error are stored. Only fail the request when none
+        # were, since clients resend a failed request and would count them twice
+        if ingestor.accepted:
+            error_status = status.HTTP_207_MULTI_STATUS
+        return Response({'error': message, **ingestor.summary()}, status=error_status)
 
 
 class TodayGoalsView(APIView):
     """Get today's wellness goals summary for dashboard"""
     permission_classes = [permissions.IsAuthenticated]
+    trust_token_claims = True  # Reads only request.user's id, role and name
     
     def get(self, request):
         try:
             today = timezone.now().date()
-            goals = WellnessGoal.objects.filter(user=request.user, date=today)
-            
-            # If no goals for today, check for recurring goals and create them
-            if not goals.exists():
-                # First, check for recurring goals from previous days
-                recurring_goals = WellnessGoal.objects.filter(
-                    user=request.user,
-                    is_recurring=True
-                ).exclude(date=today).order_by('-date')
-                
-                # Get unique goal types from recurring goals (most recent for each type)
-                seen_types = set()
-                for goal in recurring_goals:
-                    if goal.goal_type not in seen_types:
-                        seen_types.add(goal.goal_type)
-                        try:
-                            WellnessGoal.objects.get_or_create(
-                                user=request.user,
-                                goal_type=goal.goal_type,
-                                date=today,
-                                defaults={
-                                    'title': goal.title,
-                                    'target_value': float(goal.target_value),
-                                    'current_value': 0.0,
-                                    'unit': goal.unit,
-                                    'is_recurring': True,
-                                }
-                            )
-                        except Exception as e:
-                            print(f"Error creating recurring goal: {e}")
-                            continue
-                
-                # If still no goals, create default goals
-                goals = WellnessGoal.objects.filter(user=request.user, date=today)
-                if not goals.exists():
-                    default_goal_types = ['steps', 'active_time', 'sleep']
-                    for goal_type in default_goal_types:
-                        try:
-                            defaults = WellnessGoal.DEFAULT_GOALS.get(goal_type, {})
-                            WellnessGoal.objects.get_or_create(
-                                user=request.user,
-                                goal_type=goal_type,
-                                date=today,
-                                defaults={
-                                    'title': defaults.get('title', goal_type.replace('_', ' ').title()),
-                                    'target_value': float(defaults.get('target_value', 0)),
-                                    'current_value': 0.0,
-                                    'unit': defaults.get('unit', ''),
-                                    'is_recurring': True,  # Default goals are recurring
-                                }
-                            )
-                        except Exception as e:
-                            print(f"Error creating default goal: {e}")
-                            continue
-                    goals = WellnessGoal.objects.filter(user=request.user, date=today)
+            goals = today_goals(request.user, today)
             
             serializer = WellnessGoalSerializer(goals, many=True)
             return Response(serializer.data)
@@ -203,44 +247,78 @@ class TodayGoalsView(APIView):
 
 
 class WeeklyProgressView(APIView):
-    """Get weekly progress summary"""
+    """Get progress summary for the last 7 (or ?range=30/90/365) days"""
     permission_classes = [permissions.IsAuthenticated]
+    trust_token_claims = True  # Reads only request.user's id, role and name
+    
+    ALLOWED_RANGES = (7, 30, 90, 365)
     
     def get(self, request):
         try:
-            today = timezone.now().date()
-            week_ago = today - timedelta(days=7)
-            
-            goals = WellnessGoal.objects.filter(
-                user=request.user,
-                date__gte=week_ago,
-                date__lte=today
+            days = int(request.query_params.get('range', 7))
+        except ValueError:
+            days = None
+        if days not in self.ALLOWED_RANGES:
+            return Response(
+                {'error': f'range must be one of {list(self.ALLOWED_RANGES)}'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            # Calculate weekly stats
-            total_goals = goals.count()
-            completed_goals = goals.filter(is_completed=True).count()
-            
-            # Steps summary
-            steps_data = goals.filter(goal_type='steps').aggregate(
-                total=Sum('current_value'),
-                target=Sum('target_value')
-            )
-            
-            return Response({
-                'total_goals': total_goals,
-                'completed_goals': completed_goals,
-                'completion_rate': round((completed_goals / total_goals * 100) if total_goals > 0 else 0, 1),
-                'steps_summary': steps_data,
-                'goals': WellnessGoalSerializer(goals, many=True).data
-            })
+        detail = request.query_params.get('detail', 'true').lower() != 'false'
+        
+        try:
+            data = progress_summary(request.user, timezone.now().date(), days, detail=detail)
+            if detail:
+                data['goals'] = WellnessGoalSerializer(data['goals'], many=True).data
+            return Response(data)
         except Exception as e:
             print(f"WeeklyProgressView error: {e}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class TrendsView(APIView):
+    """Weekly or monthly goal trends served from the daily rollup table"""
+    permission_classes = [permissions.IsAuthenticated]
+    trust_token_claims = True  # Reads only request.user's id, role and name
+    
+    DEFAULT_DAYS = {'week': 12 * 7, 'month': 365}
+    MAX_DAYS = 5 * 366
+    
+    def get(self, request):
+        bucket = request.query_params.get('bucket', 'week')
+        if bucket not in self.DEFAULT_DAYS:
+            return Response({'error': 'bucket must be "week" or "month"'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            end = timezone.now().date()
+            if request.query_params.get('end'):
+                end = parse_date(request.query_params['end'])
+            start = end - timedelta(days=self.DEFAULT_DAYS[bucket]) if end else None
+            if request.query_params.get('start'):
+                start = parse_date(request.query_params['start'])
+        except ValueError:
+            start = end = None
+        if not start or not end:
+            return Response({'error': 'start and end must be YYYY-MM-DD dates'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end or (end - start).days > self.MAX_DAYS:
+            return Response(
+                {'error': f'start must be before end and at most {self.MAX_DAYS} days apart'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'bucket': bucket,
+            'start_date': start,
+            'end_date': end,
+            'buckets': rollup_trends(
+                request.user, start, end, bucket,
+                goal_type=request.query_params.get('type')
+            ),
+        })
+
+
 class PreventiveCareReminderListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     serializer_class = PreventiveCareReminderSerializer
     
     def get_queryset(self):
@@ -262,18 +340,47 @@ class PreventiveCareReminderDetailView(generics.RetrieveUpdateDestroyAPIView):
         return PreventiveCareReminder.objects.filter(user=self.request.user)
 
 
+class ReminderCalendarView(APIView):
+    """Reminders between ?start= and ?end= (default the next 30 days), recurring occurrences included"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    MAX_DAYS = 366
+    
+    def get(self, request):
+        try:
+            start = timezone.now().date()
+            if request.query_params.get('start'):
+                start = parse_date(request.query_params['start'])
+            end = start + timedelta(days=30) if start else None
+            if request.query_params.get('end'):
+                end = parse_date(request.query_params['end'])
+        except ValueError:
+            start = end = None
+        if not start or not end or start > end or (end - start).days > self.MAX_DAYS:
+            return Response(
+                {'error': f'start and end must be YYYY-MM-DD dates at most {self.MAX_DAYS} days apart'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        reminders = PreventiveCareReminder.objects.filter(
+            user=request.user, scheduled_date__gte=start, scheduled_date__lte=end
+        )
+        return Response({
+            'start_date': start,
+            'end_date': end,
+            'reminders': PreventiveCareReminderSerializer(reminders, many=True).data,
+        })
+
+
 class UpcomingRemindersView(APIView):
     """Get upcoming preventive care reminders for dashboard"""
     permission_classes = [permissions.IsAuthenticated]
+    trust_token_claims = True  # Reads only request.user's id, role and name
     
     def get(self, request):
         try:
             today = timezone.now().date()
-            reminders = PreventiveCareReminder.objects.filter(
-                user=request.user,
-                status='upcoming',
-                scheduled_date__gte=today
-            ).order_by('scheduled_date')[:5]
+            reminders = upcoming_reminders(request.user, today)
             
             serializer = PreventiveCareReminderSerializer(reminders, many=True)
             return Response(serializer.data)
@@ -283,47 +390,25 @@ class UpcomingRemindersView(APIView):
 
 
 class HealthTipOfDayView(APIView):
-    """Get health tip of the day"""
+    """Get health tip of the day (?category= to pick from one category)"""
     permission_classes = [permissions.AllowAny]
     
     def get(self, request):
+        category = request.query_params.get('category')
+        if category and category not in dict(HealthTip.CATEGORY_CHOICES):
+            return Response({'error': 'Unknown category'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            today = timezone.now().date()
-            
-            # Try to get tip for today
-            tip = HealthTip.objects.filter(display_date=today, is_active=True).first()
-            
-            # If no specific tip for today, get a random active tip
-            if not tip:
-                tips = list(HealthTip.objects.filter(is_active=True))
-                if tips:
-                    tip = random.choice(tips)
-            
-            if tip:
-                serializer = HealthTipSerializer(tip)
-                return Response(serializer.data)
-            
-            # Return a default tip if none exist in database
-            return Response({
-                'id': 0,
-                'title': 'Stay Hydrated',
-                'content': 'Aim to drink at least 8 glasses of water per day to keep your body hydrated and functioning optimally.',
-                'category': 'hydration'
-            })
+            return Response(tip_of_the_day(timezone.now().date(), request.user, category))
         except Exception as e:
             print(f"HealthTipOfDayView error: {e}")
             # Return default tip on error
-            return Response({
-                'id': 0,
-                'title': 'Stay Hydrated',
-                'content': 'Aim to drink at least 8 glasses of water per day to keep your body hydrated and functioning optimally.',
-                'category': 'hydration'
-            })
+            return Response(DEFAULT_TIP)
 
 
 class DashboardSummaryView(APIView):
     """Get complete dashboard summary for patients"""
     permission_classes = [permissions.IsAuthenticated]
+    trust_token_claims = True  # Reads only request.user's id, role and name
     
     def get(self, request):
         try:
@@ -345,13 +430,8 @@ class DashboardSummaryView(APIView):
                 scheduled_date__gte=today
             ).order_by('scheduled_date')[:3]
             
-            # Get health tip
-            tip = HealthTip.objects.filter(is_active=True).first()
-            tip_data = HealthTipSerializer(tip).data if tip else {
-                'title': 'Stay Hydrated',
-                'content': 'Aim to drink at least 8 glasses of water per day.',
-                'category': 'hydration'
-            }
+            # Same tip as the tip of the day endpoint
+            tip_data = tip_of_the_day(today, request.user)
             
             return Response({
                 'user': {
@@ -365,3 +445,41 @@ class DashboardSummaryView(APIView):
         except Exception as e:
             print(f"DashboardSummaryView error: {e}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class DashboardV2View(APIView):
+    """
+    Everything the patient dashboard shows in one response: ?sections= picks
+    a comma-separated subset of user, goals, reminders, health_tip, weekly
+    (default all). Sections are fetched concurrently; per-section timings are
+    in the Server-Timing header and failed sections come back as null with
+    the reason under 'errors'.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    trust_token_claims = True  # Reads only request.user's id, role and name
+    
+    def get(self, request):
+        started = time.perf_counter()
+        if request.user.role != 'patient':
+            return Response(
+                {'error': 'This endpoint is only for patients'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        sections = list(SECTIONS)
+        if request.query_params.get('sections'):
+            sections = [name.strip() for name in request.query_params['sections'].split(',') if name.strip()]
+            unknown = [name for name in sections if name not in SECTIONS]
+            if unknown or not sections:
+                return Response(
+                    {'error': f'sections must be a comma-separated subset of {list(SECTIONS)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            sections = list(dict.fromkeys(sections))
+        
+        data, timings, errors = build_dashboard(request.user, timezone.now().date(), sections)
+        if errors:
+            data['errors'] = errors
+        response = Response(data)
+        response['Server-Timing'] = server_timing(timings, (time.perf_counter() - started) * 1000)
+        return response
@@ -52,6 +52,21 @@ api.interceptors.response.use(
   }
 );
 
+// Every item of a cursor-paginated list, fetched page by page. Resolves to
+// { data: items } like a plain request, so callers need not change
+const LIST_PAGE_SIZE = 200;
+
+export const fetchAll = async (url, params = {}) => {
+  const items = [];
+  let cursor = '';
+  while (cursor !== null) {
+    const response = await api.get(url, { params: { ...params, cursor, page_size: LIST_PAGE_SIZE } });
+    items.push(...response.data.results);
+    cursor = response.data.next_cursor;
+  }
+  return { data: items };
+};
+
 // Auth API
 export const authAPI = {
   login: (credentials) => api.post('/auth/login/', credentials),
@@ -66,13 +81,13 @@ export const authAPI = {
 export const wellnessAPI = {
   getDashboard: () => api.get('/wellness/dashboard/'),
   getTodayGoals: () => api.get('/wellness/goals/today/'),
-  getGoals: (params) => api.get('/wellness/goals/', { params }),
+  getGoals: (params) => fetchAll('/wellness/goals/', params),
   createGoal: (data) => api.post('/wellness/goals/', data),
   updateGoal: (id, data) => api.patch(`/wellness/goals/${id}/`, data),
   deleteGoal: (id) => api.delete(`/wellness/goals/${id}/`),
   logProgress: (goalId, data) => api.post(`/wellness/goals/${goalId}/log/`, data),
   getWeeklyProgress: () => api.get('/wellness/goals/weekly/'),
-  getReminders: () => api.get('/wellness/reminders/'),
+  getReminders: () => fetchAll('/wellness/reminders/'),
   getUpcomingReminders: () => api.get('/wellness/reminders/upcoming/'),
   createReminder: (data) => api.post('/wellness/reminders/', data),
   updateReminder: (id, data) => api.patch(`/wellness/reminders/${id}/`, data),
@@ -82,17 +97,17 @@ export const wellnessAPI = {
 
 // Health Info API (public)
 export const healthAPI = {
-  getArticles: (params) => api.get('/health/articles/', { params }),
+  getArticles: (params) => fetchAll('/health/articles/', params),
   getLatestArticles: () => api.get('/health/articles/latest/'),
   getArticle: (slug) => api.get(`/health/articles/${slug}/`),
   getPrivacyPolicy: () => api.get('/health/privacy-policy/'),
-  getFAQs: () => api.get('/health/faqs/'),
+  getFAQs: () => fetchAll('/health/faqs/'),
   getPublicInfo: () => api.get('/health/public/'),
 };
 
 // Provider API
 export const providerAPI = {
-  getPatients: () => api.get('/auth/provider/patients/'),
+  getPatients: () => fetchAll('/auth/provider/patients/'),
   getPatientDetail: (id) => api.get(`/auth/provider/patients/${id}/`),
 };
 